@@ -0,0 +1,65 @@
+"""End to end events per second of the example plans, with their `sleep`s skipped."""
+
+import bluesky.preprocessors as bpp
+import pytest
+
+from rpi_bluesky.ophyd import RpiSignal
+from rpi_bluesky.ophyd.adafruit import AS7341Detector
+from rpi_bluesky.ophyd.devices import LED, RGB_LED
+from rpi_bluesky.plan_stubs import acquire_pages
+from rpi_bluesky.scripts.blink import blink
+from rpi_bluesky.scripts.dimmer import dimmer_scan
+from rpi_bluesky.scripts.random_color_walk import random_walk
+from rpi_bluesky.scripts.readback import read_and_pause
+
+
+@pytest.fixture(scope="module")
+def det():
+    det = AS7341Detector(name="det")
+    det.wait_for_connection()
+    return det
+
+
+def run_plan(benchmark, RE, count_events, plan_factory, rounds=3):
+    runs = []
+
+    def run():
+        runs.append(RE(plan_factory(), count_events))
+
+    benchmark.pedantic(run, rounds=rounds, iterations=1)
+    events = count_events.events / len(runs)
+    benchmark.extra_info["events"] = events
+    # No timings are kept when run with --benchmark-disable
+    if benchmark.stats is not None:
+        benchmark.extra_info["events_per_second"] = events / benchmark.stats.stats.mean
+
+
+@pytest.mark.benchmark(group="plans")
+def bench_blink(benchmark, RE, count_events):
+    led = RpiSignal(5, name="blink_led", cached_readback=True)
+    run_plan(benchmark, RE, count_events, lambda: blink(led))
+
+
+@pytest.mark.benchmark(group="plans")
+def bench_dimmer_scan(benchmark, RE, count_events):
+    led = LED(6, name="dimmer_led")
+    led.pwm._settle_time = 1e-4
+    run_plan(benchmark, RE, count_events, lambda: dimmer_scan(led))
+
+
+@pytest.mark.benchmark(group="plans")
+def bench_random_walk(benchmark, RE, count_events, det):
+    led = RGB_LED(name="rgb_led")
+    for channel in led.channels:
+        channel.pwm._settle_time = 1e-4
+    run_plan(benchmark, RE, count_events, lambda: random_walk(led, [det], timeout=1.0))
+
+
+@pytest.mark.benchmark(group="plans")
+def bench_read_and_pause(benchmark, RE, count_events, det):
+    run_plan(benchmark, RE, count_events, lambda: read_and_pause([det], pause=0.0, timeout=1.0))
+
+
+@pytest.mark.benchmark(group="plans")
+def bench_acquire_pages(benchmark, RE, count_events, det):
+    run_plan(benchmark, RE, count_events, lambda: bpp.run_wrapper(acquire_pages(det, 256, pages=4)))
@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+
+from rpi_bluesky.callbacks import LiveBars
+from rpi_bluesky.ophyd import RpiPWM, RpiSignal
+from rpi_bluesky.ophyd.adafruit import AS7341Detector
+from rpi_bluesky.ophyd.devices import LEDArray
+
+
+@pytest.fixture(scope="module")
+def led():
+    return RpiSignal(17, name="led")
+
+
+@pytest.fixture(scope="module")
+def pwm():
+    RpiSignal(18, name="pwm_io")
+    return RpiPWM(18, name="pwm", frequency=1000.0)
+
+
+@pytest.mark.benchmark(group="signal")
+def bench_rpi_signal_put(benchmark, led):
+    benchmark(led.put, 1)
+
+
+@pytest.mark.benchmark(group="signal")
+def bench_rpi_signal_get(benchmark, led):
+    benchmark(led.get)
+
+
+@pytest.mark.benchmark(group="signal")
+def bench_rpi_signal_get_cached(benchmark):
+    sig = RpiSignal(27, name="cached", cached_readback=True)
+    benchmark(sig.get)
+
+
+@pytest.mark.benchmark(group="pwm")
+def bench_rpi_pwm_put(benchmark, pwm):
+    benchmark(pwm.put, 50.0)
+
+
+@pytest.mark.benchmark(group="pwm")
+def bench_rpi_pwm_set_and_settle(benchmark, pwm):
+    # The default settle time is one PWM period, 1 ms here
+    benchmark(lambda: pwm.set(50.0).wait(1))
+
+
+@pytest.mark.benchmark(group="pwm")
+def bench_led_array_set(benchmark):
+    leds = LEDArray(range(2, 26), name="leds", settle_time=1e-6)
+    values = np.random.default_rng(0).uniform(0, 100, (64, 24))
+    steps = iter(np.tile(values, (10000, 1)))
+    benchmark(lambda: leds.set(next(steps)))
+
+
+@pytest.mark.benchmark(group="detector")
+def bench_as7341_trigger_and_read(benchmark):
+    det = AS7341Detector(name="det")
+    det.wait_for_connection()
+
+    def trigger_and_read():
+        det.trigger().wait(1)
+        return det.read()
+
+    benchmark(trigger_and_read)
+
+
+@pytest.mark.benchmark(group="callbacks")
+@pytest.mark.parametrize("max_fps", [10.0, float("inf")], ids=["throttled", "every_event"])
+def bench_livebars_event(benchmark, max_fps):
+    bars = LiveBars("det_visible", max_fps=max_fps)
+    bars.start({"time": 0.0, "uid": "start", "scan_id": 1})
+    rng = np.random.default_rng(0)
+    docs = [{"data": {"det_visible": rng.uniform(0, 1000, 8)}, "time": 0.0} for _ in range(64)]
+    index = iter(range(10**9))
+    benchmark(lambda: bars.event(docs[next(index) % len(docs)]))
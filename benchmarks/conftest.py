@@ -0,0 +1,42 @@
+import os
+import sys
+
+# Run the real RPi.GPIO backend and AS7341 driver code paths against the in memory fakes, before anything
+# imports rpi_bluesky, so the numbers are comparable between machines and versions.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "fakes"))
+os.environ["RPI_BLUESKY_GPIO_BACKEND"] = "rpi"
+
+import matplotlib  # noqa: E402
+
+matplotlib.use("Agg")
+
+import pytest  # noqa: E402
+from bluesky import RunEngine  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def RE():
+    """A RunEngine that skips `sleep` messages, so plans written for a human run at full speed."""
+    RE = RunEngine()
+
+    async def skip_sleep(msg):
+        return None
+
+    RE.register_command("sleep", skip_sleep)
+    return RE
+
+
+@pytest.fixture
+def count_events():
+    """Callback counting event documents, and the events in event pages."""
+
+    class Counter:
+        events = 0
+
+        def __call__(self, name, doc):
+            if name == "event":
+                self.events += 1
+            elif name == "event_page":
+                self.events += len(doc["seq_num"])
+
+    return Counter()
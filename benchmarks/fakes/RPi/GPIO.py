@@ -0,0 +1,85 @@
+"""
+Stand in for ``RPi.GPIO``, keeping pin state in memory, so the real backend runs anywhere.
+
+Only the parts of the API used by `rpi_bluesky.ophyd.backends.RpiGPIOBackend` are implemented. No call sleeps,
+so the benchmarks measure the cost of rpi_bluesky itself.
+"""
+
+BCM, BOARD = 11, 10
+OUT, IN = 0, 1
+LOW, HIGH = 0, 1
+PUD_OFF, PUD_DOWN, PUD_UP = 20, 21, 22
+RISING, FALLING, BOTH = 31, 32, 33
+
+_mode = None
+_directions = {}
+_levels = {}
+_callbacks = {}
+
+
+def setmode(mode):
+    global _mode
+    _mode = mode
+
+
+def setwarnings(flag):
+    pass
+
+
+def setup(channel, direction, pull_up_down=PUD_OFF, initial=LOW):
+    if _mode is None:
+        raise RuntimeError(
+            "Please set pin numbering mode using GPIO.setmode(GPIO.BOARD) or GPIO.setmode(GPIO.BCM)"
+        )
+    _directions[channel] = direction
+    _levels.setdefault(channel, HIGH if pull_up_down == PUD_UP else initial)
+
+
+def output(channel, value):
+    channels = channel if isinstance(channel, (list, tuple)) else [channel]
+    values = value if isinstance(value, (list, tuple)) else [value] * len(channels)
+    for ch, val in zip(channels, values):
+        if _directions.get(ch) != OUT:
+            raise RuntimeError("The GPIO channel has not been set up as an OUTPUT")
+        _levels[ch] = int(bool(val))
+
+
+def input(channel):
+    if channel not in _directions:
+        raise RuntimeError("You must setup() the GPIO channel first")
+    return _levels[channel]
+
+
+def add_event_detect(channel, edge, callback=None, bouncetime=None):
+    _callbacks[channel] = (edge, callback)
+
+
+def remove_event_detect(channel):
+    _callbacks.pop(channel, None)
+
+
+def cleanup(channel=None):
+    for store in (_directions, _levels, _callbacks):
+        if channel is None:
+            store.clear()
+        else:
+            store.pop(channel, None)
+
+
+class PWM:
+    def __init__(self, channel, frequency):
+        self.channel = channel
+        self.frequency = frequency
+        self.duty_cycle = 0.0
+
+    def start(self, duty_cycle):
+        self.duty_cycle = duty_cycle
+
+    def ChangeDutyCycle(self, duty_cycle):
+        self.duty_cycle = duty_cycle
+
+    def ChangeFrequency(self, frequency):
+        self.frequency = frequency
+
+    def stop(self):
+        pass
@@ -1,4 +1,8 @@
+def __getattr__(name):
+    # Resolving the version can shell out to git, so it is deferred until asked for
+    if name == "__version__":
+        from ._version import get_versions
 
-from ._version import get_versions
-__version__ = get_versions()['version']
-del get_versions
+        globals()["__version__"] = version = get_versions()["version"]
+        return version
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,195 @@
+"""
+Linear response of a detector to the channels of a light source, and the open loop solver built on it.
+
+A calibration holds the response matrix, counts per % duty cycle of each light channel in each detector channel,
+and the dark offset. Calibrations persist to a versioned JSON cache keyed by the device names and the detector
+configuration, so a session only measures again when something that changes the response has changed.
+"""
+
+import itertools
+import json
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+
+# Bump when the meaning or layout of a cache entry changes, so stale entries are ignored instead of misread
+CACHE_VERSION = 2
+# Settings that only scale the exposure. `rpi_bluesky.plans.measure_spectrum` divides them out of every spectrum
+# of a detector with an integration time and gain, so its calibration does not depend on them.
+EXPOSURE_SETTINGS = ("integration_time", "gain", "auto_exposure", "auto_exposure_target")
+
+
+def default_cache_path() -> Path:
+    """``$XDG_CACHE_HOME/rpi_bluesky/response_calibration.json``, defaulting to ``~/.cache``."""
+    cache_home = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(cache_home) / "rpi_bluesky" / "response_calibration.json"
+
+
+def calibration_key(source, det) -> str:
+    """
+    Cache key of a light source and detector pair, from their names and the detector's configuration. The
+    exposure settings are left out when the spectra are normalized by them, so auto exposure moving them does
+    not invalidate the calibration.
+    """
+    exposure = set()
+    if hasattr(det, "integration_time") and hasattr(det, "gain"):
+        exposure = {getattr(det, setting).name for setting in EXPOSURE_SETTINGS if hasattr(det, setting)}
+    settings = {key: reading["value"] for key, reading in det.read_configuration().items() if key not in exposure}
+    return json.dumps({"source": source.name, "detector": det.name, "settings": settings}, sort_keys=True)
+
+
+class ResponseCalibration:
+    """
+    Detector counts as ``response @ duty_cycles + dark``, fitted by least squares.
+
+    Parameters
+    ----------
+    response: array_like
+        Counts per % duty cycle, shape (detector channels, light channels)
+    dark: array_like
+        Counts with every light channel off, shape (detector channels,)
+    key: str
+        Cache key, see `calibration_key`
+    created: float, optional
+        Unix time of the measurement. Defaults to now.
+    rms_residual: float
+        Root mean square residual of the fit, in counts
+    """
+
+    def __init__(self, response, dark, key, created=None, rms_residual=0.0):
+        self.response = np.asarray(response, dtype=float)
+        self.dark = np.asarray(dark, dtype=float)
+        if self.dark.shape != self.response.shape[:1]:
+            raise ValueError("There must be one dark offset per detector channel.")
+        self.key = key
+        self.created = time.time() if created is None else created
+        self.rms_residual = rms_residual
+
+    @classmethod
+    def fit(cls, duty_cycles, spectra, key):
+        """
+        Fit the response and dark offset to measured spectra by least squares.
+
+        Parameters
+        ----------
+        duty_cycles: array_like
+            Settings measured, shape (measurements, light channels)
+        spectra: array_like
+            Spectra measured at each setting, shape (measurements, detector channels)
+        key: str
+            Cache key
+        """
+        duty_cycles = np.asarray(duty_cycles, dtype=float)
+        spectra = np.asarray(spectra, dtype=float)
+        design = np.column_stack([np.ones(len(duty_cycles)), duty_cycles])
+        if np.linalg.matrix_rank(design) < design.shape[1]:
+            raise ValueError("The settings measured cannot separate the dark offset and every light channel.")
+        coefficients, *_ = np.linalg.lstsq(design, spectra, rcond=None)
+        rms_residual = float(np.sqrt(np.mean((design @ coefficients - spectra) ** 2)))
+        return cls(coefficients[1:].T, coefficients[0], key, rms_residual=rms_residual)
+
+    def predict(self, duty_cycles) -> np.ndarray:
+        """Spectra expected at one setting, or a stack of settings."""
+        return np.asarray(duty_cycles, dtype=float) @ self.response.T + self.dark
+
+    def solve(self, target, bounds=(0.0, 100.0)) -> np.ndarray:
+        """Duty cycles best reproducing one target spectrum, or a stack of them. See `solve_duty_cycles`."""
+        return solve_duty_cycles(self.response, np.asarray(target, dtype=float) - self.dark, bounds)
+
+    def is_valid(self, key, max_age=None) -> bool:
+        """True if the calibration was made for `key`, and less than `max_age` seconds ago if given."""
+        return self.key == key and (max_age is None or time.time() - self.created <= max_age)
+
+    def to_dict(self) -> dict:
+        return dict(
+            response=self.response.tolist(),
+            dark=self.dark.tolist(),
+            key=self.key,
+            created=self.created,
+            rms_residual=self.rms_residual,
+        )
+
+    @classmethod
+    def from_dict(cls, entry):
+        return cls(**entry)
+
+
+def solve_duty_cycles(response, target, bounds=(0.0, 100.0)) -> np.ndarray:
+    """
+    Bounded least squares ``min |response @ x - target|`` with every element of x within `bounds`.
+
+    The light sources here have a handful of channels, so rather than iterate, every assignment of each
+    channel to free, at the lower bound or at the upper bound is solved at once. The cheapest assignment whose
+    free channels land inside the bounds is the exact optimum, and a whole stack of targets is solved in the
+    same vectorized pass.
+
+    Parameters
+    ----------
+    response: array_like
+        Shape (detector channels, light channels)
+    target: array_like
+        Shape (detector channels,), or (targets, detector channels)
+    bounds: tuple
+        Lower and upper bound of every light channel
+
+    Returns
+    -------
+    duty_cycles: numpy.ndarray
+        Shape (light channels,), or (targets, light channels)
+    """
+    response = np.asarray(response, dtype=float)
+    target = np.asarray(target, dtype=float)
+    targets = np.atleast_2d(target)
+    low, high = bounds
+    n = response.shape[1]
+    best = np.zeros((len(targets), n))
+    best_cost = np.full(len(targets), np.inf)
+    for states in itertools.product((None, low, high), repeat=n):
+        free = np.array([state is None for state in states])
+        x = np.tile(np.where(free, 0.0, [0.0 if state is None else state for state in states]), (len(targets), 1))
+        remainder = targets - x @ response.T
+        if free.any():
+            x[:, free] = remainder @ np.linalg.pinv(response[:, free]).T
+        feasible = np.all((x >= low - 1e-9) & (x <= high + 1e-9), axis=1)
+        cost = np.where(feasible, np.sum((x @ response.T - targets) ** 2, axis=1), np.inf)
+        better = cost < best_cost
+        best[better] = x[better]
+        best_cost[better] = cost[better]
+    best = np.clip(best, low, high)
+    return best[0] if target.ndim == 1 else best
+
+
+def load_calibration(key, path=None, max_age=None):
+    """The cached calibration for `key`, or None if there is no valid one."""
+    path = Path(path) if path is not None else default_cache_path()
+    try:
+        with open(path) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if cache.get("version") != CACHE_VERSION or key not in cache.get("calibrations", {}):
+        return None
+    calibration = ResponseCalibration.from_dict(cache["calibrations"][key])
+    return calibration if calibration.is_valid(key, max_age) else None
+
+
+def save_calibration(calibration, path=None):
+    """Add a calibration to the cache, replacing any for the same key, and discarding other cache versions."""
+    path = Path(path) if path is not None else default_cache_path()
+    cache = {"version": CACHE_VERSION, "calibrations": {}}
+    try:
+        with open(path) as f:
+            existing = json.load(f)
+        if existing.get("version") == CACHE_VERSION:
+            cache = existing
+    except (OSError, ValueError):
+        pass
+    cache["calibrations"][calibration.key] = calibration.to_dict()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Write then rename, so a crash never leaves a truncated cache behind
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(cache, f, indent=2)
+    os.replace(tmp, path)
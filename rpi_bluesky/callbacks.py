@@ -0,0 +1,312 @@
+"""Live visualization callbacks for the Raspberry Pi detectors."""
+
+import threading
+import time
+
+import numpy as np
+from bluesky.callbacks.core import get_obj_fields
+from bluesky.callbacks.mpl_plotting import QtAwareCallback
+
+from rpi_bluesky.ophyd.adafruit import AS7341Enum
+from rpi_bluesky.utils import RingBuffer
+
+
+class _ThrottledPlot(QtAwareCallback):
+    """
+    Shared machinery of the live plots in this module.
+
+    Subclasses build a fixed set of artists once, then update them in place. Only those artists are redrawn,
+    blitted over a cached background, and redraws are capped at `max_fps`. Events arriving faster than that are
+    coalesced, keeping the latest, and event pages are consumed whole rather than unpacked into events.
+    Subclasses request a full redraw only when their data leaves the limits.
+    """
+
+    # Headroom left above the data when the limits have to grow
+    margin = 1.2
+
+    def __init__(self, *, max_fps=10.0, blit=True, use_teleporter=None):
+        super().__init__(use_teleporter=use_teleporter)
+        self.__setup_lock = threading.Lock()
+        self.__setup_event = threading.Event()
+        self.min_interval = 1.0 / max_fps
+        self.blit = blit
+        self.artists = []
+        self._last_draw = 0.0
+        self._pending = False
+        self._timer = None
+        self._background = None
+
+    def _setup(self):
+        # Run this code in start() so that it runs on the correct thread.
+        import matplotlib.pyplot as plt
+
+        with self.__setup_lock:
+            if self.__setup_event.is_set():
+                return
+            self.__setup_event.set()
+        fig, ax = plt.subplots()
+        self.ax = ax
+        self.fig = fig
+        self.blit = self.blit and getattr(fig.canvas, "supports_blit", False)
+        self.artists = self._build()
+        for artist in self.artists:
+            artist.set_animated(self.blit)
+        if self.blit:
+            fig.canvas.mpl_connect("draw_event", self._on_draw)
+        self._timer = fig.canvas.new_timer(interval=int(self.min_interval * 1000))
+        self._timer.single_shot = True
+        self._timer.add_callback(self._flush)
+
+    def _build(self):
+        """Create the artists on self.ax and return those that are updated on each frame."""
+        raise NotImplementedError
+
+    def _update_artists(self) -> bool:
+        """Update the artists in place with the latest data. Return True if the limits had to change."""
+        raise NotImplementedError
+
+    def start(self, doc):
+        self._setup()
+        self.fig.show()
+        super().start(doc)
+
+    def _request_draw(self):
+        if time.monotonic() - self._last_draw >= self.min_interval:
+            self.update_plot()
+        elif not self._pending:
+            # Draw the latest data once the frame interval has passed
+            self._pending = True
+            self._timer.start()
+
+    def _flush(self):
+        if self._pending:
+            self.update_plot()
+
+    def _on_draw(self, event):
+        # A full draw (resize, rescale) invalidates the cached background
+        self._background = self.fig.canvas.copy_from_bbox(self.fig.bbox)
+        self._draw_artists()
+
+    def _draw_artists(self):
+        for artist in self.artists:
+            self.ax.draw_artist(artist)
+
+    def update_plot(self):
+        self._pending = False
+        self._last_draw = time.monotonic()
+        rescaled = self._update_artists()
+        canvas = self.fig.canvas
+        if rescaled or not self.blit or self._background is None:
+            canvas.draw_idle()
+        else:
+            canvas.restore_region(self._background)
+            self._draw_artists()
+            canvas.blit(self.fig.bbox)
+
+    def stop(self, doc):
+        if self._timer is not None:
+            self._timer.stop()
+        self._flush()
+        super().stop(doc)
+
+
+class LiveBars(_ThrottledPlot):
+    """
+    An effort to make a live plot for this detector that updates on each read.
+
+    Only the bar artists are redrawn, and the y-axis is only rescaled when the data leaves the current limits.
+
+    Parameters
+    ----------
+    key: str
+        Data key of the 8 visible channels
+    max_fps: float
+        Maximum redraws per second. Defaults to 10.
+    blit: bool
+        Redraw only the bars when the canvas supports it. Defaults to True.
+    """
+
+    def __init__(self, key, *, max_fps=10.0, blit=True, **kwargs):
+        super().__init__(max_fps=max_fps, blit=blit, use_teleporter=kwargs.pop("use_teleporter", None))
+        self.data_key, *others = get_obj_fields([key])
+        self.new_data = np.zeros(8)
+
+    def _build(self):
+        self.ax.set_xlabel("Wavelength [nm]")
+        self.ax.set_ylabel("Intensity")
+        labels = [f"{x.value}" for x in AS7341Enum][:-2]
+        self.rects = self.ax.bar(range(8), self.new_data, tick_label=labels)
+        self.ax.set_ylim(0, 1)
+        return list(self.rects)
+
+    def event(self, doc):
+        # This try/except block is needed because multiple event
+        # streams will be emitted by the RunEngine and not all event
+        # streams will have the keys we want.
+        try:
+            self.new_data = doc["data"][self.data_key]
+        except KeyError:
+            # wrong event stream, skip it
+            return
+        self._request_draw()
+
+    def event_page(self, doc):
+        # Only the last spectrum of a page could be shown, so the rest are never looked at
+        try:
+            self.new_data = doc["data"][self.data_key][-1]
+        except (KeyError, IndexError):
+            return
+        self._request_draw()
+
+    def _update_artists(self):
+        for rect, h in zip(self.rects, self.new_data):
+            rect.set_height(h)
+        low, high = self.ax.get_ylim()
+        peak = float(np.max(self.new_data))
+        if peak > high:
+            self.ax.set_ylim(low, peak * self.margin)
+            return True
+        return False
+
+
+class LiveWaterfall(_ThrottledPlot):
+    """
+    Spectrogram of the last `n_spectra` visible spectra, newest at the bottom.
+
+    Spectra are kept in a preallocated ring buffer and drawn by a single image artist updated in place,
+    so memory and redraw cost stay flat however long the run goes on.
+
+    Parameters
+    ----------
+    key: str
+        Data key of the 8 visible channels
+    n_spectra: int
+        Number of spectra shown. Defaults to 200.
+    max_fps: float
+        Maximum redraws per second. Defaults to 10.
+    blit: bool
+        Redraw only the image when the canvas supports it. Defaults to True.
+    """
+
+    def __init__(self, key, *, n_spectra=200, max_fps=10.0, blit=True, **kwargs):
+        super().__init__(max_fps=max_fps, blit=blit, use_teleporter=kwargs.pop("use_teleporter", None))
+        self.data_key, *others = get_obj_fields([key])
+        self.buffer = RingBuffer(n_spectra, shape=(8,), dtype=float)
+        self._frame = np.zeros((n_spectra, 8))
+
+    def _build(self):
+        self.ax.set_xlabel("Wavelength [nm]")
+        self.ax.set_ylabel("Spectra ago")
+        n_spectra = self.buffer.capacity
+        # Row 0 of the frame is the oldest spectrum, drawn at the top, n_spectra ago
+        self.image = self.ax.imshow(
+            self._frame,
+            aspect="auto",
+            interpolation="nearest",
+            vmin=0,
+            vmax=1,
+            origin="upper",
+            extent=(-0.5, 7.5, 0, n_spectra),
+        )
+        self.ax.set_xticks(range(8), [f"{x.value}" for x in AS7341Enum][:-2])
+        self.fig.colorbar(self.image, ax=self.ax, label="Intensity")
+        return [self.image]
+
+    def start(self, doc):
+        self.buffer.clear()
+        self._frame[:] = 0
+        super().start(doc)
+
+    def event(self, doc):
+        try:
+            spectrum = doc["data"][self.data_key]
+        except KeyError:
+            return
+        self.buffer.append(spectrum, doc["time"])
+        self._request_draw()
+
+    def event_page(self, doc):
+        try:
+            spectra = doc["data"][self.data_key]
+        except KeyError:
+            return
+        self.buffer.extend(spectra, doc["time"])
+        self._request_draw()
+
+    def _update_artists(self):
+        spectra, _ = self.buffer.latest()
+        self._frame[len(self._frame) - len(spectra) :] = spectra
+        self.image.set_data(self._frame)
+        vmin, vmax = self.image.get_clim()
+        peak = float(spectra.max()) if len(spectra) else 0.0
+        if peak > vmax:
+            self.image.set_clim(vmin, peak * self.margin)
+            return True
+        return False
+
+
+class LiveTrace(_ThrottledPlot):
+    """
+    Rolling trace of the last `n_points` values of scalar channels, such as the clear and near IR channels.
+
+    Values are kept in a preallocated ring buffer and drawn as one line artist per key, updated in place against
+    a fixed "samples ago" axis, so memory and redraw cost stay flat however long the run goes on.
+
+    Parameters
+    ----------
+    keys: list of str
+        Data keys of the scalar channels, e.g. ``[det.clear.name, det.near_ir.name]``
+    n_points: int
+        Number of samples shown. Defaults to 500.
+    max_fps: float
+        Maximum redraws per second. Defaults to 10.
+    blit: bool
+        Redraw only the lines when the canvas supports it. Defaults to True.
+    """
+
+    def __init__(self, keys, *, n_points=500, max_fps=10.0, blit=True, **kwargs):
+        super().__init__(max_fps=max_fps, blit=blit, use_teleporter=kwargs.pop("use_teleporter", None))
+        self.data_keys = get_obj_fields(keys)
+        self.buffer = RingBuffer(n_points, shape=(len(self.data_keys),), dtype=float)
+        self._x = np.arange(-n_points + 1, 1)
+
+    def _build(self):
+        self.ax.set_xlabel("Samples ago")
+        self.ax.set_ylabel("Intensity")
+        self.lines = [self.ax.plot([], [], label=key)[0] for key in self.data_keys]
+        self.ax.set_xlim(self._x[0], 0)
+        self.ax.set_ylim(0, 1)
+        self.ax.legend(loc="upper left")
+        return self.lines
+
+    def start(self, doc):
+        self.buffer.clear()
+        super().start(doc)
+
+    def event(self, doc):
+        try:
+            values = [doc["data"][key] for key in self.data_keys]
+        except KeyError:
+            return
+        self.buffer.append(values, doc["time"])
+        self._request_draw()
+
+    def event_page(self, doc):
+        try:
+            values = np.column_stack([doc["data"][key] for key in self.data_keys])
+        except KeyError:
+            return
+        self.buffer.extend(values, doc["time"])
+        self._request_draw()
+
+    def _update_artists(self):
+        values, _ = self.buffer.latest()
+        x = self._x[len(self._x) - len(values) :]
+        for i, line in enumerate(self.lines):
+            line.set_data(x, values[:, i])
+        low, high = self.ax.get_ylim()
+        peak = float(values.max()) if len(values) else 0.0
+        if peak > high:
+            self.ax.set_ylim(low, peak * self.margin)
+            return True
+        return False
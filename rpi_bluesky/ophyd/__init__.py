@@ -1 +1,10 @@
-from .base import RpiSignal, RpiPWM, RpiComponent, RpiDevice
+from .backends import GPIOBackend, RpiGPIOBackend, SimulatedGPIOBackend
+from .base import (
+    RpiSignal,
+    RpiInputSignal,
+    RpiPWM,
+    RpiComponent,
+    RpiDevice,
+    configure_control_layer,
+    get_control_layer,
+)
@@ -1,14 +1,17 @@
+import logging
 import threading
+import time
 from enum import Enum
+from typing import Tuple
 
-import board
 import numpy as np
-from adafruit_as7341 import AS7341
-from bluesky.callbacks.core import get_obj_fields
-from bluesky.callbacks.mpl_plotting import QtAwareCallback
-from ophyd import Device, SignalRO
+from ophyd import Device, DeviceStatus, Signal, SignalRO
 
-from rpi_bluesky.ophyd.base import RpiComponent, rpi_control_layer
+from rpi_bluesky.ophyd.base import RpiComponent, get_control_layer
+from rpi_bluesky.ophyd.tracing import span
+from rpi_bluesky.utils import RingBuffer
+
+logger = logging.getLogger(__name__)
 
 
 class AS7341Enum(Enum):
@@ -29,32 +32,46 @@ class AS7341Signal(SignalRO):
     An Enum and a Read Only Signal. Why? Because this device has a fixed number of sensors channels with
     fixed definition, and they have an order to them. Admittedly, we don't take full advantage of the Enum here
     and it potentially overcomplicates things.
+
+    The value is served from the parent detector's latest snapshot, so it never triggers its own acquisition.
     """
 
     def __init__(self, channel: str, *, parent, name=None, cl=None, **kwargs):
-        self.channel = getattr(AS7341Enum, channel.upper()).value
+        member = getattr(AS7341Enum, channel.upper())
+        self.channel = member.value
+        self._index = list(AS7341Enum).index(member)
         self._channel_attr = (
             f"channel_{self.channel}nm" if isinstance(self.channel, int) else f"channel_{self.channel}"
         )
         name = name if name is not None else self._channel_attr
         if cl is None:
-            cl = rpi_control_layer
+            cl = parent.cl
         super().__init__(name=name, cl=cl, parent=parent, **kwargs)
 
     def get(self):
-        return getattr(self.parent.sensor, self._channel_attr)
+        return int(self.parent.snapshot()[self._index])
+
+    @property
+    def timestamp(self):
+        return self.parent.snapshot_timestamp
 
 
 class AS7341Array(SignalRO):
+    """The 8 visible channels as an array, served from the parent detector's latest snapshot."""
+
     def __init__(self, *, parent, name=None, cl=None, **kwargs):
         self._channel_attr = "all_channels"
         name = name if name is not None else self._channel_attr
         if cl is None:
-            cl = rpi_control_layer
+            cl = parent.cl
         super().__init__(name=name, cl=cl, parent=parent, **kwargs)
 
     def get(self):
-        return np.array(getattr(self.parent.sensor, self._channel_attr))
+        return self.parent.snapshot()[:8]
+
+    @property
+    def timestamp(self):
+        return self.parent.snapshot_timestamp
 
     def describe(self):
         # Because this isn't a simple scalar we need to update the describe dictionary entry
@@ -68,84 +85,421 @@ class AS7341Array(SignalRO):
         return ret
 
 
-i2c = board.I2C()
+def acquire_all_channels(sensor) -> np.ndarray:
+    """
+    Read all ten channels of an AS7341 in one acquisition, ordered as AS7341Enum.
+
+    The sensor has six ADCs, which the driver maps to F1-F4 and then F5-F8 via SMUX, with clear and near IR
+    on the last two ADCs in both configurations. This mirrors `AS7341.all_channels`, but keeps the clear and
+    near IR readings of the second bank rather than re-acquiring them for each of those channels.
+    """
+    with span("as7341.configure_f1_f4", "i2c"):
+        sensor._configure_f1_f4()
+    with span("as7341.read_f1_f4", "i2c"):
+        low = sensor._all_channels
+    with span("as7341.configure_f5_f8", "i2c"):
+        sensor._configure_f5_f8()
+    with span("as7341.read_f5_f8", "i2c"):
+        high = sensor._all_channels
+    # Each read is (ASTATUS, ADC0, ..., ADC5)
+    return np.array(low[1:5] + high[1:7], dtype=np.uint16)
+
+
+# Integration time is (ATIME + 1) * (ASTEP + 1) steps of 2.78 us, and ADC counts saturate at the step count
+ASTEP_US = 2.78
+MAX_COUNTS = 65535
+# Gain multipliers, indexed by the driver's Gain code
+GAINS = (0.5, 1.0, 2.0, 4.0, 8.0, 16.0, 32.0, 64.0, 128.0, 256.0, 512.0)
+# Driver defaults from AS7341.initialize
+DEFAULT_ATIME, DEFAULT_ASTEP, DEFAULT_GAIN = 100, 999, 128.0
+
+
+def integration_registers(integration_time: float) -> Tuple[int, int]:
+    """ATIME and ASTEP register values giving the closest integration time to one in milliseconds."""
+    steps = int(round(integration_time * 1000 / ASTEP_US))
+    if steps < 1 or steps > 256 * MAX_COUNTS:
+        raise ValueError(f"Integration time {integration_time} ms is outside the range of the AS7341.")
+    atime = (steps - 1) // MAX_COUNTS
+    astep = int(round(steps / (atime + 1))) - 1
+    return atime, astep
+
+
+def integration_time_ms(atime: int, astep: int) -> float:
+    """Integration time in milliseconds of the ATIME and ASTEP register values."""
+    return (atime + 1) * (astep + 1) * ASTEP_US / 1000
+
+
+def full_scale_counts(integration_time: float) -> int:
+    """Counts at which the ADCs saturate for an integration time in milliseconds."""
+    atime, astep = integration_registers(integration_time)
+    return min(MAX_COUNTS, (atime + 1) * (astep + 1))
+
+
+def validate_setting(setting: str, value):
+    """Raise if `value` is out of range for an integration_time, gain or auto_exposure_target setting."""
+    if setting == "integration_time":
+        integration_registers(value)
+    elif setting == "gain":
+        if value not in GAINS:
+            raise ValueError(f"Gain must be one of {GAINS}. {value} is invalid.")
+    elif setting == "auto_exposure_target":
+        if not 0 < value < MAX_COUNTS:
+            raise ValueError(f"Auto exposure target must be between 0 and {MAX_COUNTS} counts.")
+
+
+class AS7341Config(Signal):
+    """
+    A configuration setting of the detector. Setting it validates the value and writes it to the sensor if
+    connected; the detector re-applies all settings whenever the sensor connects.
+    """
+
+    def __init__(self, setting: str, *, parent, name=None, cl=None, **kwargs):
+        self.setting = setting
+        name = name if name is not None else setting
+        if cl is None:
+            cl = parent.cl
+        super().__init__(name=name, cl=cl, parent=parent, **kwargs)
+
+    def put(self, value, **kwargs):
+        self.parent._apply_setting(self.setting, value)
+        if self.setting == "integration_time":
+            # Store the time the registers give, which is what the sensor actually runs at
+            value = integration_time_ms(*integration_registers(value))
+        super().put(value, **kwargs)
+
+
+_i2c_buses = {}
+_i2c_lock = threading.Lock()
+
+
+def get_i2c(scl=None, sda=None):
+    """
+    I2C bus shared by every detector on it, opened on first use.
+
+    Parameters
+    ----------
+    scl, sda: board pins, optional
+        Pins of the bus. Defaults to the board's default I2C bus.
+    """
+    key = (scl, sda)
+    with _i2c_lock:
+        if key not in _i2c_buses:
+            if scl is None and sda is None:
+                import board
+
+                _i2c_buses[key] = board.I2C()
+            else:
+                import busio
+
+                _i2c_buses[key] = busio.I2C(scl, sda)
+        return _i2c_buses[key]
 
 
 class AS7341Detector(Device):
-    """A 10 channel detector that reads in 8 visible channels as an array, and a clear and near_ir channel."""
+    """
+    A 10 channel detector that reads in 8 visible channels as an array, and a clear and near_ir channel.
+
+    `trigger` performs exactly one acquisition of all ten channels into a snapshot, and every component reads
+    from that snapshot. All channels in a reading therefore come from the same exposure, and a
+    `trigger_and_read` costs one acquisition instead of one per component.
+
+    Nothing touches the I2C bus until the sensor is first used, or `connect`/`wait_for_connection` is called,
+    so importing the module and constructing detectors is cheap and works without the hardware.
+
+    Parameters
+    ----------
+    i2c: busio.I2C, optional
+        Bus the sensor is on. Defaults to the board's default bus, shared between detectors with `get_i2c`.
+    address: int, optional
+        I2C address of the sensor. Defaults to the driver's default.
+    stream_capacity: int
+        Number of spectra held by the ring buffer used when flying. Defaults to 4096.
+    cl: RpiControlLayer
+        Control layer whose latency histograms and tracing the detector reports to. Defaults to the default
+        control layer.
+
+    Flying
+    ------
+    The detector is also a flyer. `kickoff` starts a background thread that acquires back to back, at the
+    sensor's native rate, into a preallocated ring buffer of spectra and timestamps. `collect` emits the
+    samples buffered since the last collect as a single event_page of the stream named by `stream_name`,
+    with the visible channels as one (samples, 8) array, so the cost per sample is a row copy rather than an
+    event document. `complete` stops the acquisition, or when `num_spectra` is set, finishes once that many samples
+    are buffered; see `rpi_bluesky.plan_stubs.acquire_pages`. Collect at least every `stream_capacity` samples to
+    avoid dropping the oldest.
+
+    Configuration
+    -------------
+    integration_time: float
+        Integration time in milliseconds, rounded to what ATIME and ASTEP can represent
+    gain: float
+        ADC gain multiplier, one of 0.5, 1, 2, ..., 512
+    auto_exposure: bool
+        If True, each trigger adjusts the integration time (and the gain when the integration time is at a
+        limit) toward the shortest exposure whose brightest channel reaches `auto_exposure_target` counts
+        without saturating, re-acquiring until it does. As the exposure then changes between events, give
+        `integration_time` and `gain` kind "normal" to record them with each reading.
+    auto_exposure_target: float
+        Peak count level that auto exposure aims for
+    num_spectra: int
+        Spectra acquired per kickoff, at most `stream_capacity`, or 0 (default) to fly until completed. It is
+        not part of the configuration read with the data.
+    """
 
-    sensor = AS7341(i2c)
+    # Auto exposure stops once the peak is this close to the target, or after this many acquisitions
+    auto_exposure_tolerance = 0.1
+    auto_exposure_max_acquisitions = 5
+    # Longest integration time auto exposure will choose, in milliseconds
+    auto_exposure_max_time = 1000.0
 
     visible = RpiComponent(AS7341Array, name="visible", kind="hinted")
     clear = RpiComponent(AS7341Signal, channel="clear", kind="hinted")
     near_ir = RpiComponent(AS7341Signal, channel="near_ir", kind="hinted")
     """
-    Each individual channel could be accessed this way. However, the device driver would use re-trigger the read,
-    and thus the det.violet would not be guaranteed to match det.visible[0].
-    # violet = RpiComponent(AS7341Signal, channel="violet", kind="hinted")
-    # indigo = RpiComponent(AS7341Signal, channel="indigo", kind="hinted")
-    # blue = RpiComponent(AS7341Signal, channel="blue", kind="hinted")
-    # cyan = RpiComponent(AS7341Signal, channel="cyan", kind="hinted")
-    # green = RpiComponent(AS7341Signal, channel="green", kind="hinted")
-    # yellow = RpiComponent(AS7341Signal, channel="yellow", kind="hinted")
-    # orange = RpiComponent(AS7341Signal, channel="orange", kind="hinted")
-    # red = RpiComponent(AS7341Signal, channel="red", kind="hinted")
+    Each individual visible channel is also available from the same snapshot, and so is guaranteed to
+    match the corresponding element of det.visible. They are omitted from reads by default because they
+    duplicate det.visible; set e.g. `det.violet.kind = "hinted"` to record them separately.
     """
+    violet = RpiComponent(AS7341Signal, channel="violet", kind="omitted")
+    indigo = RpiComponent(AS7341Signal, channel="indigo", kind="omitted")
+    blue = RpiComponent(AS7341Signal, channel="blue", kind="omitted")
+    cyan = RpiComponent(AS7341Signal, channel="cyan", kind="omitted")
+    green = RpiComponent(AS7341Signal, channel="green", kind="omitted")
+    yellow = RpiComponent(AS7341Signal, channel="yellow", kind="omitted")
+    orange = RpiComponent(AS7341Signal, channel="orange", kind="omitted")
+    red = RpiComponent(AS7341Signal, channel="red", kind="omitted")
+
+    integration_time = RpiComponent(
+        AS7341Config,
+        setting="integration_time",
+        value=integration_time_ms(DEFAULT_ATIME, DEFAULT_ASTEP),
+        kind="config",
+    )
+    gain = RpiComponent(AS7341Config, setting="gain", value=DEFAULT_GAIN, kind="config")
+    auto_exposure = RpiComponent(AS7341Config, setting="auto_exposure", value=False, kind="config")
+    auto_exposure_target = RpiComponent(AS7341Config, setting="auto_exposure_target", value=20000.0, kind="config")
+    num_spectra = RpiComponent(AS7341Config, setting="num_spectra", value=0, kind="omitted")
+
+    stream_name = "spectra"
+
+    def __init__(self, *args, i2c=None, address=None, stream_capacity=4096, cl=None, **kwargs):
+        # Shared by the components, which are created by Device.__init__
+        self.cl = cl if cl is not None else get_control_layer()
+        self._stream = RingBuffer(stream_capacity, shape=(len(AS7341Enum),), dtype=np.uint16)
+        self._stream_thread = None
+        self._flying = False
+        self._stream_stop = threading.Event()
+        self._stream_status = None
+        self._stream_num = None
+        self._i2c = i2c
+        self._address = address
+        self._sensor = None
+        self._connect_lock = threading.Lock()
+        self._snapshot = None
+        self.snapshot_timestamp = None
+        self._acquire_lock = threading.Lock()
+        super().__init__(*args, **kwargs)
+
+    @property
+    def sensor(self):
+        """The AS7341 driver instance for this detector, connected on first access."""
+        if self._sensor is None:
+            self.connect()
+        return self._sensor
+
+    def connect(self):
+        """Open the I2C bus, if not already open, and initialize the sensor."""
+        with self._connect_lock:
+            if self._sensor is None:
+                from adafruit_as7341 import AS7341
+
+                i2c = self._i2c if self._i2c is not None else get_i2c()
+                self._sensor = AS7341(i2c) if self._address is None else AS7341(i2c, self._address)
+                self._write_setting("integration_time", self.integration_time.get())
+                self._write_setting("gain", self.gain.get())
+        return self._sensor
+
+    def _apply_setting(self, setting, value):
+        if setting == "num_spectra":
+            if not 0 <= value <= self._stream.capacity:
+                raise ValueError(
+                    f"Number of spectra must be between 0 and {self._stream.capacity}. {value} is invalid."
+                )
+        else:
+            validate_setting(setting, value)
+        if self._sensor is not None:
+            with self._acquire_lock:
+                self._write_setting(setting, value)
 
+    def _write_setting(self, setting, value):
+        if setting == "integration_time":
+            self._sensor.atime, self._sensor.astep = integration_registers(value)
+        elif setting == "gain":
+            self._sensor.gain = GAINS.index(value)
 
-class LiveBars(QtAwareCallback):
-    """An effort to make a live plot for this detector that updates on each read."""
-
-    def __init__(self, key, **kwargs):
-        super().__init__(use_teleporter=kwargs.pop("use_teleporter", None))
-        self.__setup_lock = threading.Lock()
-        self.__setup_event = threading.Event()
-
-        def setup():
-            # Run this code in start() so that it runs on the correct thread.
-            nonlocal key
-            import matplotlib.pyplot as plt
-
-            with self.__setup_lock:
-                if self.__setup_event.is_set():
-                    return
-                self.__setup_event.set()
-            fig, ax = plt.subplots()
-            self.ax = ax
-            self.fig = fig
-
-            self.data_key, *others = get_obj_fields([key])
-            self.ax.set_xlabel("Wavelength [nm]")
-            self.ax.set_ylabel("Intensity")
-            self.new_data = np.zeros(8)
-            labels = [f"{x.value}" for x in AS7341Enum][:-2]
-            self.rects = self.ax.bar(range(8), self.new_data, tick_label=labels)
-
-        self.__setup = setup
-
-    def start(self, doc):
-        self.__setup()
-        self.fig.show()
-        super().start(doc)
-
-    def event(self, doc):
-        # This try/except block is needed because multiple event
-        # streams will be emitted by the RunEngine and not all event
-        # streams will have the keys we want.
+    def wait_for_connection(self, *args, **kwargs):
+        self.connect()
+        super().wait_for_connection(*args, **kwargs)
+
+    def acquire(self):
+        """Read all ten channels into a new snapshot."""
+        with self._acquire_lock:
+            start = time.perf_counter()
+            values = acquire_all_channels(self.sensor)
+            self.cl.latency.record_since(self.name, "acquire", start)
+            self._snapshot = values
+            self.snapshot_timestamp = time.time()
+        return values
+
+    def snapshot(self) -> np.ndarray:
+        """The latest snapshot of all ten channels, acquiring one if the detector was never triggered."""
+        if self._snapshot is None:
+            self.acquire()
+        return self._snapshot
+
+    def _auto_expose(self, values: np.ndarray) -> np.ndarray:
+        """
+        Adjust integration time and gain from the peak of an acquisition, re-acquiring until on target. The
+        snapshot and settings left are those of the unsaturated acquisition closest to the target, if any.
+        """
+        target = self.auto_exposure_target.get()
+        # The exposure must be long enough that the target sits below full scale
+        shortest = target / 0.9 * ASTEP_US / 1000
+        longest = self.auto_exposure_max_time
+        best = None
+        for i in range(self.auto_exposure_max_acquisitions):
+            integration_time = self.integration_time.get()
+            gain = self.gain.get()
+            full_scale = full_scale_counts(integration_time)
+            peak = int(values.max())
+            saturated = peak >= 0.98 * full_scale
+            if not saturated and (best is None or abs(peak - target) < abs(best[0] - target)):
+                best = (peak, values, self.snapshot_timestamp, integration_time, gain)
+            on_target = not saturated and abs(peak - target) <= self.auto_exposure_tolerance * target
+            if on_target or i == self.auto_exposure_max_acquisitions - 1:
+                break
+            # Counts are linear in integration time times gain, but a saturated peak only bounds them, so
+            # assume it is up to 8 times full scale and correct from the unsaturated acquisition that follows
+            exposure = integration_time * gain * target / (8 * full_scale if saturated else max(peak, 1))
+            new_gain = gain
+            if not shortest <= exposure / gain <= longest:
+                # Whatever the integration time cannot take up goes to the gain, in as many steps as needed
+                if exposure / gain < shortest:
+                    stops = np.floor(np.log2(exposure / shortest))
+                else:
+                    stops = np.ceil(np.log2(exposure / longest))
+                # GAINS[i] is 2 ** (i - 1)
+                new_gain = GAINS[int(np.clip(stops + 1, 0, len(GAINS) - 1))]
+            new_time = float(np.clip(exposure / new_gain, shortest, longest))
+            if new_gain == gain and integration_registers(new_time) == integration_registers(integration_time):
+                # Both are pinned at a limit
+                break
+            self.integration_time.put(integration_time_ms(*integration_registers(new_time)))
+            self.gain.put(new_gain)
+            values = self.acquire()
+        if best is not None and best[1] is not values:
+            _, values, timestamp, integration_time, gain = best
+            self.integration_time.put(integration_time)
+            self.gain.put(gain)
+            with self._acquire_lock:
+                self._snapshot = values
+                self.snapshot_timestamp = timestamp
+        return values
+
+    def trigger(self):
+        with span(f"{self.name}.trigger", "ophyd"):
+            values = self.acquire()
+            if self.auto_exposure.get():
+                self._auto_expose(values)
+        status = DeviceStatus(self)
+        status.set_finished()
+        return status
+
+    def _stream_loop(self, num=None):
         try:
-            self.new_data = doc["data"][self.data_key]
-        except KeyError:
-            # wrong event stream, skip it
+            acquired = 0
+            while not self._stream_stop.is_set() and (num is None or acquired < num):
+                with self._acquire_lock:
+                    values = acquire_all_channels(self.sensor)
+                self._stream.append(values, time.time())
+                acquired += 1
+        except Exception as exc:
+            self._stream_status.set_exception(exc)
+        else:
+            self._stream_status.set_finished()
+
+    def kickoff(self):
+        """Start acquiring back to back into the ring buffer, until completed or `num_spectra` are acquired."""
+        if self._flying:
+            raise RuntimeError(f"{self.name} is already flying.")
+        if self._stream_thread is not None:
+            # A previous flight of num_spectra may still be finishing its last acquisition
+            self._stream_thread.join(self._stream_join_timeout())
+            if self._stream_thread.is_alive():
+                raise RuntimeError(f"{self.name} is still acquiring from its previous kickoff.")
+        num = self.num_spectra.get() or None
+        self.connect()
+        self._stream.clear()
+        self._stream_stop.clear()
+        self._stream_num = num
+        self._stream_status = DeviceStatus(self)
+        self._stream_thread = threading.Thread(
+            target=self._stream_loop, args=(num,), name=f"{self.name}_stream", daemon=True
+        )
+        self._stream_thread.start()
+        self._flying = True
+        status = DeviceStatus(self)
+        status.set_finished()
+        return status
+
+    def complete(self):
+        """
+        Stop acquiring, returning once the acquisition in progress is buffered. If `num_spectra` was set at
+        kickoff, the acquisition goes on and the returned status finishes once all of them are buffered.
+        """
+        if not self._flying:
+            raise RuntimeError(f"{self.name} must be kicked off before it is completed.")
+        self._flying = False
+        if self._stream_num is None:
+            self._stream_stop.set()
+            # Only the acquisition in progress is left, so the loop is gone before anything else uses the bus
+            self._stream_thread.join(self._stream_join_timeout())
+            if self._stream_thread.is_alive():
+                raise RuntimeError(f"{self.name} did not stop acquiring.")
+            self._stream_thread = None
+        return self._stream_status
+
+    def _stream_join_timeout(self) -> float:
+        """Seconds to allow the stream loop to finish an acquisition of both banks."""
+        return 2 * self.integration_time.get() / 1000 + 1.0
+
+    def describe_collect(self):
+        visible, clear, near_ir = self.visible.describe(), self.clear.describe(), self.near_ir.describe()
+        return {self.stream_name: {**visible, **clear, **near_ir}}
+
+    def collect_pages(self):
+        """Yield the spectra buffered since the last collect as one columnar partial event page."""
+        spectra, timestamps = self._stream.drain()
+        if self._stream.dropped:
+            logger.warning("%s dropped %d spectra; collect more often.", self.name, self._stream.dropped)
+            self._stream.dropped = 0
+        if not len(spectra):
             return
-        self.update_plot()
-
-    def update_plot(self):
-        for rect, h in zip(self.rects, self.new_data):
-            rect.set_height(h)
-        # Rescale and redraw.
-        self.ax.relim(visible_only=True)
-        self.ax.autoscale_view(tight=True)
-        self.ax.figure.canvas.draw_idle()
-
-    def stop(self, doc):
-        super().stop(doc)
+        names = (self.visible.name, self.clear.name, self.near_ir.name)
+        yield {
+            "time": timestamps,
+            "data": dict(zip(names, (spectra[:, :8], spectra[:, 8], spectra[:, 9]))),
+            "timestamps": dict.fromkeys(names, timestamps),
+        }
+
+
+# The live plotting callbacks pull in bluesky's callback machinery, so they are only imported when asked for
+_CALLBACKS = ("LiveBars", "LiveWaterfall", "LiveTrace")
+
+
+def __getattr__(name):
+    if name in _CALLBACKS:
+        from rpi_bluesky import callbacks
+
+        return getattr(callbacks, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
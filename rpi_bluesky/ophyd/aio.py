@@ -0,0 +1,548 @@
+"""
+Asyncio native versions of the GPIO, PWM, LED and AS7341 devices, in the style of ophyd-async.
+
+`set` and `trigger` are coroutines returning an awaitable `AsyncStatus`, and `read` and `describe` are
+coroutines, so the RunEngine drives any number of these devices concurrently on its own event loop, with no
+ophyd dispatcher and no thread per operation. GPIO writes take microseconds and are made on the loop, PWM
+settling is an awaited sleep, and the blocking I2C transactions of the AS7341 run on one worker thread per bus,
+which serializes them as the bus would anyway.
+
+They share the control layer, and so the backend, PWM engine, latency histograms and tracing, with the threaded
+devices, and can be mixed with them in one plan.
+"""
+
+import asyncio
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from rpi_bluesky.ophyd.adafruit import (
+    DEFAULT_ASTEP,
+    DEFAULT_ATIME,
+    DEFAULT_GAIN,
+    GAINS,
+    acquire_all_channels,
+    get_i2c,
+    integration_registers,
+    integration_time_ms,
+    validate_setting,
+)
+from rpi_bluesky.ophyd.backends import OUT
+from rpi_bluesky.ophyd.base import get_control_layer
+from rpi_bluesky.ophyd.tracing import trace_status
+
+
+class AsyncStatus:
+    """
+    Status of a coroutine running as a task on the current event loop. It can be awaited, and satisfies the
+    bluesky Status protocol, so the RunEngine waits on it like on an ophyd Status.
+    """
+
+    def __init__(self, awaitable):
+        self.task = asyncio.ensure_future(awaitable)
+        self._callbacks = []
+        self.task.add_done_callback(self._run_callbacks)
+
+    @classmethod
+    def wrap(cls, f):
+        """Make a coroutine function return an AsyncStatus running it, for `set` and `trigger`."""
+
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            return cls(f(*args, **kwargs))
+
+        return wrapper
+
+    def __await__(self):
+        return self.task.__await__()
+
+    def _run_callbacks(self, task):
+        for callback in self._callbacks:
+            callback(self)
+
+    def add_callback(self, callback):
+        if self.done:
+            callback(self)
+        else:
+            self._callbacks.append(callback)
+
+    def exception(self, timeout=0.0):
+        if timeout != 0.0:
+            raise ValueError("An AsyncStatus cannot be waited on with a timeout, await it instead.")
+        if not self.task.done():
+            return None
+        if self.task.cancelled():
+            return asyncio.CancelledError()
+        return self.task.exception()
+
+    @property
+    def done(self) -> bool:
+        return self.task.done()
+
+    @property
+    def success(self) -> bool:
+        return self.task.done() and not self.task.cancelled() and self.task.exception() is None
+
+    def __repr__(self):
+        state = "pending" if not self.done else ("success" if self.success else "failed")
+        return f"<{type(self).__name__} {state}>"
+
+
+class AsyncReadable:
+    """
+    Name, parent, configuration and hints shared by the devices here. Subclasses implement `read` and `describe`
+    as coroutines.
+    """
+
+    def __init__(self, name: str, parent=None):
+        self._name = name
+        self.parent = parent
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def hints(self) -> dict:
+        return {"fields": list(self._hinted_fields())}
+
+    def _hinted_fields(self):
+        return [self.name]
+
+    async def read_configuration(self) -> dict:
+        return {}
+
+    async def describe_configuration(self) -> dict:
+        return {}
+
+    def __repr__(self):
+        return f"{type(self).__name__}(name={self.name!r})"
+
+
+class AsyncRpiSignal(AsyncReadable):
+    """
+    A GPIO output pin. `set` writes the level, and `read` samples the pin.
+
+    Parameters
+    ----------
+    pin_number: int
+        Pin number for GPIO board
+    name: str
+        Defaults to GPIO_pin_{pin_number}
+    cl: RpiControlLayer
+        Control layer whose backend the pin is on. Defaults to the default control layer.
+    """
+
+    def __init__(self, pin_number: int, *, name=None, cl=None, parent=None):
+        self.pin = pin_number
+        self.cl = cl if cl is not None else get_control_layer()
+        self.cl.backend.setup(pin_number, OUT)
+        super().__init__(name or f"GPIO_pin_{pin_number}", parent)
+
+    def _write(self, value):
+        start = time.perf_counter()
+        self.cl.backend.output(self.pin, value)
+        self.cl.latency.record_since(self.name, "put", start)
+        self.cl.pins_written((self.pin,))
+
+    @AsyncStatus.wrap
+    async def _set(self, value):
+        self._write(value)
+
+    def set(self, value) -> AsyncStatus:
+        return trace_status(self._set(value), f"{self.name}.set")
+
+    async def get_value(self) -> int:
+        start = time.perf_counter()
+        value = self.cl.backend.input(self.pin)
+        self.cl.latency.record_since(self.name, "get", start)
+        return value
+
+    async def read(self) -> dict:
+        value = await self.get_value()
+        return {self.name: {"value": value, "timestamp": time.time()}}
+
+    async def describe(self) -> dict:
+        return {self.name: {"source": f"GPIO:{self.pin}", "dtype": "integer", "shape": []}}
+
+
+class AsyncRpiPWM(AsyncReadable):
+    """
+    Duty cycle of a PWM channel at a fixed frequency. `set` changes the duty cycle and completes after the
+    settle time (default one PWM period), awaited on the loop rather than on a timer thread.
+
+    Parameters
+    ----------
+    pin_number: int
+        Pin number for GPIO board
+    frequency: float
+        PWM frequency in Hz. Defaults to 100.
+    name: str
+        Defaults to PWM_pin_{pin_number}
+    cl: RpiControlLayer
+        Control layer whose PWM engine or backend drives the pin. Defaults to the default control layer.
+    settle_time: float, optional
+        Seconds for the output to settle after a change
+    """
+
+    dc_bounds = (0, 100)
+
+    def __init__(self, pin_number: int, *, frequency=100.0, name=None, cl=None, parent=None, settle_time=None):
+        self.pin = pin_number
+        self.cl = cl if cl is not None else get_control_layer()
+        # Sets the pin up as an output before the channel starts
+        self.pwm = self.cl.pwm(pin_number, frequency)
+        self.pwm.start(0)
+        self.settle_time = settle_time or 1.0 / frequency
+        self._duty_cycle = 0.0
+        self._timestamp = time.time()
+        super().__init__(name or f"PWM_pin_{pin_number}", parent)
+
+    def check_value(self, value):
+        if value < self.dc_bounds[0] or value > self.dc_bounds[1]:
+            raise ValueError(f"Duty cycle must be between 0 and 100%. {value} is an invalid set point.")
+
+    def _write(self, value):
+        self.check_value(value)
+        start = time.perf_counter()
+        self.pwm.ChangeDutyCycle(value)
+        self.cl.latency.record_since(self.name, "put", start)
+        self._duty_cycle = value
+        self._timestamp = time.time()
+
+    @AsyncStatus.wrap
+    async def _set(self, value, settle_time):
+        start = time.perf_counter()
+        self._write(value)
+        await asyncio.sleep(self.settle_time if settle_time is None else settle_time)
+        self.cl.latency.record_since(self.name, "set", start)
+
+    def set(self, value, *, settle_time=None) -> AsyncStatus:
+        """
+        Parameters
+        ----------
+        value: float
+            Duty cycle in percent
+        settle_time: float, optional
+            Overrides the settle time given at construction
+        """
+        # Out of range values fail here, before the RunEngine is handed a status
+        self.check_value(value)
+        return trace_status(self._set(value, settle_time), f"{self.name}.set")
+
+    async def get_value(self) -> float:
+        return self._duty_cycle
+
+    async def read(self) -> dict:
+        return {self.name: {"value": self._duty_cycle, "timestamp": self._timestamp}}
+
+    async def describe(self) -> dict:
+        return {self.name: {"source": f"PWM:{self.pin}", "dtype": "number", "shape": []}}
+
+
+class AsyncDevice(AsyncReadable):
+    """A device whose reading gathers the readings of its `children`, read concurrently."""
+
+    children = ()
+
+    def _children(self):
+        return [getattr(self, attr) for attr in self.children]
+
+    async def read(self) -> dict:
+        readings = {}
+        for reading in await asyncio.gather(*(child.read() for child in self._children())):
+            readings.update(reading)
+        return readings
+
+    async def describe(self) -> dict:
+        descriptions = {}
+        for description in await asyncio.gather(*(child.describe() for child in self._children())):
+            descriptions.update(description)
+        return descriptions
+
+
+class AsyncLED(AsyncDevice):
+    """
+    An LED on one pin, switched by `io` and dimmed by `pwm`. `set` takes a duty cycle, switching the LED on at
+    any level above 0 and off at 0.
+
+    Parameters
+    ----------
+    pin: int
+        Pin number for GPIO board
+    name: str
+        Prefix of the names of `io` and `pwm`
+    frequency: float
+        PWM frequency in Hz. Defaults to 100.
+    settle_time: float, optional
+        Seconds for the PWM to settle after a change
+    cl: RpiControlLayer
+        Defaults to the default control layer
+    """
+
+    children = ("io", "pwm")
+
+    def __init__(self, pin: int, *, name: str, frequency=100.0, settle_time=None, cl=None, parent=None):
+        self.pin = pin
+        self.io = AsyncRpiSignal(pin, name=f"{name}_io", cl=cl, parent=self)
+        self.pwm = AsyncRpiPWM(
+            pin, frequency=frequency, name=f"{name}_pwm", cl=cl, parent=self, settle_time=settle_time
+        )
+        super().__init__(name, parent)
+
+    def _hinted_fields(self):
+        return [self.pwm.name]
+
+    @AsyncStatus.wrap
+    async def _set(self, value):
+        self.io._write(1 if value > 0 else 0)
+        await self.pwm.set(value)
+
+    def set(self, value) -> AsyncStatus:
+        self.pwm.check_value(value)
+        return trace_status(self._set(value), f"{self.name}.set")
+
+
+class AsyncRGB_LED(AsyncDevice):
+    """
+    Three LEDs, set together from a (red, green, blue) triple of duty cycles, settling concurrently in a single
+    window. `read` adds the triple as the hinted ``{name}_color``.
+
+    Parameters
+    ----------
+    name: str
+        Prefix of the names of the channels
+    pins: tuple
+        Red, green and blue pins. Defaults to those of `RGB_LED`.
+    frequency: float
+        PWM frequency in Hz. Defaults to 100.
+    settle_time: float, optional
+        Seconds for the PWMs to settle after a change
+    cl: RpiControlLayer
+        Defaults to the default control layer
+    """
+
+    children = ("red", "green", "blue")
+
+    def __init__(self, *, name: str, pins=(17, 27, 22), frequency=100.0, settle_time=None, cl=None, parent=None):
+        red, green, blue = pins
+        kwargs = dict(frequency=frequency, settle_time=settle_time, cl=cl, parent=self)
+        self.red = AsyncLED(red, name=f"{name}_red", **kwargs)
+        self.green = AsyncLED(green, name=f"{name}_green", **kwargs)
+        self.blue = AsyncLED(blue, name=f"{name}_blue", **kwargs)
+        super().__init__(name, parent)
+
+    @property
+    def channels(self):
+        return self.red, self.green, self.blue
+
+    @property
+    def color_key(self) -> str:
+        return f"{self.name}_color"
+
+    def _hinted_fields(self):
+        return [self.color_key]
+
+    @AsyncStatus.wrap
+    async def _set(self, value):
+        await asyncio.gather(*(led.set(duty_cycle) for led, duty_cycle in zip(self.channels, value)))
+
+    def set(self, value) -> AsyncStatus:
+        if len(value) != 3:
+            raise ValueError(f"A color needs a duty cycle for each of red, green and blue. {value} is invalid.")
+        for led, duty_cycle in zip(self.channels, value):
+            led.pwm.check_value(duty_cycle)
+        return trace_status(self._set(tuple(value)), f"{self.name}.set")
+
+    async def read(self) -> dict:
+        readings = await super().read()
+        pwms = [readings[led.pwm.name] for led in self.channels]
+        readings[self.color_key] = {
+            "value": [pwm["value"] for pwm in pwms],
+            "timestamp": max(pwm["timestamp"] for pwm in pwms),
+        }
+        return readings
+
+    async def describe(self) -> dict:
+        descriptions = await super().describe()
+        descriptions[self.color_key] = {"source": f"rpi:{self.name}", "dtype": "array", "shape": [3]}
+        return descriptions
+
+
+_bus_executors = {}
+
+
+def _bus_executor(i2c) -> ThreadPoolExecutor:
+    """The single worker thread running the I2C transactions of every async detector on a bus."""
+    key = id(i2c)
+    if key not in _bus_executors:
+        _bus_executors[key] = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rpi_bluesky_i2c")
+    return _bus_executors[key]
+
+
+class AsyncAS7341Detector(AsyncDevice):
+    """
+    The AS7341 as an async device. `trigger` performs one acquisition of all ten channels, awaited while the
+    bus worker thread runs it, and `read` serves the 8 visible channels as an array and the clear and near IR
+    channels from that snapshot.
+
+    Parameters
+    ----------
+    name: str
+        Prefix of the data keys
+    i2c: busio.I2C, optional
+        Bus the sensor is on. Defaults to the board's default bus, shared with `get_i2c`.
+    address: int, optional
+        I2C address of the sensor. Defaults to the driver's default.
+    integration_time: float
+        Integration time in milliseconds. Defaults to the driver's.
+    gain: float
+        ADC gain multiplier, one of 0.5, 1, 2, ..., 512. Defaults to the driver's.
+
+    Configuration
+    -------------
+    integration_time and gain, changed with ``configure({"integration_time": ..., "gain": ...})``
+    """
+
+    def __init__(
+        self,
+        *,
+        name: str,
+        i2c=None,
+        address=None,
+        integration_time=None,
+        gain=DEFAULT_GAIN,
+        cl=None,
+        parent=None,
+    ):
+        self._i2c = i2c
+        self._address = address
+        self._sensor = None
+        self._lock = None
+        self.cl = cl if cl is not None else get_control_layer()
+        self._config = {}
+        self._validate("gain", gain)
+        integration_time = integration_time or integration_time_ms(DEFAULT_ATIME, DEFAULT_ASTEP)
+        self._validate("integration_time", integration_time)
+        self._config = {"integration_time": integration_time, "gain": gain}
+        self._config_timestamp = time.time()
+        self._snapshot = None
+        self.snapshot_timestamp = None
+        super().__init__(name, parent)
+
+    @property
+    def visible_key(self) -> str:
+        return f"{self.name}_visible"
+
+    @property
+    def clear_key(self) -> str:
+        return f"{self.name}_clear"
+
+    @property
+    def near_ir_key(self) -> str:
+        return f"{self.name}_near_ir"
+
+    def _hinted_fields(self):
+        return [self.visible_key, self.clear_key, self.near_ir_key]
+
+    settings = ("integration_time", "gain")
+
+    def _validate(self, setting, value):
+        if setting not in self.settings:
+            raise KeyError(f"{setting} is not a setting of the AS7341.")
+        validate_setting(setting, value)
+
+    def _write_settings(self):
+        self._sensor.atime, self._sensor.astep = integration_registers(self._config["integration_time"])
+        self._sensor.gain = GAINS.index(self._config["gain"])
+
+    def _connect(self):
+        from adafruit_as7341 import AS7341
+
+        if self._i2c is None:
+            self._i2c = get_i2c()
+        sensor = AS7341(self._i2c) if self._address is None else AS7341(self._i2c, self._address)
+        self._sensor = sensor
+        self._write_settings()
+        return sensor
+
+    def _run_on_bus(self, f, *args):
+        if self._i2c is None:
+            self._i2c = get_i2c()
+        return asyncio.get_running_loop().run_in_executor(_bus_executor(self._i2c), f, *args)
+
+    async def connect(self):
+        """Open the I2C bus, if not already open, and initialize the sensor."""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._sensor is None:
+                await self._run_on_bus(self._connect)
+
+    def _acquire(self):
+        start = time.perf_counter()
+        values = acquire_all_channels(self._sensor)
+        self.cl.latency.record_since(self.name, "acquire", start)
+        return values
+
+    @AsyncStatus.wrap
+    async def _trigger(self):
+        await self.connect()
+        async with self._lock:
+            values = await self._run_on_bus(self._acquire)
+            self._snapshot = values
+            self.snapshot_timestamp = time.time()
+
+    def trigger(self) -> AsyncStatus:
+        return trace_status(self._trigger(), f"{self.name}.trigger")
+
+    def configure(self, d: dict):
+        """
+        Change integration time and gain, written to the sensor by the bus worker before the next acquisition.
+
+        Returns
+        -------
+        old, new: dict
+            Configuration readings before and after
+        """
+        for setting, value in d.items():
+            self._validate(setting, value)
+        old = self._configuration()
+        self._config.update(d)
+        self._config_timestamp = time.time()
+        if self._sensor is not None:
+            _bus_executor(self._i2c).submit(self._write_settings)
+        return old, self._configuration()
+
+    def _configuration(self) -> dict:
+        return {
+            f"{self.name}_{setting}": {"value": value, "timestamp": self._config_timestamp}
+            for setting, value in self._config.items()
+        }
+
+    async def read_configuration(self) -> dict:
+        return self._configuration()
+
+    async def describe_configuration(self) -> dict:
+        return {
+            f"{self.name}_{setting}": {"source": f"rpi:{self.name}", "dtype": "number", "shape": []}
+            for setting in self._config
+        }
+
+    async def read(self) -> dict:
+        if self._snapshot is None:
+            await self.trigger()
+        values, timestamp = self._snapshot, self.snapshot_timestamp
+        return {
+            self.visible_key: {"value": values[:8], "timestamp": timestamp},
+            self.clear_key: {"value": int(values[8]), "timestamp": timestamp},
+            self.near_ir_key: {"value": int(values[9]), "timestamp": timestamp},
+        }
+
+    async def describe(self) -> dict:
+        source = f"rpi:{self.name}"
+        return {
+            self.visible_key: {"source": source, "dtype": "array", "shape": [8]},
+            self.clear_key: {"source": source, "dtype": "integer", "shape": []},
+            self.near_ir_key: {"source": source, "dtype": "integer", "shape": []},
+        }
@@ -0,0 +1,334 @@
+"""
+GPIO backends for the RpiControlLayer.
+
+The control layer never talks to ``RPi.GPIO`` directly. Instead it owns a backend object that exposes the small
+subset of the ``RPi.GPIO`` API that the signals need. The real backend is a thin wrapper on ``RPi.GPIO``, and the
+simulated backend is a pure-Python model of pin state and PWM duty cycle, which lets everything run off of a Pi.
+The backend is chosen with the ``RPI_BLUESKY_GPIO_BACKEND`` environment variable ("rpi" or "sim"), or passed
+explicitly to the control layer.
+"""
+
+import os
+import threading
+import time
+from collections import Counter
+from typing import Callable, List, Mapping, Optional, Sequence, Union
+
+OUT = "out"
+IN = "in"
+
+PULL_UP = "up"
+PULL_DOWN = "down"
+
+RISING = "rising"
+FALLING = "falling"
+BOTH = "both"
+
+BACKEND_ENV_VAR = "RPI_BLUESKY_GPIO_BACKEND"
+
+
+class GPIOBackend:
+    """
+    Interface the control layer expects from a GPIO implementation.
+
+    Pins are configured with a direction of either ``OUT`` or ``IN``. PWM channels are returned by `pwm` and are
+    expected to follow the ``RPi.GPIO.PWM`` API (``start``, ``ChangeDutyCycle``, ``ChangeFrequency``, ``stop``).
+    The bulk methods (`output_many`, `input_many`, `change_duty_cycles`) fall back to one call per pin, and
+    should be overridden by backends that can touch a whole bank of pins in one transaction.
+    """
+
+    name = ""
+
+    def setmode(self, mode: str):
+        raise NotImplementedError
+
+    def setup(self, pin: int, direction: str, pull: Optional[str] = None):
+        raise NotImplementedError
+
+    def output(self, pin: int, value: int):
+        raise NotImplementedError
+
+    def input(self, pin: int) -> int:
+        raise NotImplementedError
+
+    def pwm(self, pin: int, frequency: float):
+        raise NotImplementedError
+
+    def add_event_detect(self, pin: int, edge: str, callback: Callable[[int], None]):
+        raise NotImplementedError
+
+    def remove_event_detect(self, pin: int):
+        raise NotImplementedError
+
+    def cleanup(self):
+        raise NotImplementedError
+
+    def output_many(self, pins: Sequence[int], values: Sequence[int]):
+        for pin, value in zip(pins, values):
+            self.output(pin, value)
+
+    def input_many(self, pins: Sequence[int]) -> List[int]:
+        return [self.input(pin) for pin in pins]
+
+    def change_duty_cycles(self, pwms: Sequence, duty_cycles: Sequence[float]):
+        for pwm, duty_cycle in zip(pwms, duty_cycles):
+            pwm.ChangeDutyCycle(duty_cycle)
+
+
+class RpiGPIOBackend(GPIOBackend):
+    """Backend that forwards every call to ``RPi.GPIO``. Only importable on a Raspberry Pi."""
+
+    name = "rpi"
+
+    def __init__(self):
+        import RPi.GPIO as GPIO
+
+        self._gpio = GPIO
+        self._directions = {OUT: GPIO.OUT, IN: GPIO.IN}
+        self._pulls = {None: GPIO.PUD_OFF, PULL_UP: GPIO.PUD_UP, PULL_DOWN: GPIO.PUD_DOWN}
+        self._edges = {RISING: GPIO.RISING, FALLING: GPIO.FALLING, BOTH: GPIO.BOTH}
+
+    def setmode(self, mode: str):
+        self._gpio.setmode(getattr(self._gpio, mode))
+
+    def setup(self, pin: int, direction: str, pull: Optional[str] = None):
+        if direction == IN:
+            self._gpio.setup(pin, self._directions[direction], pull_up_down=self._pulls[pull])
+        else:
+            self._gpio.setup(pin, self._directions[direction])
+
+    def output(self, pin: int, value: int):
+        self._gpio.output(pin, value)
+
+    def input(self, pin: int) -> int:
+        return self._gpio.input(pin)
+
+    def pwm(self, pin: int, frequency: float):
+        return self._gpio.PWM(pin, frequency)
+
+    def add_event_detect(self, pin: int, edge: str, callback: Callable[[int], None]):
+        # Debouncing is left to the caller, so RPi.GPIO's bouncetime is not used
+        self._gpio.add_event_detect(pin, self._edges[edge], callback=callback)
+
+    def remove_event_detect(self, pin: int):
+        self._gpio.remove_event_detect(pin)
+
+    def cleanup(self):
+        self._gpio.cleanup()
+
+    def output_many(self, pins: Sequence[int], values: Sequence[int]):
+        # RPi.GPIO accepts lists of channels and values in a single call
+        self._gpio.output(list(pins), list(values))
+
+
+class SimulatedPWM:
+    """In-memory stand in for ``RPi.GPIO.PWM`` that records the duty cycle and frequency of a channel."""
+
+    def __init__(self, backend: "SimulatedGPIOBackend", pin: int, frequency: float):
+        if frequency <= 0:
+            raise ValueError(f"Frequency must be greater than 0. {frequency} is invalid.")
+        self._backend = backend
+        self.pin = pin
+        self.frequency = frequency
+        self.duty_cycle = 0.0
+        self.running = False
+
+    def start(self, duty_cycle: float):
+        self._backend._call("pwm_start")
+        self._check_duty_cycle(duty_cycle)
+        self.duty_cycle = duty_cycle
+        self.running = True
+
+    def ChangeDutyCycle(self, duty_cycle: float):
+        self._backend._call("pwm_change_duty_cycle")
+        self._check_duty_cycle(duty_cycle)
+        self.duty_cycle = duty_cycle
+
+    def ChangeFrequency(self, frequency: float):
+        self._backend._call("pwm_change_frequency")
+        if frequency <= 0:
+            raise ValueError(f"Frequency must be greater than 0. {frequency} is invalid.")
+        self.frequency = frequency
+
+    def stop(self):
+        self._backend._call("pwm_stop")
+        self.running = False
+
+    def level(self) -> int:
+        """Instantaneous output level of the channel, modeled from the wall clock phase of the PWM period."""
+        if not self.running or self.duty_cycle <= 0:
+            return 0
+        if self.duty_cycle >= 100:
+            return 1
+        phase = (time.monotonic() * self.frequency) % 1.0
+        return int(phase < self.duty_cycle / 100.0)
+
+    @staticmethod
+    def _check_duty_cycle(duty_cycle):
+        if duty_cycle < 0 or duty_cycle > 100:
+            raise ValueError(f"Duty cycle must be between 0 and 100%. {duty_cycle} is invalid.")
+
+
+class SimulatedGPIOBackend(GPIOBackend):
+    """
+    Pure-Python GPIO model. Tracks pin directions, output levels and PWM channels, and counts every call.
+
+    Parameters
+    ----------
+    latency: float or Mapping[str, float]
+        Artificial delay in seconds added to each call. A mapping from call name (e.g. "output", "input",
+        "pwm_change_duty_cycle") to delay sets the latency per call. Defaults to zero latency, so that
+        benchmarks measure only the ophyd and bluesky overhead.
+    """
+
+    name = "sim"
+
+    def __init__(self, latency: Union[float, Mapping[str, float]] = 0.0):
+        self.latency = latency
+        self.mode = ""
+        self.calls = Counter()
+        self._directions = {}
+        self._levels = {}
+        self._pwms = {}
+        self._edge_callbacks = {}
+        self._lock = threading.Lock()
+
+    def _call(self, call: str):
+        self.calls[call] += 1
+        delay = self.latency.get(call, 0.0) if isinstance(self.latency, Mapping) else self.latency
+        if delay:
+            time.sleep(delay)
+
+    def setmode(self, mode: str):
+        self._call("setmode")
+        if mode not in ("BCM", "BOARD"):
+            raise ValueError(f"Unknown GPIO mode {mode}.")
+        if self.mode and self.mode != mode:
+            raise ValueError("A different mode has already been set!")
+        self.mode = mode
+
+    def setup(self, pin: int, direction: str, pull: Optional[str] = None):
+        self._call("setup")
+        if not self.mode:
+            raise RuntimeError("Please set pin numbering mode using setmode before setting up a pin.")
+        if direction not in (OUT, IN):
+            raise ValueError(f"Unknown pin direction {direction}.")
+        with self._lock:
+            self._directions[pin] = direction
+            if direction == IN and pull is not None:
+                self._levels[pin] = int(pull == PULL_UP)
+            else:
+                self._levels.setdefault(pin, 0)
+
+    def output(self, pin: int, value: int):
+        self._call("output")
+        if self._directions.get(pin) != OUT:
+            raise RuntimeError(f"The GPIO channel {pin} has not been set up as an OUTPUT")
+        with self._lock:
+            self._levels[pin] = int(bool(value))
+
+    def input(self, pin: int) -> int:
+        self._call("input")
+        if pin not in self._directions:
+            raise RuntimeError(f"You must setup() the GPIO channel {pin} first")
+        pwm = self._pwms.get(pin)
+        if pwm is not None and pwm.running:
+            return pwm.level()
+        return self._levels[pin]
+
+    def pwm(self, pin: int, frequency: float):
+        self._call("pwm")
+        if self._directions.get(pin) != OUT:
+            raise RuntimeError(f"You must setup() the GPIO channel {pin} as an output first")
+        with self._lock:
+            if pin in self._pwms and self._pwms[pin].running:
+                raise RuntimeError(f"A PWM object already exists for GPIO channel {pin}")
+            pwm = SimulatedPWM(self, pin, frequency)
+            self._pwms[pin] = pwm
+        return pwm
+
+    def add_event_detect(self, pin: int, edge: str, callback: Callable[[int], None]):
+        self._call("add_event_detect")
+        if self._directions.get(pin) != IN:
+            raise RuntimeError(f"You must setup() the GPIO channel {pin} as an input first")
+        if pin in self._edge_callbacks:
+            raise RuntimeError(f"Conflicting edge detection already enabled for GPIO channel {pin}")
+        if edge not in (RISING, FALLING, BOTH):
+            raise ValueError(f"Unknown edge {edge}.")
+        self._edge_callbacks[pin] = (edge, callback)
+
+    def remove_event_detect(self, pin: int):
+        self._call("remove_event_detect")
+        self._edge_callbacks.pop(pin, None)
+
+    def drive(self, pin: int, level: int):
+        """
+        Drive the level of an input pin from outside, as a button or photogate would.
+        Edge callbacks registered on the pin run synchronously in the calling thread.
+        """
+        if self._directions.get(pin) != IN:
+            raise RuntimeError(f"The GPIO channel {pin} has not been set up as an INPUT")
+        level = int(bool(level))
+        with self._lock:
+            previous = self._levels[pin]
+            self._levels[pin] = level
+        if level == previous or pin not in self._edge_callbacks:
+            return
+        edge, callback = self._edge_callbacks[pin]
+        if edge == BOTH or edge == (RISING if level else FALLING):
+            callback(pin)
+
+    def cleanup(self):
+        self._call("cleanup")
+        with self._lock:
+            for pwm in self._pwms.values():
+                pwm.running = False
+            self._edge_callbacks.clear()
+            self._directions.clear()
+            self._levels.clear()
+            self._pwms.clear()
+            self.mode = ""
+
+    def output_many(self, pins: Sequence[int], values: Sequence[int]):
+        self._call("output_many")
+        for pin in pins:
+            if self._directions.get(pin) != OUT:
+                raise RuntimeError(f"The GPIO channel {pin} has not been set up as an OUTPUT")
+        with self._lock:
+            for pin, value in zip(pins, values):
+                self._levels[pin] = int(bool(value))
+
+    def input_many(self, pins: Sequence[int]) -> List[int]:
+        self._call("input_many")
+        values = []
+        for pin in pins:
+            if pin not in self._directions:
+                raise RuntimeError(f"You must setup() the GPIO channel {pin} first")
+            pwm = self._pwms.get(pin)
+            values.append(pwm.level() if pwm is not None and pwm.running else self._levels[pin])
+        return values
+
+    def change_duty_cycles(self, pwms: Sequence[SimulatedPWM], duty_cycles: Sequence[float]):
+        self._call("change_duty_cycles")
+        for duty_cycle in duty_cycles:
+            SimulatedPWM._check_duty_cycle(duty_cycle)
+        for pwm, duty_cycle in zip(pwms, duty_cycles):
+            pwm.duty_cycle = duty_cycle
+
+    def duty_cycle(self, pin: int) -> float:
+        """Duty cycle of the PWM channel on a pin, or 0 if no channel is running."""
+        pwm = self._pwms.get(pin)
+        return pwm.duty_cycle if pwm is not None and pwm.running else 0.0
+
+
+BACKENDS = {RpiGPIOBackend.name: RpiGPIOBackend, SimulatedGPIOBackend.name: SimulatedGPIOBackend}
+
+
+def get_default_backend() -> GPIOBackend:
+    """Instantiate the backend named by the ``RPI_BLUESKY_GPIO_BACKEND`` environment variable (default "rpi")."""
+    name = os.environ.get(BACKEND_ENV_VAR, RpiGPIOBackend.name).lower()
+    try:
+        backend_class = BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown GPIO backend {name}. Choose one of {list(BACKENDS)}.")
+    return backend_class()
@@ -2,11 +2,17 @@ import atexit
 import logging
 import threading
 import time
-from typing import Optional
+from typing import Any, List, Mapping, Optional, Sequence
 
-import RPi.GPIO as GPIO
-from ophyd import Component, Device, Signal
+import numpy as np
+from ophyd import Component, Device, DeviceStatus, Signal, SignalRO
 from ophyd._dispatch import EventDispatcher
+from ophyd.status import Status, SubscriptionStatus
+
+from rpi_bluesky.ophyd.backends import BOTH, IN, OUT, RISING, GPIOBackend, get_default_backend
+from rpi_bluesky.ophyd.latency import LatencyRecorder
+from rpi_bluesky.ophyd.pwm import PWMEngine
+from rpi_bluesky.ophyd.tracing import trace_status
 
 module_logger = logging.getLogger(__name__)
 
@@ -15,18 +21,44 @@ class RpiControlLayer:
     """
     Control Layer that is built piecemeal after _caproto_shim to ensure minimal working example.
     This replaces the default in Ophyd and does some Raspberry Pi favors in terms of set up and tear down.
+
+    All hardware calls go through the `backend`, so the same signals run against RPi.GPIO or a simulation.
+
+    Parameters
+    ----------
+    backend: GPIOBackend
+        GPIO implementation. Defaults to the one named by the RPI_BLUESKY_GPIO_BACKEND environment variable.
+    mode: str
+        Pin numbering mode, BCM or BOARD.
+    pwm_engine: bool
+        If True (default), every PWM channel is driven by one shared PWMEngine scheduler thread. If False,
+        each channel comes from the backend, which for RPi.GPIO means one busy thread per channel.
+    record_latency: bool
+        If True (default), the latency of each hardware call made by the signals on this control layer is
+        recorded in the histograms of `latency`.
     """
 
     name = "rpi"
 
-    def __init__(self):
+    def __init__(
+        self,
+        backend: Optional[GPIOBackend] = None,
+        mode: str = "BCM",
+        pwm_engine: bool = True,
+        record_latency: bool = True,
+    ):
         self.mode = ""
-        self.set_mode("BCM")
+        self.latency = LatencyRecorder(enabled=record_latency)
+        self.backend = backend if backend is not None else get_default_backend()
+        self.set_mode(mode)
+        self.pwm_engine = PWMEngine(self.backend) if pwm_engine else None
         self._dispatcher = EventDispatcher(logger=module_logger, context=None)
         atexit.register(self._cleanup)
 
     def _cleanup(self):
-        GPIO.cleanup()
+        if self.pwm_engine is not None:
+            self.pwm_engine.stop()
+        self.backend.cleanup()
         if self._dispatcher is None:
             return
         if self._dispatcher.is_alive():
@@ -48,10 +80,107 @@ class RpiControlLayer:
         if self.mode:
             raise RuntimeError("GPIO mode can only be set once at the start of a program.")
         self.mode = mode.upper()
-        GPIO.setmode(getattr(GPIO, self.mode))
+        self.backend.setmode(self.mode)
+
+    def set_backend(self, backend: GPIOBackend):
+        """
+        Swap the GPIO backend, e.g. for a simulation. Must be called before any signals are created,
+        as pins already set up on the previous backend are released.
+        """
+        if self.pwm_engine is not None:
+            self.pwm_engine.stop()
+            self.pwm_engine = PWMEngine(backend)
+        self.backend.cleanup()
+        self.backend = backend
+        self.backend.setmode(self.mode)
+
+    def pwm(self, pin: int, frequency: float):
+        """
+        A PWM channel on a pin, from the shared PWM engine if enabled, otherwise from the backend. The pin is set
+        up as an output first, so a bad pin fails here rather than in the engine.
+        """
+        self.backend.setup(pin, OUT)
+        if self.pwm_engine is not None:
+            return self.pwm_engine.pwm(pin, frequency)
+        return self.backend.pwm(pin, frequency)
+
+    def thread_stats(self) -> dict:
+        """Threads run on behalf of the control layer, and the CPU time of the PWM engine, for inspection."""
+        return dict(
+            dispatcher_threads=len(self._dispatcher.threads) if self._dispatcher is not None else 0,
+            pwm_engine=self.pwm_engine.stats() if self.pwm_engine is not None else None,
+        )
+
+    def latency_histograms(self) -> dict:
+        """Latency histograms of the hardware calls, as ``{signal: {operation: {...}}}``."""
+        return self.latency.as_dict()
+
+    def read_bank(self, pins: Sequence[int]) -> List[int]:
+        """Read the levels of several pins in a single backend transaction."""
+        start = time.perf_counter()
+        levels = self.backend.input_many(pins)
+        self.latency.record_since(self.name, "read_bank", start)
+        return levels
+
+    def write_bank(self, pins: Sequence[int], values: Sequence[int]):
+        """Write the levels of several output pins in a single backend transaction."""
+        start = time.perf_counter()
+        self.backend.output_many(pins, values)
+        self.latency.record_since(self.name, "write_bank", start)
+        self.pins_written(pins)
+
+    def pins_written(self, pins: Sequence[int]):
+        """Let the PWM engine re-assert the level of any of its channels on pins just written directly."""
+        if self.pwm_engine is not None:
+            self.pwm_engine.invalidate(pins)
+
+    def set_duty_cycles(self, pwms: Sequence, duty_cycles: Sequence[float]):
+        """Change the duty cycles of several PWM channels back to back."""
+        start = time.perf_counter()
+        if self.pwm_engine is not None:
+            self.pwm_engine.change_duty_cycles(pwms, duty_cycles)
+        else:
+            self.backend.change_duty_cycles(pwms, duty_cycles)
+        self.latency.record_since(self.name, "set_duty_cycles", start)
+
+
+_rpi_control_layer = None
+_control_layer_lock = threading.Lock()
+
+
+def configure_control_layer(
+    backend: Optional[GPIOBackend] = None, mode: str = "BCM", pwm_engine: bool = True
+) -> RpiControlLayer:
+    """
+    Create the default control layer with a given backend, pin numbering mode and PWM engine setting.
+    Must be called before the first signal is created, as the default is otherwise created on first use.
+    """
+    global _rpi_control_layer
+    with _control_layer_lock:
+        if _rpi_control_layer is not None:
+            raise RuntimeError("The default control layer has already been created.")
+        _rpi_control_layer = RpiControlLayer(backend=backend, mode=mode, pwm_engine=pwm_engine)
+        return _rpi_control_layer
+
+
+def get_control_layer() -> RpiControlLayer:
+    """
+    The default control layer, created on first use. Deferring it keeps `import rpi_bluesky.ophyd` from
+    setting the GPIO mode, starting dispatcher threads and importing RPi.GPIO.
+    """
+    global _rpi_control_layer
+    if _rpi_control_layer is None:
+        with _control_layer_lock:
+            if _rpi_control_layer is None:
+                _rpi_control_layer = RpiControlLayer()
+    return _rpi_control_layer
 
 
-rpi_control_layer = RpiControlLayer()
+def __getattr__(name):
+    # Backwards compatible access to the default control layer, without creating it at import
+    if name == "rpi_control_layer":
+        return get_control_layer()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 class RpiSignal(Signal):
@@ -72,37 +201,200 @@ class RpiSignal(Signal):
     name: str
         Name of the PV. Defaults to GPIO_pin_{pin_number}
     cl:
-        Control layer modeled after the default RPIControlLayer
+        Control layer modeled after the default RpiControlLayer. Hardware calls go through `cl.backend`.
     parent: OphydObject
         Parent object of the signal
+    cached_readback: bool
+        If True, `get` serves the last commanded value and its timestamp instead of sampling the pin.
+        The pin is only sampled by `verify`, or by `get` once `verify_interval` has elapsed. Defaults to False.
+    verify_interval: float, optional
+        Seconds after which a cached readback is refreshed from the pin. Defaults to never.
     kwargs:
         Keyword arguments passed to `ophyd.Signal.__init__`
     """
 
-    def __init__(self, pin_number=None, *, name=None, cl=None, parent=None, **kwargs):
+    def __init__(
+        self,
+        pin_number=None,
+        *,
+        name=None,
+        cl=None,
+        parent=None,
+        cached_readback=False,
+        verify_interval=None,
+        **kwargs,
+    ):
         if pin_number is None:
             if parent is None:
                 raise AttributeError("Either pin number or parent required for RpiSignal. None given.")
             else:
                 pin_number = parent.pin
 
-        GPIO.setup(pin_number, GPIO.OUT)
+        if cl is None:
+            cl = get_control_layer()
+        cl.backend.setup(pin_number, OUT)
         name = name or f"GPIO_pin_{pin_number}"
         self.pin = pin_number
-        if cl is None:
-            cl = rpi_control_layer
+        # (value, timestamp) read in bulk by the parent RpiDevice, served by the next read()
+        self._snapshot = None
+        self.cached_readback = cached_readback
+        self.verify_interval = verify_interval
+        self._last_verified = None
         super().__init__(name=name, cl=cl, parent=parent, **kwargs)
+        if self.cached_readback:
+            self.verify()
 
     def put(self, value, **kwargs):
-        GPIO.output(self.pin, value)
+        start = time.perf_counter()
+        self.cl.backend.output(self.pin, value)
+        self.cl.latency.record_since(self.name, "put", start)
+        self.cl.pins_written((self.pin,))
         super().put(value, **kwargs)
 
+    def set(self, value, **kwargs):
+        return trace_status(super().set(value, **kwargs), f"{self.name}.set")
+
+    def read(self):
+        if self._snapshot is None:
+            return super().read()
+        value, timestamp = self._snapshot
+        return {self.name: {"value": value, "timestamp": timestamp}}
+
     def get(self, **kwargs):
-        return GPIO.input(self.pin)
+        if not self.cached_readback:
+            start = time.perf_counter()
+            value = self.cl.backend.input(self.pin)
+            self.cl.latency.record_since(self.name, "get", start)
+            return value
+        if self.verify_interval is not None and time.monotonic() - self._last_verified >= self.verify_interval:
+            return self.verify()
+        return self._readback
+
+    def verify(self):
+        """Sample the pin, refreshing the cached readback and its timestamp, and return the level."""
+        start = time.perf_counter()
+        value = self.cl.backend.input(self.pin)
+        self.cl.latency.record_since(self.name, "get", start)
+        self._last_verified = time.monotonic()
+        self._readback = value
+        self._metadata["timestamp"] = time.time()
+        return value
+
+
+class RpiInputSignal(SignalRO):
+    """
+    A read only signal for a GPIO input pin, such as a button or a photogate.
+
+    Rather than polling the pin on every read, edge detection is registered with the backend. Each change of
+    level is pushed to subscribers from the control layer's monitor thread, stamped with the time of the edge,
+    and `get` serves the last level without touching the hardware.
+
+    Parameters
+    ----------
+    pin_number: int
+        Pin number for GPIO board
+    pull: str, optional
+        Internal pull resistor, "up" or "down". Defaults to none.
+    debounce_time: float
+        Time in seconds the level must be stable after an edge before the change is accepted.
+        Bounces inside this window are coalesced into one update. Defaults to 0, no debouncing.
+    name: str
+        Name of the PV. Defaults to GPIO_input_pin_{pin_number}
+    cl:
+        Control layer modeled after the default RpiControlLayer
+    parent: OphydObject
+        Parent object of the signal
+    kwargs:
+        Keyword arguments passed to `ophyd.SignalRO.__init__`
+    """
+
+    def __init__(
+        self, pin_number=None, *, pull=None, debounce_time=0.0, name=None, cl=None, parent=None, **kwargs
+    ):
+        if pin_number is None:
+            if parent is None:
+                raise AttributeError("Either pin number or parent required for RpiInputSignal. None given.")
+            else:
+                pin_number = parent.pin
+
+        if cl is None:
+            cl = get_control_layer()
+        cl.backend.setup(pin_number, IN, pull=pull)
+        name = name or f"GPIO_input_pin_{pin_number}"
+        self.pin = pin_number
+        self.debounce_time = debounce_time
+        self._debounce_timer = None
+        self._edge_timestamp = None
+        self._debounce_lock = threading.Lock()
+        super().__init__(name=name, cl=cl, parent=parent, value=cl.backend.input(pin_number), **kwargs)
+        self._monitor = self._dispatcher.get_thread_context("monitor")
+        cl.backend.add_event_detect(pin_number, BOTH, self._edge_callback)
+
+    def _edge_callback(self, pin):
+        timestamp = time.time()
+        if not self.debounce_time:
+            self._monitor(self._update_level, self.cl.backend.input(self.pin), timestamp)
+            return
+        with self._debounce_lock:
+            if self._debounce_timer is not None:
+                self._debounce_timer.cancel()
+            else:
+                # Report the time of the first edge in a burst of bounces
+                self._edge_timestamp = timestamp
+            self._debounce_timer = threading.Timer(self.debounce_time, self._debounce_settled)
+            self._debounce_timer.daemon = True
+            self._debounce_timer.start()
+
+    def _debounce_settled(self):
+        with self._debounce_lock:
+            self._debounce_timer = None
+            timestamp = self._edge_timestamp
+        self._monitor(self._update_level, self.cl.backend.input(self.pin), timestamp)
+
+    def _update_level(self, value, timestamp):
+        old_value = self._readback
+        if value == old_value:
+            return
+        self._readback = value
+        self._metadata["timestamp"] = timestamp
+        self._run_subs(sub_type=self.SUB_VALUE, old_value=old_value, value=value, timestamp=timestamp)
+
+    def edge_status(self, edge: str = BOTH, timeout: Optional[float] = None) -> SubscriptionStatus:
+        """
+        Status that finishes on the next accepted edge.
+
+        Parameters
+        ----------
+        edge: str
+            "rising", "falling" or "both"
+        timeout: float, optional
+            Seconds to wait before the status fails
+        """
+
+        def check(*, old_value, value, **kwargs):
+            return value != old_value and (edge == BOTH or value == (edge == RISING))
+
+        return SubscriptionStatus(self, check, timeout=timeout, run=False)
+
+    def destroy(self):
+        self.cl.backend.remove_event_detect(self.pin)
+        with self._debounce_lock:
+            if self._debounce_timer is not None:
+                self._debounce_timer.cancel()
+        super().destroy()
 
 
 class RpiPWM(Signal):
-    """Pulsed width modulation that changes only the duty cylce of the PWM at fixed frequency"""
+    """
+    Pulsed width modulation that changes only the duty cylce of the PWM at fixed frequency.
+
+    `put` changes the duty cycle and returns immediately. `set` does the same, and returns a Status that
+    finishes on a timer once the output has settled (default one PWM period), so that several PWMs moved
+    together overlap their settle windows and the calling thread is never put to sleep.
+
+    `play_waveform` uploads a whole array of duty cycles that a background thread plays back at a fixed sample
+    period, for ramps and intensity profiles far faster than one bluesky message per point allows.
+    """
 
     dc_bounds = (0, 100)
 
@@ -115,23 +407,121 @@ class RpiPWM(Signal):
             else:
                 pin_number = parent.pin
         self.pin = pin_number
-        self.pwm = GPIO.PWM(pin_number, frequency)
+        if cl is None:
+            cl = get_control_layer()
+        self.pwm = cl.pwm(pin_number, frequency)
         self.pwm.start(0)
         self._current_duty_cycle = 0
         self._settle_time = settle_time or 1.0 / frequency
+        self._waveform_thread = None
+        self._waveform_abort = threading.Event()
+        self.waveform_timestamps = np.zeros(0)
         name = name or f"PWM_pin_{pin_number}"
-        if cl is None:
-            cl = rpi_control_layer
         super().__init__(name=name, cl=cl, parent=parent, **kwargs)
 
-    def put(self, value, **kwargs):
+    def check_value(self, value):
         if value < self.dc_bounds[0] or value > self.dc_bounds[1]:
             raise ValueError(f"Duty cycle must be between 0 and 100%. {value} is an invalid set point.")
+
+    def put(self, value, **kwargs):
+        self.check_value(value)
+        self.stop_waveform()
+        start = time.perf_counter()
         self.pwm.ChangeDutyCycle(value)
+        self.cl.latency.record_since(self.name, "put", start)
         self._current_duty_cycle = value
         super().put(value, **kwargs)
-        if self._settle_time:
-            time.sleep(self._settle_time)
+
+    def play_waveform(self, waveform: Sequence[float], period: float) -> Status:
+        """
+        Play back a preloaded array of duty cycles, one sample every `period` seconds, on a background thread.
+
+        Samples are scheduled against the start time rather than the previous sample, so late samples do not
+        accumulate drift. The wall clock time each sample was actually written is recorded in
+        `waveform_timestamps`, NaN for samples not reached. A `put`, `set` or new waveform stops the playback.
+
+        Parameters
+        ----------
+        waveform: Sequence[float]
+            Duty cycles in percent
+        period: float
+            Seconds between samples
+
+        Returns
+        -------
+        status: Status
+            Finishes once the last sample has been written and settled, or fails if the playback is stopped.
+        """
+        waveform = np.asarray(waveform, dtype=float)
+        if waveform.ndim != 1 or len(waveform) == 0:
+            raise ValueError("The waveform must be a non-empty 1D array of duty cycles.")
+        if period <= 0:
+            raise ValueError(f"The sample period must be greater than 0. {period} is invalid.")
+        for value in (waveform.min(), waveform.max()):
+            self.check_value(value)
+        self.stop_waveform()
+
+        status = Status(self, settle_time=self._settle_time)
+        self.waveform_timestamps = timestamps = np.full(len(waveform), np.nan)
+        self._waveform_abort = abort = threading.Event()
+        self._waveform_thread = threading.Thread(
+            target=self._play,
+            args=(waveform, period, timestamps, abort, status),
+            name=f"{self.name}_waveform",
+            daemon=True,
+        )
+        self._waveform_thread.start()
+        return status
+
+    def _play(self, waveform, period, timestamps, abort, status):
+        start = time.monotonic()
+        offset = time.time() - start
+        try:
+            for i, value in enumerate(waveform.tolist()):
+                delay = start + i * period - time.monotonic()
+                if delay > 0:
+                    abort.wait(delay)
+                if abort.is_set():
+                    status.set_exception(RuntimeError(f"Waveform playback on {self.name} was stopped."))
+                    return
+                self.pwm.ChangeDutyCycle(value)
+                timestamps[i] = time.monotonic() + offset
+                self._current_duty_cycle = value
+        except Exception as ex:
+            status.set_exception(ex)
+            return
+        # Update the readback and run subscriptions once, for the final value
+        Signal.put(self, self._current_duty_cycle)
+        status.set_finished()
+
+    def stop_waveform(self):
+        """Stop a waveform being played back, leaving the duty cycle at the last sample written."""
+        thread = self._waveform_thread
+        if thread is not None and thread is not threading.current_thread():
+            self._waveform_abort.set()
+            thread.join()
+            self._waveform_thread = None
+
+    def set(self, value, *, timeout=None, settle_time=None, **kwargs):
+        """
+        Change the duty cycle and return a Status that finishes after the settle time.
+
+        Parameters
+        ----------
+        value: float
+            Duty cycle in percent
+        timeout: float, optional
+            Unused, as the write completes before returning. Kept for API compatibility with `ophyd.Signal`.
+        settle_time: float, optional
+            Overrides the settle time given at construction
+        """
+        start = time.perf_counter()
+        self.put(value, **kwargs)
+        status = Status(self, settle_time=self._settle_time if settle_time is None else settle_time)
+        status.add_callback(lambda st: self.cl.latency.record(self.name, "set", time.perf_counter() - start))
+        trace_status(status, f"{self.name}.set")
+        status.set_finished()
+        return status
 
     def get(self, **kwargs):
         return self._current_duty_cycle
@@ -156,3 +546,78 @@ class RpiDevice(Device):
     def __init__(self, pin: Optional[int] = -1, *, name: str, **kwargs):
         self.pin = pin
         super().__init__(pin, name=name, **kwargs)
+
+    def read(self):
+        """
+        Read every GPIO pin in the device tree with one bulk transaction per control layer,
+        instead of one transaction per signal. PWM signals and RpiSignals with a cached readback
+        are served without touching the hardware.
+        """
+        signals = [
+            sig
+            for sig in (getattr(self, attr) for attr in self.read_attrs)
+            if isinstance(sig, RpiSignal) and not sig.cached_readback and sig._snapshot is None
+        ]
+        if len(signals) < 2:
+            return super().read()
+        timestamp = time.time()
+        for cl, group in _group_by_control_layer(signals).items():
+            for sig, value in zip(group, cl.read_bank([sig.pin for sig in group])):
+                sig._snapshot = (value, timestamp)
+        try:
+            return super().read()
+        finally:
+            for sig in signals:
+                sig._snapshot = None
+
+    def set(self, values: Mapping[str, Any]):
+        """
+        Write several pins and PWM duty cycles of the device tree in one pass through the control layer.
+
+        Parameters
+        ----------
+        values: Mapping[str, Any]
+            Map from (dotted) attribute name of an RpiSignal or RpiPWM in this device to its new value,
+            e.g. ``{"red.io": 1, "red.pwm": 50.0}``.
+
+        Returns
+        -------
+        status: DeviceStatus
+            Finishes after the longest settle time of the PWMs that were changed.
+        """
+        signals, pwms = [], []
+        for attr, value in values.items():
+            sig = getattr(self, attr)
+            if isinstance(sig, RpiSignal):
+                signals.append((sig, value))
+            elif isinstance(sig, RpiPWM):
+                sig.check_value(value)
+                sig.stop_waveform()
+                pwms.append((sig, value))
+            else:
+                raise TypeError(f"{attr} is not an RpiSignal or RpiPWM of {self.name}.")
+
+        for cl, group in _group_by_control_layer(signals).items():
+            cl.write_bank([sig.pin for sig, _ in group], [value for _, value in group])
+        for cl, group in _group_by_control_layer(pwms).items():
+            cl.set_duty_cycles([sig.pwm for sig, _ in group], [value for _, value in group])
+            for sig, value in group:
+                sig._current_duty_cycle = value
+
+        # Update readbacks and run subscriptions without touching the hardware again
+        for sig, value in signals + pwms:
+            Signal.put(sig, value)
+
+        status = DeviceStatus(self, settle_time=max((sig._settle_time for sig, _ in pwms), default=0))
+        trace_status(status, f"{self.name}.set")
+        status.set_finished()
+        return status
+
+
+def _group_by_control_layer(items):
+    """Group signals, or (signal, value) pairs, by the control layer that owns them."""
+    groups = {}
+    for item in items:
+        sig = item[0] if isinstance(item, tuple) else item
+        groups.setdefault(sig.cl, []).append(item)
+    return groups
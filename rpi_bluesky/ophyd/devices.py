@@ -1,14 +1,186 @@
+import json
+from collections.abc import Mapping
+
+import numpy as np
+from ophyd import DeviceStatus, Signal, SignalRO
+
 from rpi_bluesky.ophyd import RpiComponent, RpiDevice, RpiPWM, RpiSignal
+from rpi_bluesky.ophyd.base import get_control_layer
+from rpi_bluesky.ophyd.tracing import trace_status
 
 
 class LED(RpiDevice):
     io = RpiComponent(RpiSignal, name="io")
     pwm = RpiComponent(RpiPWM, name="pwm")
 
+    def play_waveform(self, waveform, period):
+        """Switch the LED on and play back an array of duty cycles. See `RpiPWM.play_waveform`."""
+        self.io.put(1)
+        return self.pwm.play_waveform(waveform, period)
+
+
+class RGBColor(SignalRO):
+    """The (red, green, blue) duty cycles of the parent RGB_LED as one reading, served from the PWM readbacks."""
+
+    def get(self, **kwargs):
+        return [led.pwm.get() for led in self.parent.channels]
+
+    @property
+    def timestamp(self):
+        return max(led.pwm.timestamp for led in self.parent.channels)
+
+    def describe(self):
+        # Because this isn't a simple scalar we need to update the describe dictionary entry
+        ret = super().describe()
+        ret[f"{self.name}"].update(
+            dict(
+                dtype="array",
+                shape=[3],
+            )
+        )
+        return ret
+
 
 class RGB_LED(RpiDevice):
-    """Notice how this device requires hard coding of the channels"""
+    """
+    Notice how this device requires hard coding of the channels
+
+    `set` takes a (red, green, blue) triple of duty cycles, and `color` reads them back together.
+    """
 
     red = RpiComponent(LED, pin=17, name="red")
     green = RpiComponent(LED, pin=27, name="green")
     blue = RpiComponent(LED, pin=22, name="blue")
+    color = RpiComponent(RGBColor, name="color", kind="hinted")
+
+    @property
+    def channels(self):
+        return self.red, self.green, self.blue
+
+    def set(self, value):
+        """
+        Change all three duty cycles back to back in one pass through the control layer.
+
+        Parameters
+        ----------
+        value: tuple or Mapping
+            (red, green, blue) duty cycles in percent, or a mapping of attribute names as for `RpiDevice.set`
+
+        Returns
+        -------
+        status: DeviceStatus
+            Finishes after a single settle window, the longest of the three PWMs.
+        """
+        if isinstance(value, Mapping):
+            return super().set(value)
+        if len(value) != 3:
+            raise ValueError(f"A color needs a duty cycle for each of red, green and blue. {value} is invalid.")
+        return super().set({f"{led.attr_name}.pwm": duty_cycle for led, duty_cycle in zip(self.channels, value)})
+
+
+class LEDArrayDutyCycles(Signal):
+    """The duty cycles of every channel of the parent LEDArray as one array reading. `put` goes to the parent."""
+
+    def put(self, value, **kwargs):
+        self.parent.set(value).wait()
+
+    def describe(self):
+        # Because this isn't a simple scalar we need to update the describe dictionary entry
+        ret = super().describe()
+        ret[f"{self.name}"].update(
+            dict(
+                dtype="array",
+                shape=[len(self.parent.pins)],
+            )
+        )
+        return ret
+
+
+class LEDArray(RpiDevice):
+    """
+    An arbitrary number of PWM driven LEDs, set and read as one vector of duty cycles.
+
+    Parameters
+    ----------
+    pins: Sequence[int]
+        GPIO pin of each channel, in order
+    labels: Sequence[str], optional
+        Label of each channel, e.g. its wavelength. Defaults to the pin numbers.
+    frequency: float
+        PWM frequency of every channel. Defaults to 100 Hz.
+    settle_time: float, optional
+        Settle time after a set. Defaults to one PWM period.
+    name: str
+        Name of the device
+    cl:
+        Control layer modeled after the default RpiControlLayer
+    """
+
+    duty_cycles = RpiComponent(LEDArrayDutyCycles, name="duty_cycles", kind="hinted")
+
+    def __init__(self, pins, *, labels=None, frequency=100.0, settle_time=None, name, cl=None, **kwargs):
+        self.pins = [int(pin) for pin in pins]
+        if len(set(self.pins)) != len(self.pins):
+            raise ValueError(f"Pins must be unique. {self.pins} is invalid.")
+        self.labels = [str(label) for label in labels] if labels is not None else [str(pin) for pin in self.pins]
+        if len(self.labels) != len(self.pins):
+            raise ValueError("There must be one label per pin.")
+        if cl is None:
+            cl = get_control_layer()
+        self.cl = cl
+        self._settle_time = settle_time or 1.0 / frequency
+        self.pwms = []
+        for pin in self.pins:
+            pwm = cl.pwm(pin, frequency)
+            pwm.start(0)
+            self.pwms.append(pwm)
+        self._current = np.zeros(len(self.pins))
+        super().__init__(name=name, **kwargs)
+        Signal.put(self.duty_cycles, self._current.copy())
+
+    @classmethod
+    def from_pin_map(cls, path, *, name, **kwargs):
+        """
+        Build an LEDArray from a JSON pin map, either a list of pins or an object of ``{label: pin}`` in order.
+
+        Parameters
+        ----------
+        path: str or Path
+            Pin map file
+        name: str
+            Name of the device
+        kwargs:
+            Keyword arguments passed to `LEDArray.__init__`
+        """
+        with open(path) as f:
+            pin_map = json.load(f)
+        if isinstance(pin_map, Mapping):
+            return cls(list(pin_map.values()), labels=list(pin_map), name=name, **kwargs)
+        return cls(pin_map, name=name, **kwargs)
+
+    def set(self, value):
+        """
+        Change the duty cycles of the array, touching only the channels that differ from the current state.
+
+        Parameters
+        ----------
+        value: array_like
+            Duty cycle in percent of every channel, or a scalar for all of them
+
+        Returns
+        -------
+        status: DeviceStatus
+            Finishes after the settle time, or immediately if nothing changed.
+        """
+        values = np.broadcast_to(np.asarray(value, dtype=float), self._current.shape)
+        if values.min() < RpiPWM.dc_bounds[0] or values.max() > RpiPWM.dc_bounds[1]:
+            raise ValueError(f"Duty cycles must be between 0 and 100%. {value} is an invalid set point.")
+        changed = np.flatnonzero(values != self._current)
+        if len(changed):
+            self.cl.set_duty_cycles([self.pwms[i] for i in changed], values[changed].tolist())
+            self._current[changed] = values[changed]
+            Signal.put(self.duty_cycles, self._current.copy())
+        status = DeviceStatus(self, settle_time=self._settle_time if len(changed) else 0)
+        trace_status(status, f"{self.name}.set")
+        status.set_finished()
+        return status
@@ -0,0 +1,196 @@
+"""
+Latency histograms of the hardware calls made through a control layer.
+
+Every histogram has the same fixed, logarithmically spaced buckets, so recording a call is a binary search and
+two unlocked additions. Under the GIL a count may very rarely be lost when two threads record into the same
+histogram at once, which is an acceptable price for keeping locks off the hardware paths.
+"""
+
+import bisect
+import os
+import time
+from pathlib import Path
+
+from rpi_bluesky.ophyd import tracing
+
+# Upper bounds in seconds, from 1 us doubling up to about 16 s, with everything slower in an overflow bucket
+DEFAULT_BOUNDS = tuple(1e-6 * 2**k for k in range(25))
+
+
+class LatencyHistogram:
+    """Counts of latencies in fixed buckets, and their sum."""
+
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds=DEFAULT_BOUNDS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def record(self, seconds: float):
+        self.counts[bisect.bisect_left(self.bounds, seconds)] += 1
+        self.sum += seconds
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the `q` quantile, or infinity if it is in the overflow bucket."""
+        rank = q * self.count
+        total = 0
+        for bound, count in zip(self.bounds, self.counts):
+            total += count
+            if total >= rank and total > 0:
+                return bound
+        return float("inf")
+
+    def as_dict(self) -> dict:
+        count = self.count
+        return dict(
+            count=count,
+            sum=self.sum,
+            mean=self.sum / count if count else 0.0,
+            p50=self.quantile(0.5),
+            p99=self.quantile(0.99),
+            bounds=list(self.bounds),
+            counts=list(self.counts),
+        )
+
+
+class LatencyRecorder:
+    """
+    Latency histograms keyed by signal name and operation, e.g. ``("led", "put")``.
+
+    Parameters
+    ----------
+    bounds: tuple
+        Upper bounds of the buckets in seconds, shared by every histogram
+    enabled: bool
+        Record latencies. Defaults to True.
+    """
+
+    metric = "rpi_bluesky_hardware_latency_seconds"
+
+    def __init__(self, bounds=DEFAULT_BOUNDS, enabled=True):
+        self.bounds = tuple(bounds)
+        self.enabled = enabled
+        self._histograms = {}
+
+    def record(self, signal: str, operation: str, seconds: float):
+        if not self.enabled:
+            return
+        histogram = self._histograms.get((signal, operation))
+        if histogram is None:
+            histogram = self._histograms.setdefault((signal, operation), LatencyHistogram(self.bounds))
+        histogram.record(seconds)
+
+    def record_since(self, signal: str, operation: str, start: float):
+        """
+        Record the time elapsed since `start`, a `time.perf_counter()` reading, for a call made on this thread.
+        The call is also recorded as a hardware span when tracing.
+        """
+        end = time.perf_counter()
+        self.record(signal, operation, end - start)
+        tracer = tracing.get_tracer()
+        if tracer is not None:
+            tracer.complete(f"{signal}.{operation}", "hardware", start, end)
+
+    def histograms(self) -> dict:
+        """The histograms, keyed by (signal, operation)."""
+        return dict(self._histograms)
+
+    def as_dict(self) -> dict:
+        """Summary and bucket counts of every histogram, as ``{signal: {operation: {...}}}``."""
+        summary = {}
+        for (signal, operation), histogram in sorted(self._histograms.items()):
+            summary.setdefault(signal, {})[operation] = histogram.as_dict()
+        return summary
+
+    def reset(self):
+        self._histograms = {}
+
+    def to_prometheus(self) -> str:
+        """The histograms in the Prometheus text exposition format."""
+        lines = [
+            f"# HELP {self.metric} Latency of hardware calls made through the rpi_bluesky control layer.",
+            f"# TYPE {self.metric} histogram",
+        ]
+        for (signal, operation), histogram in sorted(self._histograms.items()):
+            labels = f'signal="{_escape(signal)}",operation="{_escape(operation)}"'
+            total = 0
+            for bound, count in zip(histogram.bounds, histogram.counts):
+                total += count
+                lines.append(f'{self.metric}_bucket{{{labels},le="{bound:.6g}"}} {total}')
+            total += histogram.counts[-1]
+            lines.append(f'{self.metric}_bucket{{{labels},le="+Inf"}} {total}')
+            lines.append(f"{self.metric}_sum{{{labels}}} {histogram.sum:.9g}")
+            lines.append(f"{self.metric}_count{{{labels}}} {total}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        """
+        Write the histograms to a Prometheus textfile, e.g. for the node exporter's textfile collector.
+        The file is written aside and renamed into place, so the collector never reads a partial file.
+        """
+        path = Path(path)
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        tmp.write_text(self.to_prometheus())
+        os.replace(tmp, path)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class LatencyReadable:
+    """
+    The histograms of a recorder as a bluesky readable, one count array per (signal, operation) plus their sums.
+    The keys follow the histograms present when read, so read it once per run, e.g. with `record_latency_wrapper`.
+
+    Parameters
+    ----------
+    recorder: LatencyRecorder
+        Histograms to read
+    name: str
+        Prefix of the data keys
+    """
+
+    def __init__(self, recorder, name="latency"):
+        self.recorder = recorder
+        self.name = name
+        self.parent = None
+        self.hints = {"fields": []}
+
+    def _key(self, signal, operation):
+        return f"{self.name}_{signal}_{operation}"
+
+    def read(self):
+        timestamp = time.time()
+        reading = {f"{self.name}_bounds": {"value": list(self.recorder.bounds), "timestamp": timestamp}}
+        for (signal, operation), histogram in sorted(self.recorder.histograms().items()):
+            key = self._key(signal, operation)
+            reading[f"{key}_counts"] = {"value": list(histogram.counts), "timestamp": timestamp}
+            reading[f"{key}_sum"] = {"value": histogram.sum, "timestamp": timestamp}
+        return reading
+
+    def describe(self):
+        source = f"rpi_bluesky:{self.name}"
+        description = {
+            f"{self.name}_bounds": {"source": source, "dtype": "array", "shape": [len(self.recorder.bounds)]}
+        }
+        for signal, operation in sorted(self.recorder.histograms()):
+            key = self._key(signal, operation)
+            description[f"{key}_counts"] = {
+                "source": source,
+                "dtype": "array",
+                "shape": [len(self.recorder.bounds) + 1],
+            }
+            description[f"{key}_sum"] = {"source": source, "dtype": "number", "shape": []}
+        return description
+
+    def read_configuration(self):
+        return {}
+
+    def describe_configuration(self):
+        return {}
@@ -0,0 +1,265 @@
+"""
+Software PWM for many channels from a single scheduler thread.
+
+RPi.GPIO runs a busy thread for every PWM channel, so an LED array quickly saturates a Pi. The PWMEngine instead
+keeps every channel's timing in NumPy arrays and runs one thread that sleeps until the next edge of any channel,
+then writes every pin due to change in one bulk backend call. Channels at 0 or 100% cost nothing after their
+level is written once, unless the pin is written elsewhere, and channels sharing a frequency share their rising
+edge, so the CPU used grows much more slowly than the number of channels.
+"""
+
+import logging
+import threading
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class SoftPWMChannel:
+    """
+    One PWM channel driven by a PWMEngine. Follows the ``RPi.GPIO.PWM`` API, so it is a drop-in replacement
+    for the channels returned by a backend.
+    """
+
+    def __init__(self, engine: "PWMEngine", pin: int, frequency: float):
+        if frequency <= 0:
+            raise ValueError(f"Frequency must be greater than 0. {frequency} is invalid.")
+        self.engine = engine
+        self.pin = pin
+        self.frequency = frequency
+        self.duty_cycle = 0.0
+        self.running = False
+        # Exception that made the engine drop the channel, raised by the next call
+        self.error = None
+        # Time the current period train started, and the last level written to the pin (-1 for unknown)
+        self._t0 = 0.0
+        self._level = -1
+
+    def _check_error(self):
+        if self.error is not None:
+            raise RuntimeError(
+                f"PWM on GPIO channel {self.pin} stopped after an error: {self.error}"
+            ) from self.error
+
+    def start(self, duty_cycle: float):
+        self._check_duty_cycle(duty_cycle)
+        self.engine._start(self, duty_cycle)
+
+    def ChangeDutyCycle(self, duty_cycle: float):
+        self._check_duty_cycle(duty_cycle)
+        self._check_error()
+        self.engine._update(((self, duty_cycle),))
+
+    def ChangeFrequency(self, frequency: float):
+        if frequency <= 0:
+            raise ValueError(f"Frequency must be greater than 0. {frequency} is invalid.")
+        with self.engine._condition:
+            self.frequency = frequency
+            self.engine._changed()
+
+    def stop(self):
+        self.engine._stop_channel(self)
+
+    @staticmethod
+    def _check_duty_cycle(duty_cycle):
+        if duty_cycle < 0 or duty_cycle > 100:
+            raise ValueError(f"Duty cycle must be between 0 and 100%. {duty_cycle} is invalid.")
+
+
+class PWMEngine:
+    """
+    Scheduler that drives all software PWM channels of a backend from one thread.
+
+    Parameters
+    ----------
+    backend: GPIOBackend
+        Backend whose pins are toggled with `output_many`. Pins must already be set up as outputs. A channel
+        whose pin cannot be written is dropped, and its next call raises, without stopping the other channels.
+    resolution: float
+        Edges closer together than this many seconds are written together. Defaults to 100 us.
+    """
+
+    def __init__(self, backend, resolution: float = 1e-4):
+        self.backend = backend
+        self.resolution = resolution
+        self.cpu_time = 0.0
+        self.writes = 0
+        self._channels = []
+        self._released = []
+        # Pins of running channels, and those written elsewhere whose level must be written again
+        self._pins = set()
+        self._invalidated = set()
+        self._dirty = True
+        self._stopping = False
+        self._thread = None
+        self._condition = threading.Condition()
+
+    def pwm(self, pin: int, frequency: float) -> SoftPWMChannel:
+        """Create a channel on an output pin. It is driven once started."""
+        return SoftPWMChannel(self, pin, frequency)
+
+    @property
+    def threads(self) -> int:
+        """Number of threads the engine runs, 1 once any channel has started, otherwise 0."""
+        return int(self._thread is not None and self._thread.is_alive())
+
+    def stats(self) -> dict:
+        """Threads, channels and CPU time of the engine, for inspection."""
+        with self._condition:
+            return dict(
+                threads=self.threads,
+                channels=len(self._channels),
+                cpu_time=self.cpu_time,
+                writes=self.writes,
+            )
+
+    def change_duty_cycles(self, channels, duty_cycles):
+        """Change the duty cycles of several channels at once, waking the scheduler a single time."""
+        channels = list(channels)
+        for channel, duty_cycle in zip(channels, duty_cycles):
+            SoftPWMChannel._check_duty_cycle(duty_cycle)
+            channel._check_error()
+        self._update(zip(channels, duty_cycles))
+
+    def invalidate(self, pins):
+        """
+        Note pins written outside the engine. Their channels write their level again straight away, so a pin
+        at 0 or 100% is held there as RPi.GPIO's software PWM would, rather than left as last written.
+        """
+        pins = self._pins.intersection(pins)
+        if pins:
+            with self._condition:
+                self._invalidated.update(pins)
+                self._changed()
+
+    def _changed(self):
+        # Must hold the condition
+        self._dirty = True
+        self._condition.notify()
+
+    def _start(self, channel, duty_cycle):
+        with self._condition:
+            if self._stopping:
+                raise RuntimeError("The PWM engine has been stopped.")
+            channel.error = None
+            channel.duty_cycle = duty_cycle
+            channel._t0 = time.monotonic()
+            if not channel.running:
+                channel.running = True
+                self._channels.append(channel)
+                self._pins.add(channel.pin)
+            self._changed()
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="rpi_pwm_engine", daemon=True)
+                self._thread.start()
+
+    def _update(self, pairs):
+        with self._condition:
+            for channel, duty_cycle in pairs:
+                channel.duty_cycle = duty_cycle
+            self._changed()
+
+    def _stop_channel(self, channel):
+        with self._condition:
+            if channel.running:
+                self._remove(channel)
+                self._released.append(channel.pin)
+                self._changed()
+
+    def _remove(self, channel):
+        # Must hold the condition
+        channel.running = False
+        self._channels.remove(channel)
+        self._pins = {ch.pin for ch in self._channels}
+
+    def stop(self):
+        """Stop the scheduler thread. Pins are left as they are, for the backend's cleanup."""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        try:
+            self._schedule()
+        except Exception as ex:
+            logger.exception("The PWM engine stopped after an error.")
+            # Fail every channel rather than leave them looking driven, and let the next start run a new thread
+            with self._condition:
+                for channel in list(self._channels):
+                    channel.error = ex
+                    self._remove(channel)
+
+    def _write(self, channels, pins, levels):
+        """
+        Write levels in one bulk call. If that fails, write pin by pin, dropping the channels whose pin fails.
+        Must hold the condition. Returns True if any channel was dropped.
+        """
+        try:
+            self.backend.output_many(pins, levels)
+            return False
+        except Exception:
+            pass
+        dropped = False
+        for channel, pin, level in zip(channels, pins, levels):
+            try:
+                self.backend.output(pin, level)
+            except Exception as ex:
+                logger.error("Dropping the PWM channel on GPIO channel %d: %s", pin, ex)
+                channel.error = ex
+                self._remove(channel)
+                dropped = True
+        return dropped
+
+    def _schedule(self):
+        cpu_start = time.thread_time()
+        channels, pins, levels = [], np.zeros(0, dtype=int), np.zeros(0, dtype=np.int8)
+        t0 = period = high_time = np.zeros(0)
+        dynamic = np.zeros(0, dtype=bool)
+        with self._condition:
+            while not self._stopping:
+                if self._dirty:
+                    for channel, level in zip(channels, levels):
+                        channel._level = -1 if channel.pin in self._invalidated else int(level)
+                    self._invalidated.clear()
+                    if self._released:
+                        released = [pin for pin in self._released if pin not in self._pins]
+                        try:
+                            self.backend.output_many(released, [0] * len(released))
+                        except Exception as ex:
+                            logger.error("Could not set released PWM pins %s low: %s", released, ex)
+                        self._released = []
+                    channels = list(self._channels)
+                    pins = np.array([ch.pin for ch in channels], dtype=int)
+                    levels = np.array([ch._level for ch in channels], dtype=np.int8)
+                    t0 = np.array([ch._t0 for ch in channels])
+                    period = np.array([1.0 / ch.frequency for ch in channels])
+                    high_time = period * np.array([ch.duty_cycle for ch in channels]) / 100.0
+                    dynamic = (high_time > 0) & (high_time < period)
+                    self._dirty = False
+
+                now = time.monotonic()
+                phase = (now - t0) % period
+                want = (phase < high_time).astype(np.int8)
+                changed = want != levels
+                if changed.any():
+                    changed_channels = [channel for channel, c in zip(channels, changed) if c]
+                    dropped = self._write(changed_channels, pins[changed].tolist(), want[changed].tolist())
+                    levels = want
+                    self.writes += 1
+                    if dropped:
+                        # Rebuild the arrays without the dropped channels before going on
+                        self._dirty = True
+                        continue
+
+                if dynamic.any():
+                    to_edge = np.where(want, high_time - phase, period - phase)[dynamic]
+                    timeout = max(float(to_edge.min()), self.resolution)
+                else:
+                    timeout = None
+                self.cpu_time = time.thread_time() - cpu_start
+                self._condition.wait(timeout)
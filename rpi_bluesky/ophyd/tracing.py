@@ -0,0 +1,135 @@
+"""
+Spans across the bluesky, ophyd and hardware layers, exported in the Chrome trace event format.
+
+While a `Tracer` is active, the hardware calls timed by the control layer, the Statuses returned by the devices
+and, with `rpi_bluesky.preprocessors.trace_wrapper`, the messages of a plan are recorded as spans. The file
+written by `Tracer.save` opens in Perfetto (ui.perfetto.dev) or chrome://tracing, showing each plan message
+with the device and GPIO or I2C calls it caused nested below it. When no tracer is active every hook returns
+immediately.
+"""
+
+import contextlib
+import itertools
+import json
+import os
+import threading
+import time
+
+_tracer = None
+
+
+class Tracer:
+    """Collects trace events. Appending to a list is atomic, so spans are recorded from any thread unlocked."""
+
+    def __init__(self):
+        self.events = []
+        self._t0 = time.perf_counter()
+        self._pid = os.getpid()
+        self._ids = itertools.count()
+        self._threads = {}
+
+    def _us(self, t: float) -> float:
+        return (t - self._t0) * 1e6
+
+    def _tid(self) -> int:
+        thread = threading.current_thread()
+        self._threads.setdefault(thread.ident, thread.name)
+        return thread.ident
+
+    def complete(self, name: str, category: str, start: float, end: float = None, args: dict = None):
+        """A span on the current thread, from `start` to `end` (default now), both `time.perf_counter()`."""
+        end = time.perf_counter() if end is None else end
+        event = dict(
+            name=name, cat=category, ph="X", ts=self._us(start), dur=self._us(end) - self._us(start), pid=self._pid
+        )
+        event["tid"] = self._tid()
+        if args:
+            event["args"] = args
+        self.events.append(event)
+
+    @contextlib.contextmanager
+    def span(self, name: str, category: str, args: dict = None):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.complete(name, category, start, args=args)
+
+    def status(self, status, name: str, category: str = "ophyd"):
+        """An asynchronous span from now until `status` finishes, which may be on another thread."""
+        span_id = next(self._ids)
+        common = dict(name=name, cat=category, id=span_id, pid=self._pid, tid=self._tid())
+        self.events.append(dict(common, ph="b", ts=self._us(time.perf_counter())))
+
+        def finished(st):
+            end = dict(common, ph="e", ts=self._us(time.perf_counter()))
+            end["args"] = {"success": st.success}
+            self.events.append(end)
+
+        status.add_callback(finished)
+        return status
+
+    def to_dict(self) -> dict:
+        metadata = [
+            dict(name="thread_name", ph="M", pid=self._pid, tid=tid, args={"name": name})
+            for tid, name in list(self._threads.items())
+        ]
+        return {"traceEvents": metadata + list(self.events), "displayTimeUnit": "ms"}
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f)
+
+
+def get_tracer():
+    """The active tracer, or None."""
+    return _tracer
+
+
+def start_tracing() -> Tracer:
+    """Start recording spans into a new tracer, and return it."""
+    global _tracer
+    _tracer = Tracer()
+    return _tracer
+
+
+def stop_tracing(path=None) -> Tracer:
+    """Stop recording, writing the trace to `path` if given, and return the tracer."""
+    global _tracer
+    tracer, _tracer = _tracer, None
+    if tracer is not None and path is not None:
+        tracer.save(path)
+    return tracer
+
+
+@contextlib.contextmanager
+def tracing(path=None):
+    """
+    Record spans for the duration of the block, then write them to `path` if given.
+
+    Examples
+    --------
+    >>> with tracing("random_walk.json"):
+    ...     RE(trace_wrapper(random_walk(led, [det], timeout=2)))
+    """
+    tracer = start_tracing()
+    try:
+        yield tracer
+    finally:
+        stop_tracing(path)
+
+
+def span(name: str, category: str = "hardware", args: dict = None):
+    """A span of the active tracer, or a no-op context when not tracing."""
+    tracer = _tracer
+    if tracer is None:
+        return contextlib.nullcontext()
+    return tracer.span(name, category, args)
+
+
+def trace_status(status, name: str, category: str = "ophyd"):
+    """Record `status` as an asynchronous span of the active tracer, if any, and return it."""
+    tracer = _tracer
+    if tracer is not None:
+        tracer.status(status, name, category)
+    return status
@@ -0,0 +1,127 @@
+"""Plan stubs that build on the Raspberry Pi ophyd objects."""
+
+import asyncio
+
+import bluesky.plan_stubs as bps
+import bluesky.preprocessors as bpp
+from bluesky.run_engine import WaitForTimeoutError
+
+from rpi_bluesky.ophyd.backends import BOTH
+
+
+def wait_for_edge(signal, edge=BOTH, timeout=None):
+    """
+    Suspend the plan until an RpiInputSignal sees an edge, instead of polling it with `bps.rd`.
+
+    Parameters
+    ----------
+    signal: RpiInputSignal
+        Input pin to wait on
+    edge: str
+        "rising", "falling" or "both"
+    timeout: float, optional
+        Seconds to wait before raising `bluesky.run_engine.WaitForTimeoutError`
+
+    Returns
+    -------
+    value: int
+        Level of the pin after the edge
+    """
+    status = signal.edge_status(edge, timeout=timeout)
+    yield from _wait_for_status(status, timeout)
+    return signal.get()
+
+
+def play_waveform(pwm, waveform, period, timeout=None):
+    """
+    Play back an array of duty cycles on an RpiPWM or LED and wait for it to finish, in one plan message
+    instead of a `mv` and settle per point.
+
+    Parameters
+    ----------
+    pwm: RpiPWM or LED
+        Output to play the waveform on
+    waveform: Sequence[float]
+        Duty cycles in percent
+    period: float
+        Seconds between samples
+    timeout: float, optional
+        Seconds to wait before raising `bluesky.run_engine.WaitForTimeoutError`
+
+    Returns
+    -------
+    timestamps: numpy.ndarray
+        Wall clock time each sample was written
+    """
+    status = pwm.play_waveform(waveform, period)
+    yield from _wait_for_status(status, timeout)
+    return getattr(pwm, "pwm", pwm).waveform_timestamps
+
+
+def acquire_pages(det, num, pages=1, timeout=None):
+    """
+    Acquire batches of `num` back to back spectra, each emitted as a single event_page of the detector's stream
+    rather than `num` events, cutting the documents built and callbacks dispatched per sample by about `num`.
+    A run must be open.
+
+    Parameters
+    ----------
+    det: AS7341Detector
+        Detector to acquire from, at its native rate
+    num: int
+        Spectra per page, at most the detector's `stream_capacity`
+    pages: int
+        Number of pages. Defaults to 1.
+    timeout: float, optional
+        Seconds to wait for each page before raising
+
+    Returns
+    -------
+    n: int
+        Number of spectra acquired
+    """
+
+    def pages_plan():
+        group = f"acquire_pages-{id(det)}"
+        yield from bps.mv(det.num_spectra, num)
+        for _ in range(pages):
+            yield from bps.kickoff(det, wait=True)
+            yield from bps.complete(det, group=group)
+            yield from bps.wait(group, timeout=timeout)
+            yield from bps.collect(det, return_payload=False)
+        return num * pages
+
+    # Later kickoffs fly until completed again
+    return (yield from bpp.finalize_wrapper(pages_plan(), bps.mv(det.num_spectra, 0)))
+
+
+def _wait_for_status(status, timeout=None):
+    """
+    Suspend the plan until an ophyd Status finishes, without blocking the RunEngine loop. A failed status raises
+    its exception in the plan, with a status timeout raised as `WaitForTimeoutError` like the wait's own.
+    """
+
+    async def status_future():
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def resolve(st):
+            if future.done():
+                return
+            if st.success:
+                future.set_result(True)
+                return
+            exc = st.exception() or RuntimeError(f"{st!r} failed.")
+            if isinstance(exc, TimeoutError) and not isinstance(exc, WaitForTimeoutError):
+                timeout_exc = WaitForTimeoutError(str(exc))
+                timeout_exc.__cause__ = exc
+                exc = timeout_exc
+            future.set_exception(exc)
+
+        status.add_callback(lambda st: loop.call_soon_threadsafe(resolve, st))
+        await future
+
+    kwargs = {} if timeout is None else {"timeout": timeout}
+    (task,) = yield from bps.wait_for([status_future], **kwargs)
+    # The RunEngine hands back the finished task rather than raising its exception
+    task.result()
@@ -0,0 +1,361 @@
+"""Plans that close the loop between the Raspberry Pi light sources and detectors."""
+
+import itertools
+
+import bluesky.plan_stubs as bps
+import bluesky.preprocessors as bpp
+import numpy as np
+
+from rpi_bluesky.calibration import ResponseCalibration, calibration_key, load_calibration, save_calibration
+from rpi_bluesky.ophyd.base import RpiPWM
+
+DUTY_CYCLE_BOUNDS = RpiPWM.dc_bounds
+
+
+def measure_spectrum(det, sources):
+    """
+    Trigger and read the detector and light sources as one event, and return the visible spectrum.
+
+    If the detector records its exposure, the counts are divided by the integration time in milliseconds and
+    the gain, so that spectra stay comparable while auto exposure changes the settings between reads.
+
+    Parameters
+    ----------
+    det: AS7341Detector
+        Detector with an 8 channel `visible` component
+    sources: list
+        Light sources read in the same event, e.g. ``[led]``
+
+    Returns
+    -------
+    spectrum: numpy.ndarray
+        The 8 visible channels
+    """
+    reading = yield from bps.trigger_and_read([det, *sources])
+    spectrum = np.asarray(reading[det.visible.name]["value"], dtype=float)
+    if hasattr(det, "integration_time") and hasattr(det, "gain"):
+        integration_time = yield from bps.rd(det.integration_time)
+        gain = yield from bps.rd(det.gain)
+        spectrum = spectrum / (integration_time * gain)
+    return spectrum
+
+
+def target_spectrum(
+    led,
+    det,
+    target,
+    *,
+    shape_only=False,
+    tolerance=0.02,
+    max_reads=40,
+    initial=None,
+    probe_step=10.0,
+    max_step=25.0,
+    md=None,
+):
+    """
+    Drive the RGB_LED duty cycles until the detector sees a target spectrum, with a damped Gauss-Newton search.
+
+    The Jacobian of the spectrum with respect to the three duty cycles is first estimated from one small probe
+    of each channel, then kept up to date from every subsequent read with Broyden's rank one update, so each
+    iteration costs a single read. Steps are damped (Levenberg-Marquardt), capped at `max_step`, and clipped
+    to the valid duty cycles. The LED is left at the best setting found.
+
+    Parameters
+    ----------
+    led: RGB_LED
+        Light source, set with a (red, green, blue) triple
+    det: AS7341Detector
+        Detector providing the feedback
+    target: array_like
+        Target 8 channel visible spectrum, in the units of `measure_spectrum`
+    shape_only: bool
+        If True, only the relative spectrum (the chromaticity across the 8 channels) is matched, not its
+        overall intensity. Defaults to False.
+    tolerance: float
+        Stop once the norm of the residual is this fraction of the norm of the target. Defaults to 2%.
+    max_reads: int
+        Stop after this many reads, including the probes. Defaults to 40.
+    initial: tuple, optional
+        Starting duty cycles. Defaults to the current color of the LED.
+    probe_step: float
+        Duty cycle change used to estimate the initial Jacobian. Defaults to 10%.
+    max_step: float
+        Largest change of any duty cycle in one iteration. Defaults to 25%.
+    md: dict, optional
+        Metadata
+
+    Returns
+    -------
+    color: numpy.ndarray
+        Best (red, green, blue) duty cycles found
+    residual: float
+        Relative residual at that setting
+    """
+    target = np.asarray(target, dtype=float)
+    if target.shape != (8,):
+        raise ValueError(f"The target must be an 8 channel spectrum. Got shape {target.shape}.")
+    goal = target / target.sum() if shape_only else target
+    scale = np.linalg.norm(goal)
+    low, high = DUTY_CYCLE_BOUNDS
+    _md = {
+        "plan_name": "target_spectrum",
+        "target": target.tolist(),
+        "shape_only": shape_only,
+        "tolerance": tolerance,
+        "hints": {"dimensions": [(["time"], "primary")]},
+    }
+    _md.update(md or {})
+
+    def residual_at(color):
+        yield from bps.mv(led, tuple(color))
+        spectrum = yield from measure_spectrum(det, [led])
+        if shape_only:
+            spectrum = spectrum / max(spectrum.sum(), np.finfo(float).tiny)
+        return spectrum - goal
+
+    # The run wrapper returns the run uid, so the result is passed out through here
+    result = {}
+
+    @bpp.run_decorator(md=_md)
+    def inner():
+        if initial is None:
+            x = yield from bps.rd(led.color)
+        else:
+            x = initial
+        x = np.clip(np.asarray(x, dtype=float), low, high)
+        r = yield from residual_at(x)
+        reads = 1
+
+        # Initial Jacobian by forward differences, probing away from the nearest bound
+        jacobian = np.zeros((len(r), 3))
+        for i in range(3):
+            if reads >= max_reads:
+                break
+            probe = x.copy()
+            probe[i] += probe_step if x[i] + probe_step <= high else -probe_step
+            jacobian[:, i] = ((yield from residual_at(probe)) - r) / (probe[i] - x[i])
+            reads += 1
+
+        damping = 1e-3
+        best_x, best_r = x, r
+        while reads < max_reads and np.linalg.norm(best_r) > tolerance * scale:
+            jtj = jacobian.T @ jacobian
+            dx = np.linalg.solve(jtj + damping * np.diag(np.diag(jtj) + 1e-12), -jacobian.T @ best_r)
+            dx *= min(1.0, max_step / max(np.abs(dx).max(), 1e-12))
+            new_x = np.clip(best_x + dx, low, high)
+            step = new_x - best_x
+            if np.abs(step).max() < 1e-3:
+                # Pinned against the bounds, no further progress possible
+                break
+            new_r = yield from residual_at(new_x)
+            reads += 1
+            jacobian += np.outer(new_r - best_r - jacobian @ step, step) / (step @ step)
+            if np.linalg.norm(new_r) < np.linalg.norm(best_r):
+                best_x, best_r = new_x, new_r
+                damping = max(damping / 3, 1e-6)
+            else:
+                damping *= 3
+
+        yield from bps.mv(led, tuple(best_x))
+        result.update(color=best_x, residual=float(np.linalg.norm(best_r) / scale))
+
+    yield from inner()
+    return result["color"], result["residual"]
+
+
+def calibrate_response(led, det, *, levels=(50.0, 100.0), cache_path=None, max_age=None, force=False, md=None):
+    """
+    Measure the response of the detector to each channel of the light source, or reuse a cached calibration.
+
+    The design is the dark spectrum plus each channel alone at each of `levels`, the fewest reads that separate
+    the dark offset from every channel, fitted by least squares. The result is saved to the calibration cache,
+    keyed by the device names and the detector configuration, and no measurement is made while a valid cached
+    calibration exists.
+
+    Parameters
+    ----------
+    led: RGB_LED
+        Light source, set with a (red, green, blue) triple
+    det: AS7341Detector
+        Detector, read with `measure_spectrum`
+    levels: tuple
+        Duty cycles each channel is measured at. Defaults to 50% and 100%.
+    cache_path: str or Path, optional
+        Calibration cache. Defaults to `rpi_bluesky.calibration.default_cache_path()`.
+    max_age: float, optional
+        Seconds after which a cached calibration is measured again. Defaults to never.
+    force: bool
+        Measure even if a valid calibration is cached. Defaults to False.
+    md: dict, optional
+        Metadata
+
+    Returns
+    -------
+    calibration: ResponseCalibration
+    """
+    key = calibration_key(led, det)
+    if not force:
+        calibration = load_calibration(key, cache_path, max_age)
+        if calibration is not None:
+            return calibration
+
+    n = len(led.channels)
+    settings = [np.zeros(n)]
+    for i, level in itertools.product(range(n), levels):
+        setting = np.zeros(n)
+        setting[i] = level
+        settings.append(setting)
+    _md = {
+        "plan_name": "calibrate_response",
+        "levels": list(levels),
+        "hints": {"dimensions": [(["time"], "primary")]},
+    }
+    _md.update(md or {})
+    spectra = []
+
+    @bpp.run_decorator(md=_md)
+    def inner():
+        for setting in settings:
+            yield from bps.mv(led, tuple(setting))
+            spectra.append((yield from measure_spectrum(det, [led])))
+        yield from bps.mv(led, (0.0,) * n)
+
+    yield from inner()
+    calibration = ResponseCalibration.fit(settings, spectra, key)
+    save_calibration(calibration, cache_path)
+    return calibration
+
+
+def set_spectrum(led, det, target, *, calibration=None, **kwargs):
+    """
+    Set the light source open loop to the duty cycles that best reproduce a target spectrum.
+
+    The duty cycles come from the bounded least squares solution against the response calibration, measured
+    only if no valid calibration is cached. Follow with `target_spectrum`, starting from the result, to remove
+    what the linear model misses.
+
+    Parameters
+    ----------
+    led: RGB_LED
+        Light source, set with a (red, green, blue) triple
+    det: AS7341Detector
+        Detector the calibration is for
+    target: array_like
+        Target spectrum, in the units of `measure_spectrum`
+    calibration: ResponseCalibration, optional
+        Calibration to use. Defaults to the one from `calibrate_response`.
+    kwargs:
+        Keyword arguments passed to `calibrate_response`
+
+    Returns
+    -------
+    color: numpy.ndarray
+        Duty cycles set
+    """
+    if calibration is None:
+        calibration = yield from calibrate_response(led, det, **kwargs)
+    color = calibration.solve(target, DUTY_CYCLE_BOUNDS)
+    yield from bps.mv(led, tuple(color))
+    return color
+
+
+def refine_scan(
+    detectors,
+    target_field,
+    motor,
+    start,
+    stop,
+    *,
+    num=9,
+    max_points=30,
+    tolerance=0.02,
+    min_step=None,
+    md=None,
+):
+    """
+    One dimensional scan that starts coarse, then bisects the intervals where the response changes most.
+
+    Each interval is scored by its length in the plane of the position and the response, both scaled to their
+    range, so steep regions such as the knee of an LED are refined first while flat regions are left coarse.
+    The interval with the highest score is bisected until every score is below `tolerance`, or `max_points`
+    have been measured. Array fields such as the AS7341 visible channels are scored by the distance between
+    spectra, each channel scaled to its own range.
+
+    Parameters
+    ----------
+    detectors: list
+        Readable objects
+    target_field: str
+        Data key whose response drives the refinement, e.g. ``det.clear.name``
+    motor: Movable
+        Positioner, e.g. ``led.pwm``
+    start, stop: float
+        Limits of the scan
+    num: int
+        Points of the initial, evenly spaced pass. Defaults to 9.
+    max_points: int
+        Total budget of points. Defaults to 30.
+    tolerance: float
+        Largest scaled interval length left unrefined. Defaults to 0.02.
+    min_step: float, optional
+        Intervals are not bisected below this length. Defaults to 1/1000 of the scan range.
+    md: dict, optional
+        Metadata
+
+    Returns
+    -------
+    positions: numpy.ndarray
+        Positions measured, in increasing order
+    responses: numpy.ndarray
+        Response at each position
+    """
+    if num < 2:
+        raise ValueError("The initial pass needs at least 2 points.")
+    min_step = abs(stop - start) / 1000 if min_step is None else min_step
+    _md = {
+        "detectors": [det.name for det in detectors],
+        "motors": [motor.name],
+        "plan_args": {"target_field": target_field, "start": start, "stop": stop, "num": num},
+        "plan_name": "refine_scan",
+        "max_points": max_points,
+        "tolerance": tolerance,
+        "hints": {"dimensions": [(motor.hints["fields"], "primary")]},
+    }
+    _md.update(md or {})
+    positions, responses = [], []
+    result = {}
+
+    def measure(position):
+        yield from bps.mv(motor, position)
+        reading = yield from bps.trigger_and_read(list(detectors) + [motor])
+        positions.append(position)
+        responses.append(np.atleast_1d(np.asarray(reading[target_field]["value"], dtype=float)))
+
+    def scores(x, y):
+        x_range = max(abs(stop - start), np.finfo(float).tiny)
+        y_range = np.ptp(y, axis=0)
+        y_range[y_range == 0] = 1.0
+        dx = np.diff(x) / x_range
+        dy = np.linalg.norm(np.diff(y, axis=0) / y_range, axis=1) / np.sqrt(y.shape[1])
+        score = np.hypot(dx, dy)
+        score[np.diff(x) < 2 * min_step] = 0
+        return score
+
+    @bpp.run_decorator(md=_md)
+    def inner():
+        for position in np.linspace(start, stop, num):
+            yield from measure(float(position))
+        while len(positions) < max_points:
+            order = np.argsort(positions)
+            x, y = np.asarray(positions)[order], np.asarray(responses)[order]
+            score = scores(x, y)
+            i = int(np.argmax(score))
+            if score[i] < tolerance:
+                break
+            yield from measure(float((x[i] + x[i + 1]) / 2))
+        order = np.argsort(positions)
+        result.update(positions=np.asarray(positions)[order], responses=np.squeeze(np.asarray(responses)[order]))
+
+    yield from inner()
+    return result["positions"], result["responses"]
@@ -0,0 +1,86 @@
+"""Plan preprocessors for the Raspberry Pi control layer."""
+
+import time
+
+import bluesky.plan_stubs as bps
+import bluesky.preprocessors as bpp
+from bluesky.utils import ensure_generator, make_decorator
+
+from rpi_bluesky.ophyd.base import get_control_layer
+from rpi_bluesky.ophyd.latency import LatencyReadable
+from rpi_bluesky.ophyd.tracing import get_tracer
+
+
+def record_latency_wrapper(plan, cl=None, *, stream_name="latency", textfile=None, reset=True):
+    """
+    Record the latency histograms of the control layer as a stream just before each run stops.
+
+    Parameters
+    ----------
+    plan: iterable or iterator
+        A generator, list, or similar containing `Msg` objects
+    cl: RpiControlLayer, optional
+        Control layer whose histograms are recorded. Defaults to the default control layer.
+    stream_name: str
+        Name of the stream. Defaults to "latency".
+    textfile: str or Path, optional
+        Also write the histograms to this Prometheus textfile at each run stop
+    reset: bool
+        Clear the histograms at each run start, so each run records only its own calls. Defaults to True.
+    """
+    cl = cl if cl is not None else get_control_layer()
+    readable = LatencyReadable(cl.latency)
+
+    def mutate(msg):
+        if msg.command == "open_run" and reset:
+            cl.latency.reset()
+        elif msg.command == "close_run":
+
+            def record_then_close():
+                yield from bps.trigger_and_read([readable], name=stream_name)
+                if textfile is not None:
+                    cl.latency.write_prometheus(textfile)
+                return (yield msg)
+
+            return record_then_close(), None
+        return None, None
+
+    return (yield from bpp.plan_mutator(plan, mutate))
+
+
+record_latency_decorator = make_decorator(record_latency_wrapper)
+
+
+def trace_wrapper(plan):
+    """
+    Record each message of the plan as a span of the active tracer, from when the plan yields it until the
+    RunEngine returns its result, so the device and hardware spans it causes nest below it.
+
+    Parameters
+    ----------
+    plan: iterable or iterator
+        A generator, list, or similar containing `Msg` objects
+    """
+    plan = ensure_generator(plan)
+    value, exception = None, None
+    while True:
+        try:
+            msg = plan.throw(exception) if exception is not None else plan.send(value)
+        except StopIteration as stop:
+            return stop.value
+        value, exception = None, None
+        tracer = get_tracer()
+        start = time.perf_counter()
+        try:
+            value = yield msg
+        except GeneratorExit:
+            raise
+        except BaseException as ex:
+            exception = ex
+        finally:
+            if tracer is not None:
+                args = {"obj": msg.obj.name} if getattr(msg.obj, "name", None) else None
+                tracer.complete(msg.command, "bluesky", start, args=args)
+
+
+trace_decorator = make_decorator(trace_wrapper)
@@ -46,7 +46,8 @@ def blink_scan(led):
 
 
 def main(gpio_pin_num=17):
-    led = RpiSignal(gpio_pin_num, name=f"led_at_GPIO{gpio_pin_num}")
+    # The LED is only ever driven by this signal, so the last commanded level is served as the readback
+    led = RpiSignal(gpio_pin_num, name=f"led_at_GPIO{gpio_pin_num}", cached_readback=True)
     RE.subscribe(LiveTable([led.name]))
     RE(blink(led))
     RE(blink_scan(led))
@@ -12,12 +12,16 @@ Connect the short pin and resistor to another row.
 Connect the other end of the resistor and another jumper wire to a third row.
 Connect the new jumper wire to pin GPIO17  on the RPi.
 """
+
 import bluesky.plan_stubs as bps
+import numpy as np
 from bluesky import RunEngine
 from bluesky.callbacks import LiveTable
 from bluesky.plans import scan
 
 from rpi_bluesky.ophyd.devices import LED
+from rpi_bluesky.plan_stubs import play_waveform
+from rpi_bluesky.plans import refine_scan
 
 RE = RunEngine()
 
@@ -31,6 +35,26 @@ def dimmer_scan(led):
     yield from bps.mv(led.io, 0)
 
 
+def dimmer_waveform(led, n_points=1000, period=1e-3):
+    """Same ramp up and down as `dimmer_scan`, played back from a preloaded waveform at 1 kHz"""
+    ramp = np.linspace(0.0, 100.0, n_points)
+    yield from play_waveform(led, np.concatenate([ramp, np.full(n_points, 100.0), ramp[::-1]]), period)
+    yield from bps.mv(led.io, 0)
+
+
+def adaptive_dimmer_scan(led, det, max_points=30):
+    """
+    Measure the brightness curve of the LED on a detector, e.g. an AS7341Detector facing it, refining the knee
+    of the curve instead of spending a fixed 50 points per direction.
+    """
+    yield from bps.mv(led.io, 1)
+    positions, responses = yield from refine_scan(
+        [det], det.clear.name, led.pwm, 0.0, 100.0, max_points=max_points
+    )
+    yield from bps.mv(led.io, 0)
+    return positions, responses
+
+
 def main(gpio_pin_num=11):
     led = LED(gpio_pin_num, name=f"led_at_pin_{gpio_pin_num}")
     RE.subscribe(LiveTable([led.io.name, led.pwm.name]))
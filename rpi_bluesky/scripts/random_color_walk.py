@@ -33,19 +33,18 @@ RE = RunEngine()
 @bpp.run_decorator()
 def random_walk(led, dets, timeout=30.0):
     """Choose a channel. Change the intensity by +/- 10. Continue randomly."""
-    pwms = [x.pwm for x in [led.red, led.green, led.blue]]  # Pulsed width modulators
-    dets = dets + pwms
+    dets = dets + [led]
 
-    for signal in pwms:
-        yield from bps.mv(signal, random.random() * 100)
+    # All three duty cycles change together, with a single settle
+    yield from bps.mv(led, [random.random() * 100 for _ in range(3)])
 
     start_time = time.time()
     while time.time() - start_time < timeout:
-        channel = random.choice([led.red, led.green, led.blue])
-        previous = yield from bps.rd(channel.pwm)
-        next_c = previous + 20 * random.random() * random.choice([-1, 1])
-        next_c = min(100, max(0, next_c))
-        yield from bps.mv(channel.pwm, next_c)
+        color = yield from bps.rd(led.color)
+        channel = random.randrange(3)
+        next_c = color[channel] + 20 * random.random() * random.choice([-1, 1])
+        color[channel] = min(100, max(0, next_c))
+        yield from bps.mv(led, color)
         yield from bps.trigger_and_read(dets)
         # yield from bps.sleep(0.1)
 
@@ -53,6 +52,10 @@ def random_walk(led, dets, timeout=30.0):
 def main():
     led = RGB_LED(name="rgb_led")
     det = AS7341Detector(name="det")
+    # Run at the fastest exposure the light level allows, recording the exposure with each reading
+    det.auto_exposure.put(True)
+    det.integration_time.kind = "normal"
+    det.gain.kind = "normal"
     RE.subscribe(LiveTable([x.pwm.name for x in [led.red, led.green, led.blue]] + [det.near_ir, det.clear]))
     RE.subscribe(LiveBars(det.visible.name))
     RE(random_walk(led, [det]))
@@ -5,7 +5,8 @@ import bluesky.preprocessors as bpp
 from bluesky import RunEngine
 from bluesky.callbacks import LiveTable
 
-from rpi_bluesky.ophyd.adafruit import AS7341Detector, LiveBars
+from rpi_bluesky.ophyd.adafruit import AS7341Detector, LiveBars, LiveTrace, LiveWaterfall
+from rpi_bluesky.writers import ColumnarWriter
 
 RE = RunEngine()
 
@@ -18,11 +19,32 @@ def read_and_pause(dets, pause=0.5, timeout=15.0):
         yield from bps.sleep(pause)
 
 
-def main():
+@bpp.run_decorator()
+def stream_spectra(det, duration=5.0, collect_interval=0.5):
+    """Fly the detector at its native rate, collecting the buffered spectra periodically as event pages."""
+    yield from bps.kickoff(det, wait=True)
+    start_time = time.time()
+    while time.time() - start_time < duration:
+        yield from bps.sleep(collect_interval)
+        yield from bps.collect(det)
+    yield from bps.complete(det, wait=True)
+    yield from bps.collect(det)
+
+
+def main(data_dir=None):
     vis_det = AS7341Detector(name="vis_det")
+    # Run at the fastest exposure the light level allows, recording the exposure with each reading
+    vis_det.auto_exposure.put(True)
+    vis_det.integration_time.kind = "normal"
+    vis_det.gain.kind = "normal"
     dets = [vis_det]
     bars = LiveBars(vis_det.visible.name)
     RE.subscribe(LiveTable([vis_det.near_ir, vis_det.clear]))
+    RE.subscribe(LiveWaterfall(vis_det.visible.name))
+    RE.subscribe(LiveTrace([vis_det.clear.name, vis_det.near_ir.name]))
+    if data_dir is not None:
+        # Keep the spectra on the Pi, written in bulk off the RunEngine thread
+        RE.subscribe(ColumnarWriter(data_dir))
     RE(read_and_pause(dets), bars)
     return vis_det
 
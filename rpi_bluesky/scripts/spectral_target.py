@@ -0,0 +1,40 @@
+"""
+Steer an RGB LED until the AS7341 sees a target spectrum, using the detector as feedback.
+
+Same setup as random_color_walk.py, with the AS7341 facing the LED.
+The target below is the spectrum seen at a known good color. Replace it with a measured or wanted spectrum.
+"""
+
+import numpy as np
+from bluesky import RunEngine
+from bluesky.callbacks import LiveTable
+
+from rpi_bluesky.ophyd.adafruit import AS7341Detector, LiveBars
+from rpi_bluesky.ophyd.devices import RGB_LED
+from rpi_bluesky.plans import set_spectrum, target_spectrum
+
+RE = RunEngine(call_returns_result=True)
+
+
+def main(target=None, shape_only=False):
+    led = RGB_LED(name="rgb_led")
+    det = AS7341Detector(name="det")
+    # Spectra are normalized by the exposure, so auto exposure can keep the sensor in range throughout
+    det.auto_exposure.put(True)
+    det.integration_time.kind = "normal"
+    det.gain.kind = "normal"
+    if target is None:
+        # Counts per ms per unit gain of a warm white, from violet to red
+        target = np.array([0.2, 0.5, 0.9, 1.1, 1.6, 2.0, 2.4, 2.2])
+    RE.subscribe(LiveTable([x.pwm.name for x in led.channels] + [det.clear]))
+    RE.subscribe(LiveBars(det.visible.name))
+    # Start from the open loop solution of the cached calibration, measuring it first if there is none
+    initial = RE(set_spectrum(led, det, target)).plan_result
+    result = RE(target_spectrum(led, det, target, shape_only=shape_only, initial=initial))
+    color, residual = result.plan_result
+    print(f"Reached {np.round(color, 1)} with a relative residual of {residual:.3f}")
+    return led
+
+
+if __name__ == "__main__":
+    led = main()
@@ -0,0 +1,21 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+# The test suite runs off of a Raspberry Pi, so the control layer is built on the simulated GPIO backend.
+os.environ.setdefault("RPI_BLUESKY_GPIO_BACKEND", "sim")
+
+
+FAKES = Path(__file__).parents[2] / "benchmarks" / "fakes"
+
+
+@pytest.fixture
+def fake_hardware(monkeypatch):
+    """Make the in memory RPi.GPIO, board and adafruit_as7341 modules of the benchmarks importable."""
+    monkeypatch.syspath_prepend(str(FAKES))
+    yield
+    # Later tests must not find the fakes already imported
+    for name in ("RPi", "RPi.GPIO", "board", "adafruit_as7341"):
+        sys.modules.pop(name, None)
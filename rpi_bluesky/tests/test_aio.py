@@ -0,0 +1,136 @@
+import asyncio
+import threading
+import time
+
+import bluesky.plan_stubs as bps
+import bluesky.preprocessors as bpp
+import numpy as np
+import pytest
+from bluesky import RunEngine
+
+from rpi_bluesky.ophyd.adafruit import AS7341Detector
+from rpi_bluesky.ophyd.aio import (
+    AsyncAS7341Detector,
+    AsyncLED,
+    AsyncRGB_LED,
+    AsyncRpiPWM,
+    AsyncRpiSignal,
+    AsyncStatus,
+)
+from rpi_bluesky.ophyd.backends import RpiGPIOBackend
+from rpi_bluesky.ophyd.base import RpiControlLayer
+
+
+@pytest.fixture
+def cl(fake_hardware):
+    cl = RpiControlLayer(backend=RpiGPIOBackend())
+    yield cl
+    cl._cleanup()
+
+
+def test_async_status_awaits_and_calls_back():
+    async def main():
+        done = []
+        status = AsyncStatus(asyncio.sleep(0.01))
+        status.add_callback(lambda st: done.append(st.success))
+        await status
+        failed = AsyncStatus(asyncio.sleep(1))
+        failed.task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await failed
+        return done, status.done, failed.success
+
+    done, finished, failed_success = asyncio.run(main())
+    assert done == [True] and finished and not failed_success
+
+
+def test_signals_against_fake_gpio(cl):
+    led = AsyncRpiSignal(5, name="led", cl=cl)
+    pwm = AsyncRpiPWM(6, name="pwm", cl=cl, settle_time=0.01)
+
+    async def main():
+        await led.set(1)
+        await pwm.set(40.0)
+        with pytest.raises(ValueError):
+            pwm.set(150.0)
+        return await led.read(), await pwm.read()
+
+    led_reading, pwm_reading = asyncio.run(main())
+    assert led_reading["led"]["value"] == 1
+    assert pwm_reading["pwm"]["value"] == 40.0
+    assert cl.latency_histograms()["pwm"]["set"]["mean"] >= 0.01
+
+
+def test_pwm_drives_its_pin(cl):
+    # No AsyncRpiSignal on the pin, so the PWM alone has to set it up
+    pwm = AsyncRpiPWM(13, name="pwm", cl=cl, settle_time=0.01)
+
+    async def main(value):
+        await pwm.set(value)
+        await asyncio.sleep(0.02)
+        return cl.backend.input(13)
+
+    assert asyncio.run(main(100.0)) == 1
+    assert asyncio.run(main(0.0)) == 0
+
+
+def test_many_leds_settle_concurrently_on_one_loop(cl):
+    leds = [AsyncLED(pin, name=f"led{pin}", cl=cl, settle_time=0.2) for pin in range(2, 12)]
+    RE = RunEngine()
+    # The RunEngine starts its own loop thread on first use
+    RE(bps.null())
+    threads = threading.active_count()
+
+    def plan():
+        yield from bps.mv(*[arg for led in leds for arg in (led, 50.0)])
+
+    start = time.monotonic()
+    RE(plan())
+    # Ten 0.2 s settles overlap in one window, with no thread started for them
+    assert time.monotonic() - start < 1.0
+    assert threading.active_count() == threads
+    assert all(led.pwm._duty_cycle == 50.0 for led in leds)
+
+
+def test_plan_with_async_rgb_led_and_detector(cl):
+    led = AsyncRGB_LED(name="rgb", cl=cl, settle_time=1e-3)
+    det = AsyncAS7341Detector(name="det", i2c=object(), cl=cl, gain=4.0)
+    docs = []
+    RE = RunEngine()
+
+    @bpp.run_decorator()
+    def plan():
+        yield from bps.configure(det, {"integration_time": 50.0})
+        for color in ((10, 20, 30), (40, 50, 60)):
+            yield from bps.mv(led, color)
+            yield from bps.trigger_and_read([led, det])
+
+    RE(plan(), lambda name, doc: docs.append((name, doc)))
+    events = [doc for name, doc in docs if name == "event"]
+    assert len(events) == 2
+    assert events[-1]["data"]["rgb_color"] == [40, 50, 60]
+    assert events[-1]["data"]["rgb_red_pwm"] == 40
+    visible = events[-1]["data"]["det_visible"]
+    assert len(visible) == 8 and np.all(np.diff(visible) > 0)
+    # The fake sensor's counts scale with the integration time written to it
+    assert det._sensor.acquisitions == 4
+    assert cl.latency_histograms()["det"]["acquire"]["count"] == 2
+    (descriptor,) = [doc for name, doc in docs if name == "descriptor"]
+    assert descriptor["configuration"]["det"]["data"]["det_integration_time"] == 50.0
+    assert descriptor["hints"]["rgb"]["fields"] == ["rgb_color"]
+
+
+def test_settings_are_validated_like_the_threaded_detector(cl):
+    det = AsyncAS7341Detector(name="det", i2c=object(), cl=cl)
+    threaded = AS7341Detector(name="threaded", i2c=object(), cl=cl)
+    assert threaded.gain.cl is cl
+    config = dict(det._config)
+    for setting, value in (("gain", 3.0), ("integration_time", 0.0)):
+        with pytest.raises(ValueError):
+            det.configure({setting: value})
+        with pytest.raises(ValueError):
+            getattr(threaded, setting).put(value)
+    with pytest.raises(KeyError):
+        det.configure({"auto_exposure_target": 1000.0})
+    # Rejected settings leave the configuration as it was
+    assert det._config == config
@@ -0,0 +1,191 @@
+import sys
+import threading
+
+import bluesky.plan_stubs as bps
+import bluesky.preprocessors as bpp
+import numpy as np
+import pytest
+from bluesky import RunEngine
+
+from rpi_bluesky.ophyd import adafruit
+from rpi_bluesky.ophyd.adafruit import (
+    MAX_COUNTS,
+    AS7341Detector,
+    full_scale_counts,
+    get_i2c,
+    integration_registers,
+    integration_time_ms,
+)
+from rpi_bluesky.plan_stubs import acquire_pages
+
+
+@pytest.fixture
+def det(fake_hardware):
+    det = AS7341Detector(name="det", i2c=object(), stream_capacity=64)
+    det.wait_for_connection()
+    return det
+
+
+def test_acquire_pages_emits_one_page_per_batch(det):
+    docs = []
+    RE = RunEngine()
+    RE(bpp.run_wrapper(acquire_pages(det, 16, pages=3)), lambda name, doc: docs.append((name, doc)))
+
+    names = [name for name, _ in docs]
+    assert "event" not in names
+    pages = [doc for name, doc in docs if name == "event_page"]
+    assert len(pages) == 3
+    (descriptor,) = [doc for name, doc in docs if name == "descriptor"]
+    assert descriptor["name"] == det.stream_name
+    for i, page in enumerate(pages):
+        visible = page["data"][det.visible.name]
+        assert visible.shape == (16, 8) and visible.dtype == np.uint16
+        assert len(page["data"][det.clear.name]) == 16
+        assert page["seq_num"] == list(range(16 * i + 1, 16 * i + 17))
+    # Each spectrum is a separate acquisition of both banks
+    assert det.sensor.acquisitions == 2 * 48
+    assert det.num_spectra.get() == 0
+
+
+def test_num_spectra_is_bounded_by_the_buffer(det):
+    with pytest.raises(ValueError):
+        det.num_spectra.put(65)
+
+
+def test_live_plots_consume_pages(det):
+    pytest.importorskip("matplotlib").use("Agg")
+    from rpi_bluesky.callbacks import LiveBars, LiveTrace, LiveWaterfall
+
+    bars = LiveBars(det.visible.name)
+    waterfall = LiveWaterfall(det.visible.name, n_spectra=32)
+    trace = LiveTrace([det.clear.name, det.near_ir.name], n_points=100)
+    pages = []
+    RE = RunEngine()
+    for callback in (bars, waterfall, trace, lambda name, doc: name == "event_page" and pages.append(doc)):
+        RE.subscribe(callback)
+    RE(bpp.run_wrapper(acquire_pages(det, 16, pages=3)))
+
+    np.testing.assert_array_equal(bars.new_data, pages[-1]["data"][det.visible.name][-1])
+    spectra, _ = waterfall.buffer.latest()
+    visible = np.concatenate([page["data"][det.visible.name] for page in pages])
+    np.testing.assert_array_equal(spectra, visible[-32:])
+    assert len(trace.buffer) == 48
+
+
+@pytest.mark.parametrize("integration_time", [2.78e-3, 1.0, 50.0, 182.2, 1000.0, 40000.0])
+def test_integration_registers_round_trip(integration_time):
+    atime, astep = integration_registers(integration_time)
+    assert 0 <= atime <= 255 and 0 <= astep < MAX_COUNTS
+    # Within one step, or the rounding of ASTEP over several ATIME repeats
+    assert integration_time_ms(atime, astep) == pytest.approx(integration_time, rel=1e-4, abs=2.78e-3)
+
+
+def test_integration_time_is_the_one_applied(det):
+    det.integration_time.put(200.0)
+    applied = integration_time_ms(*integration_registers(200.0))
+    assert applied != 200.0
+    assert det.integration_time.get() == applied
+    assert det.read_configuration()[det.integration_time.name]["value"] == applied
+    assert integration_time_ms(det.sensor.atime, det.sensor.astep) == applied
+
+
+def test_integration_registers_out_of_range():
+    for integration_time in (0.0, 1e-3, 50000.0):
+        with pytest.raises(ValueError):
+            integration_registers(integration_time)
+    assert full_scale_counts(1.0) == 360
+    assert full_scale_counts(1000.0) == MAX_COUNTS
+
+
+def test_auto_exposure_recovers_from_saturation(det):
+    # The driver defaults saturate every channel of the fake sensor many times over
+    det.auto_exposure.put(True)
+    det.trigger()
+    peak = int(det.snapshot().max())
+    assert peak < 0.98 * full_scale_counts(det.integration_time.get())
+    assert peak == pytest.approx(det.auto_exposure_target.get(), rel=det.auto_exposure_tolerance)
+    assert det.sensor.acquisitions <= 2 * det.auto_exposure_max_acquisitions
+
+
+def test_auto_exposure_keeps_the_best_unsaturated_frame(det, monkeypatch):
+    import adafruit_as7341
+
+    det.integration_time.put(100.0)
+    det.gain.put(1.0)
+    det.auto_exposure.put(True)
+    det.auto_exposure_max_acquisitions = 2
+    acquire = det.acquire
+
+    def brightening_acquire():
+        # The light gets ten times brighter after the first acquisition, saturating the second
+        values = acquire()
+        monkeypatch.setattr(adafruit_as7341, "LIGHT", tuple(10 * x for x in adafruit_as7341.LIGHT))
+        return values
+
+    monkeypatch.setattr(det, "acquire", brightening_acquire)
+    det.trigger()
+    assert det.sensor.acquisitions == 4
+    assert det.clear.get() == pytest.approx(10000, rel=0.01)
+    assert det.integration_time.get() == integration_time_ms(*integration_registers(100.0))
+    assert det.gain.get() == 1.0
+
+
+def test_fly_kickoff_complete_collect(fake_hardware):
+    det = AS7341Detector(name="det", i2c=object(), stream_capacity=1 << 17)
+    docs = []
+    RE = RunEngine()
+
+    def fly():
+        yield from bps.kickoff(det, wait=True)
+        with pytest.raises(RuntimeError):
+            det.kickoff()
+        yield from bps.sleep(0.01)
+        yield from bps.complete(det, wait=True)
+        # The acquisition thread is joined, so nothing reaches the buffer after complete
+        assert not any(thread.name == "det_stream" for thread in threading.enumerate())
+        yield from bps.collect(det, return_payload=False)
+
+    RE(bpp.run_wrapper(fly()), lambda name, doc: docs.append((name, doc)))
+    (page,) = [doc for name, doc in docs if name == "event_page"]
+    assert page["data"][det.visible.name].shape == (det.sensor.acquisitions // 2, 8)
+    assert len(page["data"][det.clear.name]) == det.sensor.acquisitions // 2
+    with pytest.raises(RuntimeError):
+        det.complete()
+    # It can fly again once completed
+    det.kickoff()
+    det.complete().wait(1)
+
+
+def test_trigger_and_read_is_one_acquisition(det):
+    det.violet.kind = "hinted"
+    docs = []
+    RE = RunEngine()
+    RE(bpp.run_wrapper(bps.trigger_and_read([det])), lambda name, doc: docs.append((name, doc)))
+    # One acquisition reads each of the two banks once, however many components are read
+    assert det.sensor.acquisitions == 2
+    (event,) = [doc for name, doc in docs if name == "event"]
+    visible = event["data"][det.visible.name]
+    assert event["data"][det.violet.name] == visible[0]
+    assert event["data"][det.clear.name] == det.snapshot()[8]
+    assert len({event["timestamps"][key] for key in event["data"]}) == 1
+
+
+def test_connection_is_deferred_until_first_use(fake_hardware):
+    det = AS7341Detector(name="det", i2c=object())
+    det.describe()
+    assert det._sensor is None
+    assert "adafruit_as7341" not in sys.modules
+    det.trigger()
+    assert det.sensor.acquisitions == 2
+
+
+def test_detectors_share_the_default_bus(fake_hardware, monkeypatch):
+    # Start without any bus opened, so the first detector to connect opens it
+    monkeypatch.setattr(adafruit, "_i2c_buses", {})
+    first = AS7341Detector(name="first")
+    second = AS7341Detector(name="second", address=0x49)
+    first.wait_for_connection()
+    second.wait_for_connection()
+    assert first.sensor.i2c_bus is second.sensor.i2c_bus
+    assert get_i2c() is first.sensor.i2c_bus
+    assert (first.sensor.address, second.sensor.address) == (0x39, 0x49)
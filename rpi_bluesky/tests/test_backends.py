@@ -0,0 +1,83 @@
+import time
+
+import pytest
+
+from rpi_bluesky.ophyd import RpiPWM, RpiSignal, SimulatedGPIOBackend
+from rpi_bluesky.ophyd.backends import OUT
+from rpi_bluesky.ophyd.base import RpiControlLayer, get_control_layer
+
+
+@pytest.fixture
+def cl():
+    return RpiControlLayer(backend=SimulatedGPIOBackend())
+
+
+def test_default_backend_is_simulated():
+    assert isinstance(get_control_layer().backend, SimulatedGPIOBackend)
+    assert get_control_layer().backend.mode == "BCM"
+
+
+def test_signal_round_trip(cl):
+    sig = RpiSignal(17, name="led", cl=cl)
+    sig.put(1)
+    assert sig.get() == 1
+    sig.put(0)
+    assert sig.get() == 0
+    assert cl.backend.calls["output"] == 2
+    assert cl.backend.calls["input"] == 2
+
+
+def test_pwm_duty_cycle(cl):
+    cl.backend.setup(27, OUT)
+    pwm = RpiPWM(27, name="pwm", cl=cl, settle_time=1e-6)
+    pwm.put(42.0)
+    assert pwm.get() == 42.0
+    assert pwm.pwm.duty_cycle == 42.0
+    with pytest.raises(ValueError):
+        pwm.put(101)
+
+
+def test_pwm_without_engine():
+    cl = RpiControlLayer(backend=SimulatedGPIOBackend(), pwm_engine=False)
+    cl.backend.setup(27, OUT)
+    pwm = RpiPWM(27, name="pwm", cl=cl, settle_time=1e-6)
+    pwm.put(42.0)
+    assert cl.backend.duty_cycle(27) == 42.0
+
+
+def test_unconfigured_pin_raises(cl):
+    with pytest.raises(RuntimeError):
+        cl.backend.output(5, 1)
+
+
+def test_latency_per_call():
+    backend = SimulatedGPIOBackend(latency={"output": 0.01})
+    backend.setmode("BCM")
+    backend.setup(4, OUT)
+    t0 = time.monotonic()
+    backend.output(4, 1)
+    assert time.monotonic() - t0 >= 0.01
+    t0 = time.monotonic()
+    backend.input(4)
+    assert time.monotonic() - t0 < 0.01
+
+
+def test_cached_readback(cl):
+    sig = RpiSignal(18, name="led", cl=cl, cached_readback=True)
+    calls = cl.backend.calls["input"]
+    sig.put(1)
+    for _ in range(5):
+        assert sig.read()[sig.name]["value"] == 1
+    assert cl.backend.calls["input"] == calls
+    assert sig.verify() == 1
+    assert cl.backend.calls["input"] == calls + 1
+
+
+def test_cached_readback_interval(cl):
+    sig = RpiSignal(18, name="led", cl=cl, cached_readback=True, verify_interval=0.05)
+    calls = cl.backend.calls["input"]
+    sig.get()
+    assert cl.backend.calls["input"] == calls
+    time.sleep(0.06)
+    sig.get()
+    assert cl.backend.calls["input"] == calls + 1
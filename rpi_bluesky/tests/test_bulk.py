@@ -0,0 +1,62 @@
+import time
+
+from rpi_bluesky.ophyd import RpiComponent, RpiDevice, RpiSignal, SimulatedGPIOBackend
+from rpi_bluesky.ophyd.base import RpiControlLayer
+from rpi_bluesky.ophyd.devices import LED, RGB_LED
+
+# A control layer of its own, so PWM channels left running by other tests do not add to the call counts
+cl = RpiControlLayer(backend=SimulatedGPIOBackend())
+
+
+class Bank(RpiDevice):
+    a = RpiComponent(RpiSignal, pin_number=5, name="a", cl=cl)
+    b = RpiComponent(RpiSignal, pin_number=6, name="b", cl=cl)
+    c = RpiComponent(RpiSignal, pin_number=13, name="c", cl=cl)
+
+
+def test_bulk_read_is_one_transaction():
+    bank = Bank(name="bank")
+    calls = cl.backend.calls
+    bank.a.put(1)
+    before = calls.copy()
+    reading = bank.read()
+    assert [reading[sig.name]["value"] for sig in (bank.a, bank.b, bank.c)] == [1, 0, 0]
+    assert calls["input_many"] - before["input_many"] == 1
+    assert calls["input"] == before["input"]
+
+
+def test_bulk_set_is_one_transaction():
+    bank = Bank(name="bank")
+    calls = cl.backend.calls
+    before = calls.copy()
+    status = bank.set({"a": 0, "b": 1, "c": 1})
+    status.wait(timeout=1)
+    assert calls["output_many"] - before["output_many"] == 1
+    assert calls["output"] == before["output"]
+    assert cl.read_bank([5, 6, 13]) == [0, 1, 1]
+    assert bank.b.read()[bank.b.name]["value"] == 1
+
+
+def test_bulk_set_pwm():
+    led = LED(19, name="led")
+    led.pwm._settle_time = 1e-3
+    status = led.set({"io": 1, "pwm": 30.0})
+    status.wait(timeout=1)
+    assert led.pwm.get() == 30.0
+    assert led.pwm.pwm.duty_cycle == 30.0
+
+
+def test_rgb_color_set():
+    rgb = RGB_LED(name="rgb")
+    for led in rgb.channels:
+        led.pwm._settle_time = 0.1
+    t0 = time.monotonic()
+    status = rgb.set((10.0, 20.0, 30.0))
+    status.wait(timeout=1)
+    # One settle window for the three channels, not three in a row
+    assert time.monotonic() - t0 < 0.25
+    assert [led.pwm.pwm.duty_cycle for led in rgb.channels] == [10.0, 20.0, 30.0]
+    reading = rgb.read()
+    assert reading[rgb.color.name]["value"] == [10.0, 20.0, 30.0]
+    assert rgb.describe()[rgb.color.name]["shape"] == [3]
+    assert rgb.hints["fields"] == [rgb.color.name]
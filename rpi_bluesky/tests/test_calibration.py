@@ -0,0 +1,78 @@
+import json
+
+import numpy as np
+import pytest
+
+from rpi_bluesky.calibration import (
+    CACHE_VERSION,
+    ResponseCalibration,
+    calibration_key,
+    load_calibration,
+    save_calibration,
+    solve_duty_cycles,
+)
+
+RESPONSE = np.random.default_rng(1).uniform(0, 100, (8, 3))
+
+
+def test_solve_matches_unconstrained_inside_bounds():
+    x = np.array([[10.0, 50.0, 90.0], [0.5, 99.0, 33.0]])
+    np.testing.assert_allclose(solve_duty_cycles(RESPONSE, x @ RESPONSE.T), x, atol=1e-8)
+
+
+def test_solve_is_optimal_on_the_bounds():
+    rng = np.random.default_rng(2)
+    targets = rng.uniform(-2000, 20000, (20, 8))
+    solved = solve_duty_cycles(RESPONSE, targets)
+    assert solved.shape == (20, 3)
+    assert np.all((solved >= 0) & (solved <= 100))
+    # No point of a fine grid does better
+    grid = np.stack(np.meshgrid(*[np.linspace(0, 100, 41)] * 3), -1).reshape(-1, 3)
+    grid_cost = np.min(np.sum((grid @ RESPONSE.T - targets[:, None]) ** 2, axis=2), axis=1)
+    cost = np.sum((solved @ RESPONSE.T - targets) ** 2, axis=1)
+    assert np.all(cost <= grid_cost + 1e-6)
+
+
+def test_fit_recovers_response():
+    dark = np.linspace(10, 20, 8)
+    settings = np.array([[0, 0, 0], [100, 0, 0], [0, 100, 0], [0, 0, 100], [50, 50, 50]], dtype=float)
+    calibration = ResponseCalibration.fit(settings, settings @ RESPONSE.T + dark, key="k")
+    np.testing.assert_allclose(calibration.response, RESPONSE)
+    np.testing.assert_allclose(calibration.dark, dark, atol=1e-9)
+    assert calibration.rms_residual == pytest.approx(0, abs=1e-9)
+    with pytest.raises(ValueError):
+        ResponseCalibration.fit(settings[:3], settings[:3] @ RESPONSE.T, key="k")
+
+
+def test_cache_round_trip(tmp_path):
+    path = tmp_path / "cache.json"
+    assert load_calibration("k", path) is None
+    calibration = ResponseCalibration(RESPONSE, np.zeros(8), key="k")
+    save_calibration(calibration, path)
+    save_calibration(ResponseCalibration(RESPONSE * 2, np.ones(8), key="other"), path)
+    loaded = load_calibration("k", path)
+    np.testing.assert_array_equal(loaded.response, RESPONSE)
+    assert load_calibration("missing", path) is None
+    assert load_calibration("k", path, max_age=-1) is None
+
+    # Entries written by another cache version are ignored
+    cache = json.loads(path.read_text())
+    cache["version"] = CACHE_VERSION + 1
+    path.write_text(json.dumps(cache))
+    assert load_calibration("k", path) is None
+
+
+def test_key_ignores_exposure_settings(fake_hardware):
+    from ophyd import Device
+
+    from rpi_bluesky.ophyd.adafruit import AS7341Detector
+
+    det = AS7341Detector(name="det", i2c=object())
+    led = Device(name="rgb")
+    key = calibration_key(led, det)
+    det.integration_time.put(50.0)
+    det.gain.put(4.0)
+    det.auto_exposure.put(True)
+    assert calibration_key(led, det) == key
+    assert "det_gain" not in json.loads(key)["settings"]
+    assert calibration_key(Device(name="other"), det) != key
@@ -0,0 +1,122 @@
+import time
+
+import numpy as np
+import pytest
+
+from rpi_bluesky.callbacks import LiveBars, LiveTrace, LiveWaterfall
+
+
+@pytest.fixture(autouse=True)
+def agg():
+    pytest.importorskip("matplotlib").use("Agg")
+    import matplotlib.pyplot as plt
+
+    yield
+    plt.close("all")
+
+
+def run(callback, events):
+    callback("start", {"uid": "start", "time": 0.0})
+    for i, data in enumerate(events):
+        callback("event", {"uid": f"event{i}", "time": float(i), "seq_num": i + 1, "data": data})
+    callback.update_plot()
+
+
+def test_waterfall_puts_the_newest_spectrum_at_the_bottom():
+    waterfall = LiveWaterfall("visible", n_spectra=4, max_fps=1e6)
+    run(waterfall, [{"visible": np.full(8, float(i))} for i in range(1, 4)])
+
+    left, right, bottom, top = waterfall.image.get_extent()
+    # The y axis counts spectra ago upwards from 0, so the newest row must be drawn at the bottom
+    assert waterfall.image.origin == "upper" and (bottom, top) == (0, 4)
+    frame = waterfall.image.get_array()
+    np.testing.assert_array_equal(frame[:, 0], [0, 1, 2, 3])
+    assert waterfall.image.get_clim()[1] == pytest.approx(3 * waterfall.margin)
+
+
+def test_trace_keeps_the_last_points_of_each_key():
+    trace = LiveTrace(["clear", "nir"], n_points=5, max_fps=1e6)
+    run(trace, [{"clear": float(i), "nir": 10.0 * i} for i in range(7)])
+
+    clear, nir = trace.lines
+    np.testing.assert_array_equal(clear.get_xdata(), [-4, -3, -2, -1, 0])
+    np.testing.assert_array_equal(clear.get_ydata(), [2, 3, 4, 5, 6])
+    np.testing.assert_array_equal(nir.get_ydata(), [20, 30, 40, 50, 60])
+    trace(
+        "event_page", {"time": [7.0, 8.0], "seq_num": [8, 9], "data": {"clear": [7.0, 8.0], "nir": [70.0, 80.0]}}
+    )
+    trace.update_plot()
+    np.testing.assert_array_equal(clear.get_ydata(), [4, 5, 6, 7, 8])
+    assert trace.ax.get_ylim()[1] == pytest.approx(80 * trace.margin)
+
+
+@pytest.fixture
+def bars(monkeypatch):
+    bars = LiveBars("visible", max_fps=20)
+    bars("start", {"uid": "start", "time": 0.0})
+    canvas = bars.fig.canvas
+    # Full draws through draw_idle, partial ones through blit
+    bars.draws = {"full": 0, "blit": 0}
+    draw_idle, blit = canvas.draw_idle, canvas.blit
+
+    def counting_draw_idle(*args, **kwargs):
+        bars.draws["full"] += 1
+        draw_idle(*args, **kwargs)
+
+    def counting_blit(*args, **kwargs):
+        bars.draws["blit"] += 1
+        blit(*args, **kwargs)
+
+    monkeypatch.setattr(canvas, "draw_idle", counting_draw_idle)
+    monkeypatch.setattr(canvas, "blit", counting_blit)
+    return bars
+
+
+def send(callback, value, i=0):
+    callback(
+        "event", {"uid": f"event{i}", "time": float(i), "seq_num": i + 1, "data": {"visible": np.full(8, value)}}
+    )
+
+
+def test_events_between_draws_are_coalesced(bars):
+    # Long enough that no event arrives after the frame interval, however slow the first draw is
+    bars.min_interval = 60.0
+    for i in range(50):
+        send(bars, 0.5 + i / 100, i)
+    # The first event draws, and the rest wait for the timer as a single pending frame
+    assert sum(bars.draws.values()) == 1
+    assert bars._pending
+    bars._flush()
+    assert sum(bars.draws.values()) == 2
+    assert [rect.get_height() for rect in bars.rects] == pytest.approx([0.99] * 8)
+    # Nothing is left to draw at the end of the run
+    bars("stop", {"uid": "stop", "time": 1.0})
+    assert sum(bars.draws.values()) == 2
+
+
+def test_draws_are_capped_at_max_fps(bars):
+    start = time.monotonic()
+    i = 0
+    while time.monotonic() - start < 0.5:
+        send(bars, 0.5, i)
+        i += 1
+        time.sleep(1e-3)
+    elapsed = time.monotonic() - start
+    assert i > 100
+    assert sum(bars.draws.values()) <= elapsed / bars.min_interval + 1
+
+
+def test_bars_rescale_only_when_values_leave_the_limits(bars):
+    bars.min_interval = 0.0
+    # The first frame is a full draw that caches the background for blitting
+    send(bars, 0.5)
+    assert bars.draws == {"full": 1, "blit": 0}
+    send(bars, 0.9)
+    assert bars.draws == {"full": 1, "blit": 1}
+    send(bars, 10.0)
+    assert bars.draws == {"full": 2, "blit": 1}
+    assert bars.ax.get_ylim()[1] == pytest.approx(10.0 * bars.margin)
+    # Smaller values stay within the grown limits, which are not shrunk again
+    send(bars, 5.0)
+    assert bars.draws == {"full": 2, "blit": 2}
+    assert bars.ax.get_ylim()[1] == pytest.approx(10.0 * bars.margin)
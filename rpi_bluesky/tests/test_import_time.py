@@ -0,0 +1,41 @@
+import json
+import subprocess
+import sys
+
+import pytest
+
+# Self and cumulative import time, in microseconds, that rpi_bluesky may add on top of ophyd itself
+IMPORT_BUDGET_US = 50_000
+
+HEAVY_MODULES = ("RPi", "board", "busio", "adafruit_as7341", "bluesky", "matplotlib", "PyQt5", "qtpy")
+
+
+def _import_profile(module):
+    """Import `module` in a fresh interpreter with ophyd preloaded, returning its cost and what it loaded."""
+    code = (
+        "import json, sys, threading; import ophyd; "
+        f"import {module}; "
+        "print(json.dumps([sorted(sys.modules), threading.active_count()]))"
+    )
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True, check=True
+    )
+    modules, threads = json.loads(proc.stdout)
+    cumulative = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cum, name = line.split("|")
+        if cum.strip().isdigit():
+            cumulative[name.strip()] = int(cum)
+    return cumulative.get(module, 0), set(modules), threads
+
+
+@pytest.mark.parametrize("module", ["rpi_bluesky", "rpi_bluesky.ophyd", "rpi_bluesky.ophyd.adafruit"])
+def test_import_is_cheap(module):
+    cost, modules, threads = _import_profile(module)
+    loaded = {name for name in modules if name.split(".")[0] in HEAVY_MODULES}
+    assert not loaded, f"importing {module} loaded {sorted(loaded)}"
+    # No control layer, and so no dispatcher threads, is created at import
+    assert threads == 1
+    assert cost < IMPORT_BUDGET_US, f"importing {module} took {cost} us"
@@ -0,0 +1,68 @@
+import threading
+
+import pytest
+from bluesky import RunEngine
+from bluesky.run_engine import WaitForTimeoutError
+
+from rpi_bluesky.ophyd import RpiInputSignal
+from rpi_bluesky.ophyd.backends import RISING
+from rpi_bluesky.ophyd.base import get_control_layer
+from rpi_bluesky.plan_stubs import wait_for_edge
+
+
+@pytest.fixture
+def backend():
+    return get_control_layer().backend
+
+
+def test_edges_reach_subscribers(backend):
+    button = RpiInputSignal(23, pull="down", name="button")
+    assert button.get() == 0
+    seen = []
+    done = threading.Event()
+
+    def cb(value, timestamp, **kwargs):
+        seen.append((value, timestamp))
+        if len(seen) == 2:
+            done.set()
+
+    button.subscribe(cb, run=False)
+    calls = backend.calls["input"]
+    backend.drive(23, 1)
+    backend.drive(23, 0)
+    assert done.wait(1)
+    assert [v for v, _ in seen] == [1, 0]
+    assert seen[0][1] <= seen[1][1]
+    # Reads are served from the pushed value
+    button.get()
+    assert backend.calls["input"] - calls == 2
+    button.destroy()
+
+
+def test_debounce_coalesces_bounces(backend):
+    button = RpiInputSignal(24, pull="down", debounce_time=0.05, name="button")
+    status = button.edge_status(RISING, timeout=1)
+    seen = []
+    button.subscribe(lambda value, **kwargs: seen.append(value), run=False)
+    for level in (1, 0, 1, 0, 1):
+        backend.drive(24, level)
+    status.wait(1)
+    assert seen == [1]
+    button.destroy()
+
+
+def test_plan_wakes_on_edge(backend):
+    button = RpiInputSignal(25, pull="up", name="button")
+    timer = threading.Timer(0.1, backend.drive, args=(25, 0))
+    timer.start()
+    RE = RunEngine(call_returns_result=True)
+    assert RE(wait_for_edge(button, "falling", timeout=2)).plan_result == 0
+    button.destroy()
+
+
+def test_wait_for_edge_times_out(backend):
+    button = RpiInputSignal(26, pull="down", name="button")
+    RE = RunEngine()
+    with pytest.raises(WaitForTimeoutError):
+        RE(wait_for_edge(button, "rising", timeout=0.1))
+    button.destroy()
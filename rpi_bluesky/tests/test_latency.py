@@ -0,0 +1,66 @@
+import bluesky.plan_stubs as bps
+import bluesky.preprocessors as bpp
+from bluesky import RunEngine
+
+from rpi_bluesky.ophyd import RpiPWM, RpiSignal, SimulatedGPIOBackend
+from rpi_bluesky.ophyd.base import RpiControlLayer
+from rpi_bluesky.ophyd.latency import LatencyHistogram
+from rpi_bluesky.preprocessors import record_latency_wrapper
+
+
+def test_histogram_buckets():
+    histogram = LatencyHistogram(bounds=(1e-6, 1e-3, 1.0))
+    for seconds in (5e-7, 2e-6, 2e-6, 0.5, 10.0):
+        histogram.record(seconds)
+    assert histogram.counts == [1, 2, 1, 1]
+    assert histogram.count == 5
+    assert histogram.quantile(0.5) == 1e-3
+    assert histogram.quantile(1.0) == float("inf")
+
+
+def test_signals_record_latency(tmp_path):
+    cl = RpiControlLayer(backend=SimulatedGPIOBackend(latency={"output": 1e-3}))
+    led = RpiSignal(17, name="led", cl=cl)
+    pwm = RpiPWM(17, name="pwm", cl=cl, settle_time=1e-3)
+    for _ in range(3):
+        led.put(1)
+        led.get()
+    pwm.set(50.0).wait(1)
+
+    histograms = cl.latency_histograms()
+    assert histograms["led"]["put"]["count"] == 3
+    assert histograms["led"]["put"]["mean"] >= 1e-3
+    assert histograms["led"]["get"]["count"] == 3
+    assert histograms["pwm"]["put"]["count"] == 1
+    assert histograms["pwm"]["set"]["mean"] >= 1e-3
+
+    path = tmp_path / "rpi_bluesky.prom"
+    cl.latency.write_prometheus(path)
+    text = path.read_text()
+    assert "# TYPE rpi_bluesky_hardware_latency_seconds histogram" in text
+    assert 'rpi_bluesky_hardware_latency_seconds_count{signal="led",operation="put"} 3' in text
+    assert 'rpi_bluesky_hardware_latency_seconds_bucket{signal="led",operation="get",le="+Inf"} 3' in text
+    cl._cleanup()
+
+
+def test_latency_stream_at_run_stop(tmp_path):
+    cl = RpiControlLayer(backend=SimulatedGPIOBackend())
+    led = RpiSignal(18, name="led", cl=cl)
+
+    @bpp.run_decorator()
+    def plan():
+        for level in (1, 0, 1):
+            yield from bps.mv(led, level)
+            yield from bps.trigger_and_read([led])
+
+    docs = []
+    path = tmp_path / "rpi_bluesky.prom"
+    RE = RunEngine()
+    RE(record_latency_wrapper(plan(), cl, textfile=path), lambda name, doc: docs.append((name, doc)))
+    descriptors = {doc["uid"]: doc["name"] for name, doc in docs if name == "descriptor"}
+    latency = [doc for name, doc in docs if name == "event" and descriptors[doc["descriptor"]] == "latency"]
+    assert len(latency) == 1
+    assert sum(latency[0]["data"]["latency_led_put_counts"]) == 3
+    assert docs[-1][0] == "stop"
+    assert path.exists()
+    cl._cleanup()
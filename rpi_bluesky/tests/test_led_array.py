@@ -0,0 +1,67 @@
+import json
+
+import bluesky.plan_stubs as bps
+import bluesky.preprocessors as bpp
+import numpy as np
+import pytest
+from bluesky import RunEngine
+
+from rpi_bluesky.ophyd import SimulatedGPIOBackend
+from rpi_bluesky.ophyd.base import RpiControlLayer
+from rpi_bluesky.ophyd.devices import LEDArray
+
+
+@pytest.fixture
+def cl():
+    cl = RpiControlLayer(backend=SimulatedGPIOBackend())
+    yield cl
+    cl._cleanup()
+
+
+def test_set_touches_only_changed_channels(cl):
+    leds = LEDArray(range(4, 20), name="leds", cl=cl, settle_time=1e-3)
+    engine = cl.pwm_engine
+    updates = []
+    engine._update = lambda pairs: updates.append([(ch.pin, dc) for ch, dc in pairs])
+
+    values = np.zeros(16)
+    values[[1, 5]] = [10.0, 50.0]
+    leds.set(values).wait(1)
+    assert updates == [[(5, 10.0), (9, 50.0)]]
+    leds.set(values).wait(1)
+    assert len(updates) == 1
+    with pytest.raises(ValueError):
+        leds.set(np.full(16, 101.0))
+
+    reading = leds.read()[leds.duty_cycles.name]["value"]
+    np.testing.assert_array_equal(reading, values)
+    assert leds.describe()[leds.duty_cycles.name]["shape"] == [16]
+
+
+def test_from_pin_map(cl, tmp_path):
+    path = tmp_path / "pins.json"
+    path.write_text(json.dumps({"450nm": 5, "520nm": 6, "630nm": 13}))
+    leds = LEDArray.from_pin_map(path, name="leds", cl=cl)
+    assert leds.pins == [5, 6, 13]
+    assert leds.labels == ["450nm", "520nm", "630nm"]
+
+
+def test_scan_one_message_per_step(cl):
+    leds = LEDArray(range(4, 28), name="leds", cl=cl, settle_time=1e-3)
+    steps = [np.linspace(0, 100, 24) * i / 4 for i in range(5)]
+
+    @bpp.run_decorator()
+    def plan():
+        for step in steps:
+            yield from bps.mv(leds, step)
+            yield from bps.trigger_and_read([leds])
+
+    docs, msgs = [], []
+    RE = RunEngine()
+    RE.msg_hook = msgs.append
+    RE(plan(), lambda name, doc: docs.append((name, doc)))
+    events = [doc for name, doc in docs if name == "event"]
+    assert len(events) == 5
+    assert len([msg for msg in msgs if msg.command == "set"]) == 5
+    np.testing.assert_allclose(events[-1]["data"][leds.duty_cycles.name], steps[-1])
+    assert [pwm.duty_cycle for pwm in leds.pwms] == pytest.approx(steps[-1].tolist())
@@ -0,0 +1,135 @@
+import numpy as np
+import pytest
+from bluesky import RunEngine
+from ophyd import Component, Device, DeviceStatus, Signal
+
+from rpi_bluesky.ophyd import SimulatedGPIOBackend, base
+from rpi_bluesky.ophyd.base import configure_control_layer
+from rpi_bluesky.ophyd.devices import RGB_LED
+from rpi_bluesky.plans import calibrate_response, refine_scan, set_spectrum, target_spectrum
+
+# Counts per % duty cycle of red, green and blue in each of the 8 visible channels, and the dark counts
+RESPONSE = np.array(
+    [
+        [0.0, 5.0, 60.0],
+        [0.0, 10.0, 120.0],
+        [1.0, 40.0, 90.0],
+        [2.0, 110.0, 30.0],
+        [10.0, 150.0, 5.0],
+        [40.0, 60.0, 0.0],
+        [120.0, 10.0, 0.0],
+        [150.0, 2.0, 0.0],
+    ]
+)
+DARK = np.full(8, 20.0)
+
+
+class LinearSpectrometer(Device):
+    """Stand in for the AS7341Detector whose visible channels respond linearly to an RGB_LED."""
+
+    visible = Component(Signal, value=np.zeros(8), kind="hinted")
+
+    def __init__(self, led, response=RESPONSE, dark=DARK, noise=0.0, **kwargs):
+        super().__init__(**kwargs)
+        self.led = led
+        self.response = response
+        self.dark = dark
+        self.noise = noise
+        self.reads = 0
+        self._rng = np.random.default_rng(0)
+
+    def trigger(self):
+        spectrum = self.response @ np.asarray(self.led.color.get()) + self.dark
+        self.visible.put(spectrum * (1 + self.noise * self._rng.standard_normal(8)))
+        self.reads += 1
+        status = DeviceStatus(self)
+        status.set_finished()
+        return status
+
+
+@pytest.fixture
+def rig(monkeypatch):
+    # RGB_LED builds its channels on the default control layer, so each rig gets a default layer of its own
+    monkeypatch.setattr(base, "_rpi_control_layer", None)
+    cl = configure_control_layer(SimulatedGPIOBackend())
+    led = RGB_LED(name="rgb")
+    assert all(channel.pwm.cl is cl for channel in led.channels)
+    for channel in led.channels:
+        channel.pwm._settle_time = 1e-4
+    yield led, LinearSpectrometer(led, name="det")
+    cl._cleanup()
+
+
+@pytest.mark.parametrize("shape_only", [False, True])
+def test_target_spectrum_converges(rig, shape_only):
+    led, det = rig
+    goal = np.array([30.0, 70.0, 20.0])
+    target = RESPONSE @ goal + DARK
+    RE = RunEngine(call_returns_result=True)
+    result = RE(target_spectrum(led, det, target, shape_only=shape_only, initial=(50.0, 50.0, 50.0)))
+    color, residual = result.plan_result
+    assert residual <= 0.02
+    assert det.reads < 20
+    assert led.color.get() == pytest.approx(list(color))
+    if not shape_only:
+        np.testing.assert_allclose(color, goal, atol=2.0)
+
+
+def test_calibration_is_cached(rig, tmp_path):
+    led, det = rig
+    path = tmp_path / "calibration.json"
+    RE = RunEngine(call_returns_result=True)
+    calibration = RE(calibrate_response(led, det, cache_path=path)).plan_result
+    assert det.reads == 7
+    np.testing.assert_allclose(calibration.response, RESPONSE, atol=1e-9)
+    np.testing.assert_allclose(calibration.dark, DARK)
+
+    goal = np.array([30.0, 70.0, 20.0])
+    color = RE(set_spectrum(led, det, RESPONSE @ goal + DARK, cache_path=path)).plan_result
+    assert det.reads == 7
+    np.testing.assert_allclose(color, goal, atol=1e-9)
+    assert led.color.get() == pytest.approx(list(goal))
+
+    RE(calibrate_response(led, det, cache_path=path, force=True))
+    assert det.reads == 14
+
+
+def led_response(duty_cycle):
+    """Dark below a threshold, a sharp knee, then a slow rise to saturation"""
+    return (
+        1000
+        * np.clip((duty_cycle - 20) / 15, 0, None) ** 0.5
+        / (1 + np.clip((duty_cycle - 20) / 15, 0, None) ** 0.5)
+    )
+
+
+class Photodiode(Device):
+    clear = Component(Signal, value=0.0, kind="hinted")
+
+    def __init__(self, pwm, **kwargs):
+        super().__init__(**kwargs)
+        self.pwm = pwm
+        self.reads = 0
+
+    def trigger(self):
+        self.clear.put(float(led_response(self.pwm.get())))
+        self.reads += 1
+        status = DeviceStatus(self)
+        status.set_finished()
+        return status
+
+
+def test_refine_scan_beats_uniform_scan(rig):
+    led, _ = rig
+    diode = Photodiode(led.red.pwm, name="diode")
+    RE = RunEngine(call_returns_result=True)
+    x, y = RE(refine_scan([diode], diode.clear.name, led.red.pwm, 0.0, 100.0, max_points=25)).plan_result
+    assert diode.reads == len(x) <= 25
+    assert np.all(np.diff(x) > 0)
+    np.testing.assert_allclose(y, led_response(x))
+
+    truth = np.linspace(0, 100, 2001)
+    uniform = np.linspace(0, 100, 50)
+    adaptive_error = np.abs(np.interp(truth, x, y) - led_response(truth)).max()
+    uniform_error = np.abs(np.interp(truth, uniform, led_response(uniform)) - led_response(truth)).max()
+    assert adaptive_error <= uniform_error
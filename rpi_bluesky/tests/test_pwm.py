@@ -0,0 +1,174 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from rpi_bluesky.ophyd import RpiPWM, RpiSignal, SimulatedGPIOBackend
+from rpi_bluesky.ophyd.backends import OUT
+from rpi_bluesky.ophyd.base import RpiControlLayer
+
+
+def test_set_does_not_block_and_settles():
+    RpiSignal(12, name="io")
+    pwm = RpiPWM(12, name="pwm", settle_time=0.2)
+    t0 = time.monotonic()
+    status = pwm.set(25.0)
+    assert time.monotonic() - t0 < 0.1
+    assert pwm.get() == 25.0
+    assert not status.done
+    status.wait(1)
+    assert status.success
+    assert time.monotonic() - t0 >= 0.2
+
+
+def test_concurrent_sets_overlap_settle():
+    pwms = []
+    for pin in (16, 20, 21):
+        RpiSignal(pin, name=f"io{pin}")
+        pwms.append(RpiPWM(pin, name=f"pwm{pin}", settle_time=0.2))
+    t0 = time.monotonic()
+    statuses = [pwm.set(50.0) for pwm in pwms]
+    for status in statuses:
+        status.wait(1)
+    assert time.monotonic() - t0 < 0.4
+
+
+def test_channels_share_one_thread():
+    cl = RpiControlLayer(backend=SimulatedGPIOBackend())
+    pwms = []
+    for pin in (20, 21, 22, 23):
+        cl.backend.setup(pin, OUT)
+        pwms.append(RpiPWM(pin, name=f"pwm{pin}", cl=cl, frequency=200, settle_time=1e-6))
+    cl.set_duty_cycles([pwm.pwm for pwm in pwms], [0, 25, 50, 100])
+    time.sleep(0.05)
+    stats = cl.thread_stats()["pwm_engine"]
+    assert stats["threads"] == 1
+    assert stats["channels"] == 4
+    assert stats["writes"] > 1
+    assert stats["cpu_time"] > 0
+    assert cl.backend.input(20) == 0
+    assert cl.backend.input(23) == 1
+    cl._cleanup()
+    assert cl.thread_stats()["pwm_engine"]["threads"] == 0
+
+
+def test_stopped_channel_goes_low():
+    cl = RpiControlLayer(backend=SimulatedGPIOBackend())
+    cl.backend.setup(24, OUT)
+    pwm = RpiPWM(24, name="pwm", cl=cl, settle_time=1e-6)
+    pwm.put(100.0)
+    time.sleep(0.01)
+    assert cl.backend.input(24) == 1
+    pwm.pwm.stop()
+    time.sleep(0.01)
+    assert cl.backend.input(24) == 0
+    cl._cleanup()
+
+
+def test_waveform_playback():
+    cl = RpiControlLayer(backend=SimulatedGPIOBackend())
+    cl.backend.setup(25, OUT)
+    pwm = RpiPWM(25, name="pwm", cl=cl, settle_time=1e-3)
+    waveform = np.linspace(0, 100, 50)
+    t0 = time.time()
+    status = pwm.play_waveform(waveform, 2e-3)
+    status.wait(1)
+    assert status.success
+    assert pwm.get() == 100.0
+    assert pwm.pwm.duty_cycle == 100.0
+    timestamps = pwm.waveform_timestamps
+    assert np.all(np.diff(timestamps) > 0)
+    # Samples are scheduled against the start time, so the whole waveform does not drift
+    assert timestamps[0] >= t0
+    assert timestamps[-1] - timestamps[0] == pytest.approx(49 * 2e-3, abs=5e-3)
+    cl._cleanup()
+
+
+def test_put_stops_waveform():
+    cl = RpiControlLayer(backend=SimulatedGPIOBackend())
+    cl.backend.setup(26, OUT)
+    pwm = RpiPWM(26, name="pwm", cl=cl)
+    status = pwm.play_waveform(np.full(100, 50.0), 0.01)
+    pwm.put(10.0)
+    with pytest.raises(RuntimeError):
+        status.wait(1)
+    assert pwm.get() == 10.0
+    assert np.isnan(pwm.waveform_timestamps[-1])
+    cl._cleanup()
+
+
+def test_play_waveform_plan():
+    from bluesky import RunEngine
+
+    from rpi_bluesky.ophyd.devices import LED
+    from rpi_bluesky.plan_stubs import play_waveform
+
+    led = LED(7, name="led")
+    RE = RunEngine(call_returns_result=True)
+    result = RE(play_waveform(led, [10.0, 20.0, 30.0], 1e-3, timeout=1))
+    assert len(result.plan_result) == 3
+    assert led.pwm.get() == 30.0
+
+
+def test_standalone_pwm_sets_up_its_pin():
+    cl = RpiControlLayer(backend=SimulatedGPIOBackend())
+    pwm = RpiPWM(9, name="pwm", cl=cl, settle_time=1e-6)
+    pwm.put(100.0)
+    time.sleep(0.01)
+    assert cl.backend.input(9) == 1
+    assert cl.thread_stats()["pwm_engine"]["threads"] == 1
+    cl._cleanup()
+
+
+def test_bad_channel_is_dropped_without_stopping_the_engine():
+    cl = RpiControlLayer(backend=SimulatedGPIOBackend())
+    good = RpiPWM(10, name="good", cl=cl, settle_time=1e-6)
+    # A channel made straight from the engine, on a pin never set up
+    bad = cl.pwm_engine.pwm(11, 100.0)
+    bad.start(100.0)
+    good.put(100.0)
+    time.sleep(0.02)
+    assert cl.backend.input(10) == 1
+    assert cl.thread_stats()["pwm_engine"]["threads"] == 1
+    assert isinstance(bad.error, RuntimeError)
+    with pytest.raises(RuntimeError):
+        bad.ChangeDutyCycle(50.0)
+    good.put(0.0)
+    time.sleep(0.02)
+    assert cl.backend.input(10) == 0
+    cl._cleanup()
+
+
+def test_pwm_holds_static_level_over_direct_writes():
+    cl = RpiControlLayer(backend=SimulatedGPIOBackend())
+    io = RpiSignal(13, name="io", cl=cl)
+    pwm = RpiPWM(13, name="pwm", cl=cl, settle_time=1e-6)
+    pwm.put(0.0)
+    time.sleep(0.01)
+    # As with RPi.GPIO's software PWM, a channel at 0% holds the pin low even when switched on directly
+    io.put(1)
+    time.sleep(0.01)
+    assert cl.backend.input(13) == 0
+    pwm.put(100.0)
+    time.sleep(0.01)
+    io.put(0)
+    time.sleep(0.01)
+    assert cl.backend.input(13) == 1
+    cl._cleanup()
+
+
+def test_stopped_waveform_fails_the_plan():
+    from bluesky import RunEngine
+
+    from rpi_bluesky.ophyd.devices import LED
+    from rpi_bluesky.plan_stubs import play_waveform
+
+    led = LED(8, name="led")
+    RE = RunEngine()
+    stopper = threading.Timer(0.05, led.pwm.put, args=(10.0,))
+    stopper.start()
+    with pytest.raises(RuntimeError, match="stopped"):
+        RE(play_waveform(led, np.full(100, 50.0), 0.01, timeout=5))
+    stopper.join()
+    assert led.pwm.get() == 10.0
@@ -0,0 +1,58 @@
+import json
+
+import bluesky.plan_stubs as bps
+import bluesky.preprocessors as bpp
+from bluesky import RunEngine
+
+from rpi_bluesky.ophyd import RpiPWM, RpiSignal, SimulatedGPIOBackend
+from rpi_bluesky.ophyd.base import RpiControlLayer
+from rpi_bluesky.ophyd.tracing import get_tracer, tracing
+from rpi_bluesky.preprocessors import trace_wrapper
+
+
+def test_trace_nests_hardware_in_messages(tmp_path):
+    cl = RpiControlLayer(backend=SimulatedGPIOBackend())
+    led = RpiSignal(17, name="led", cl=cl)
+    pwm = RpiPWM(17, name="pwm", cl=cl, settle_time=1e-3)
+
+    @bpp.run_decorator()
+    def plan():
+        yield from bps.mv(pwm, 40.0)
+        yield from bps.mv(led, 1)
+        yield from bps.trigger_and_read([led])
+
+    path = tmp_path / "trace.json"
+    RE = RunEngine()
+    with tracing(path):
+        RE(trace_wrapper(plan()))
+    assert get_tracer() is None
+
+    events = json.loads(path.read_text())["traceEvents"]
+    spans = [e for e in events if e["ph"] == "X"]
+    by_name = {}
+    for e in spans:
+        by_name.setdefault(e["name"], []).append(e)
+    assert {"open_run", "set", "wait", "trigger", "read", "close_run"} <= set(by_name)
+
+    # The GPIO write of the PWM happens inside the set message, on the same thread
+    put = by_name["pwm.put"][0]
+    set_msg = next(e for e in by_name["set"] if e["args"]["obj"] == "pwm")
+    assert put["tid"] == set_msg["tid"]
+    assert set_msg["ts"] <= put["ts"] and put["ts"] + put["dur"] <= set_msg["ts"] + set_msg["dur"]
+    assert "led.put" in by_name and "led.get" in by_name
+
+    # The Status of the PWM is an async span covering its settle time
+    begin = next(e for e in events if e["ph"] == "b" and e["name"] == "pwm.set")
+    end = next(e for e in events if e["ph"] == "e" and e["id"] == begin["id"])
+    assert end["ts"] - begin["ts"] >= 1e3
+    assert any(e["ph"] == "M" and e["name"] == "thread_name" for e in events)
+    cl._cleanup()
+
+
+def test_no_spans_without_tracer():
+    cl = RpiControlLayer(backend=SimulatedGPIOBackend())
+    led = RpiSignal(18, name="led", cl=cl)
+    RE = RunEngine()
+    RE(trace_wrapper(bps.mv(led, 1)))
+    assert led.get() == 1
+    cl._cleanup()
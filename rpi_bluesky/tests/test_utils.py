@@ -0,0 +1,37 @@
+import numpy as np
+
+from rpi_bluesky.utils import RingBuffer
+
+
+def test_ring_buffer_drain_and_latest():
+    buffer = RingBuffer(4, shape=(2,), dtype=np.uint16)
+    for i in range(3):
+        buffer.append([i, i], float(i))
+    data, timestamps = buffer.drain()
+    assert data[:, 0].tolist() == [0, 1, 2]
+    assert timestamps.tolist() == [0.0, 1.0, 2.0]
+    assert len(buffer.drain()[0]) == 0
+    buffer.append([3, 3], 3.0)
+    assert buffer.latest(2)[0][:, 0].tolist() == [2, 3]
+
+
+def test_ring_buffer_overwrites_oldest():
+    buffer = RingBuffer(3)
+    for i in range(5):
+        buffer.append(i, float(i))
+    data, _ = buffer.drain()
+    assert data.tolist() == [2, 3, 4]
+    assert buffer.dropped == 2
+    assert len(buffer) == 3
+
+
+def test_ring_buffer_extend_matches_append():
+    extended, appended = RingBuffer(4), RingBuffer(4)
+    extended.append(0, 0.0)
+    appended.append(0, 0.0)
+    rows = np.arange(1, 7)
+    extended.extend(rows, rows.astype(float))
+    for i in rows:
+        appended.append(i, float(i))
+    assert extended.drain()[0].tolist() == appended.drain()[0].tolist() == [3, 4, 5, 6]
+    assert extended.dropped == appended.dropped == 3
@@ -0,0 +1,66 @@
+import threading
+
+import bluesky.plan_stubs as bps
+import bluesky.preprocessors as bpp
+import numpy as np
+from bluesky import RunEngine
+from ophyd import Signal
+
+from rpi_bluesky.writers import ColumnarWriter, _NpzSink, load_run
+
+
+def readings_plan(visible, clear, n):
+    @bpp.run_decorator(md={"purpose": "test"})
+    def plan():
+        for i in range(n):
+            yield from bps.mv(visible, np.arange(8, dtype=np.uint16) + i, clear, float(i))
+            yield from bps.trigger_and_read([visible, clear])
+
+    return plan()
+
+
+def test_npz_round_trip(tmp_path):
+    visible = Signal(name="visible", value=np.zeros(8, dtype=np.uint16))
+    clear = Signal(name="clear", value=0.0)
+    writer = ColumnarWriter(tmp_path, chunk_size=4, flush_interval=60)
+    RE = RunEngine()
+    RE.subscribe(writer)
+    RE(readings_plan(visible, clear, 10))
+    writer.wait()
+
+    (path,) = writer.paths
+    assert path.suffix == ".npz" and path.exists()
+    assert not path.with_suffix(".segments").exists()
+    streams, start, stop = load_run(path)
+    primary = streams["primary"]
+    # Ten rows written in chunks of four, as one uint16 block
+    assert primary["visible"].dtype == np.uint16
+    assert primary["visible"].shape == (10, 8)
+    np.testing.assert_array_equal(primary["visible"][:, 0], np.arange(10))
+    np.testing.assert_array_equal(primary["clear"], np.arange(10.0))
+    np.testing.assert_array_equal(primary["seq_num"], np.arange(1, 11))
+    assert start["purpose"] == "test"
+    assert stop["exit_status"] == "success"
+
+
+def test_writes_never_block_the_run(tmp_path, monkeypatch):
+    release = threading.Event()
+    write = _NpzSink.write
+
+    def slow_write(self, stream, columns):
+        release.wait(10)
+        write(self, stream, columns)
+
+    monkeypatch.setattr(_NpzSink, "write", slow_write)
+    visible = Signal(name="visible", value=np.zeros(8, dtype=np.uint16))
+    clear = Signal(name="clear", value=0.0)
+    writer = ColumnarWriter(tmp_path, chunk_size=2, flush_interval=0)
+    RE = RunEngine()
+    RE.subscribe(writer)
+    # The run finishes while every write is still held up on the writer thread
+    RE(readings_plan(visible, clear, 6))
+    assert not writer.paths[0].exists()
+    release.set()
+    writer.wait()
+    streams, _, _ = load_run(writer.paths[0])
+    assert streams["primary"]["visible"].shape == (6, 8)
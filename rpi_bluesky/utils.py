@@ -0,0 +1,87 @@
+import threading
+from typing import Tuple
+
+import numpy as np
+
+
+class RingBuffer:
+    """
+    Preallocated circular buffer of fixed-shape rows and their timestamps.
+
+    Memory is allocated once up front, so a writer thread can append samples at a steady rate for as long as
+    it runs. Readers either `drain` the rows appended since the last drain, or look at the `latest` rows.
+    If the writer laps a reader that is not draining fast enough, the oldest rows are overwritten and counted
+    in `dropped`.
+
+    Parameters
+    ----------
+    capacity: int
+        Number of rows held
+    shape: tuple
+        Shape of a single row
+    dtype:
+        NumPy dtype of the rows
+    """
+
+    def __init__(self, capacity: int, shape: Tuple[int, ...] = (), dtype=float):
+        if capacity < 1:
+            raise ValueError(f"Capacity must be at least 1. {capacity} is invalid.")
+        self.capacity = capacity
+        self.data = np.zeros((capacity, *shape), dtype=dtype)
+        self.timestamps = np.zeros(capacity, dtype=float)
+        self.dropped = 0
+        # Total number of rows ever appended, and the total at the last drain
+        self._count = 0
+        self._drained = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return min(self._count, self.capacity)
+
+    def append(self, row, timestamp: float):
+        with self._lock:
+            index = self._count % self.capacity
+            self.data[index] = row
+            self.timestamps[index] = timestamp
+            self._count += 1
+            if self._count - self._drained > self.capacity:
+                self._drained += 1
+                self.dropped += 1
+
+    def extend(self, rows, timestamps):
+        """Append a block of rows and their timestamps in one vectorized copy, as `append` would one by one."""
+        rows = np.asarray(rows)
+        n = len(rows)
+        # Rows that would be overwritten within this block are never copied
+        skipped = max(0, n - self.capacity)
+        with self._lock:
+            indices = np.arange(self._count + skipped, self._count + n) % self.capacity
+            self.data[indices] = rows[skipped:]
+            self.timestamps[indices] = np.asarray(timestamps, dtype=float)[skipped:]
+            self._count += n
+            overrun = self._count - self._drained - self.capacity
+            if overrun > 0:
+                self._drained += overrun
+                self.dropped += overrun
+
+    def _ordered(self, start: int, stop: int) -> Tuple[np.ndarray, np.ndarray]:
+        indices = np.arange(start, stop) % self.capacity
+        return self.data[indices], self.timestamps[indices]
+
+    def drain(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Copies of the rows and timestamps appended since the last drain, oldest first."""
+        with self._lock:
+            start, self._drained = self._drained, self._count
+            return self._ordered(start, self._count)
+
+    def latest(self, n: int = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Copies of the most recent `n` rows and timestamps (default all held), oldest first."""
+        with self._lock:
+            n = len(self) if n is None else min(n, len(self))
+            return self._ordered(self._count - n, self._count)
+
+    def clear(self):
+        with self._lock:
+            self._count = 0
+            self._drained = 0
+            self.dropped = 0
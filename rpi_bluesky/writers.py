@@ -0,0 +1,329 @@
+"""
+A lightweight on-Pi store for run data, without a database.
+
+`ColumnarWriter` is a document callback that appends event data to per-stream NumPy column buffers, e.g. the
+eight visible AS7341 channels as a 2D uint16 block, and hands full buffers to a background thread that writes
+them in bulk. The RunEngine thread only ever copies values into preallocated arrays, so disk I/O never blocks
+a plan.
+"""
+
+import json
+import logging
+import queue
+import shutil
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+from bluesky.callbacks.core import CallbackBase
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("npz", "hdf5")
+
+
+class _ColumnBuffer:
+    """Preallocated rows of one stream, allocated from the first row seen. Non numeric values are kept in lists."""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.columns = None
+        self.size = 0
+
+    def _allocate(self, row):
+        self.columns = {}
+        for key, value in row.items():
+            value = np.asarray(value)
+            if value.dtype.kind in "biufc":
+                self.columns[key] = np.empty((self.capacity, *value.shape), dtype=value.dtype)
+            else:
+                self.columns[key] = []
+        self.size = 0
+
+    @property
+    def full(self):
+        return self.columns is not None and self.size >= self.capacity
+
+    def append(self, row):
+        if self.columns is None:
+            self._allocate(row)
+        for key, column in self.columns.items():
+            if isinstance(column, list):
+                column.append(row[key])
+            else:
+                column[self.size] = row[key]
+        self.size += 1
+
+    def take(self):
+        """The rows held, handing the arrays over to the caller and starting new ones, or None if empty."""
+        if not self.size:
+            return None
+        columns = {
+            key: np.asarray(column) if isinstance(column, list) else column[: self.size]
+            for key, column in self.columns.items()
+        }
+        self.columns = {
+            key: [] if isinstance(column, list) else np.empty_like(column) for key, column in self.columns.items()
+        }
+        self.size = 0
+        return columns
+
+
+class _NpzSink:
+    """Writes each flush as a segment file, and consolidates the segments into a single ``.npz`` at the end."""
+
+    suffix = ".npz"
+
+    def __init__(self, stem: Path):
+        self.path = stem.with_suffix(".npz")
+        self.segments_dir = stem.with_suffix(".segments")
+        self.segments_dir.mkdir(parents=True, exist_ok=True)
+        self.segments = []
+
+    def write(self, stream, columns):
+        path = self.segments_dir / f"{len(self.segments):06d}.npz"
+        np.savez(path, **columns)
+        self.segments.append((stream, path))
+
+    def close(self, start, stop):
+        merged = {}
+        for stream, path in self.segments:
+            with np.load(path) as segment:
+                for key in segment.files:
+                    merged.setdefault(f"{stream}/{key}", []).append(segment[key])
+        arrays = {key: np.concatenate(parts) for key, parts in merged.items()}
+        arrays["start"] = np.array(json.dumps(start))
+        arrays["stop"] = np.array(json.dumps(stop))
+        tmp = self.path.with_name(self.path.name + ".tmp.npz")
+        np.savez(tmp, **arrays)
+        tmp.replace(self.path)
+        shutil.rmtree(self.segments_dir)
+
+
+class _HDF5Sink:
+    """Appends each flush to resizable datasets, one group per stream."""
+
+    suffix = ".h5"
+
+    def __init__(self, stem: Path):
+        import h5py
+
+        self.h5py = h5py
+        self.path = stem.with_suffix(".h5")
+        self.file = h5py.File(self.path, "w")
+
+    def write(self, stream, columns):
+        group = self.file.require_group(stream)
+        for key, column in columns.items():
+            if column.dtype.kind in "UO":
+                column = column.astype(object)
+                dtype = self.h5py.string_dtype()
+            else:
+                dtype = column.dtype
+            if key not in group:
+                group.create_dataset(
+                    key, data=column, dtype=dtype, maxshape=(None, *column.shape[1:]), chunks=True
+                )
+            else:
+                dataset = group[key]
+                n = dataset.shape[0]
+                dataset.resize(n + len(column), axis=0)
+                dataset[n:] = column
+        self.file.flush()
+
+    def close(self, start, stop):
+        self.file.attrs["start"] = json.dumps(start)
+        self.file.attrs["stop"] = json.dumps(stop)
+        self.file.close()
+
+
+SINKS = {"npz": _NpzSink, "hdf5": _HDF5Sink}
+
+
+class _PendingSink:
+    """Stands in for a sink until the writer thread has opened it. Only ever used from the writer thread."""
+
+    def __init__(self):
+        self.sink = None
+
+    def resolve(self, open_sink, stem):
+        self.sink = open_sink(stem)
+
+    def write(self, stream, columns):
+        self.sink.write(stream, columns)
+
+    def close(self, start, stop):
+        self.sink.close(start, stop)
+
+
+class ColumnarWriter(CallbackBase):
+    """
+    Accumulate event data per stream in NumPy column buffers and write them in bulk to a local file.
+
+    Each run is written to ``<directory>/<file_prefix>.npz`` or ``.h5``. Every data key becomes a column,
+    alongside the event ``time`` and ``seq_num``, under ``<stream>/<key>``; the start and stop documents are
+    stored as JSON. Buffers are handed to a background writer thread when full, every `flush_interval`
+    seconds, and at the end of the run. An ``.npz`` run is written as segment files during the run, merged
+    into one file once it stops, so a crash loses at most the last interval.
+
+    Parameters
+    ----------
+    directory: str or Path
+        Directory the files are written to, created if needed
+    file_format: str
+        "npz" (default), or "hdf5" which requires h5py
+    flush_interval: float
+        Seconds between bulk writes of the buffered rows. Defaults to 5.
+    chunk_size: int
+        Rows buffered per stream before a write regardless of the interval. Defaults to 1024.
+    file_prefix: str
+        Template for the file name, formatted with the start document. Defaults to ``"scan{scan_id}_{uid:.8}"``.
+    """
+
+    def __init__(
+        self,
+        directory,
+        *,
+        file_format="npz",
+        flush_interval=5.0,
+        chunk_size=1024,
+        file_prefix="scan{scan_id}_{uid:.8}",
+    ):
+        super().__init__()
+        if file_format not in FORMATS:
+            raise ValueError(f"File format must be one of {FORMATS}. {file_format} is invalid.")
+        if file_format == "hdf5":
+            # Fail at construction rather than when the first run starts
+            import h5py  # noqa: F401
+        self.directory = Path(directory).expanduser()
+        self.file_format = file_format
+        self.flush_interval = flush_interval
+        self.chunk_size = chunk_size
+        self.file_prefix = file_prefix
+        # Path of each run started, which exists once the run has stopped and its data has been written
+        self.paths = []
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start = None
+        self._sink = None
+        self._streams = {}
+        self._buffers = {}
+        self._last_flush = 0.0
+
+    def _submit(self, task, *args):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._write_loop, name="rpi_bluesky_writer", daemon=True)
+            self._thread.start()
+        self._queue.put((task, args))
+
+    def _write_loop(self):
+        while True:
+            task, args = self._queue.get()
+            try:
+                task(*args)
+            except Exception:
+                logger.exception("Writing run data failed.")
+            finally:
+                self._queue.task_done()
+
+    def _open(self, stem):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        return SINKS[self.file_format](stem)
+
+    def wait(self):
+        """Block until everything handed to the writer thread is on disk. Not for use from a plan."""
+        self._queue.join()
+
+    def start(self, doc):
+        self._start = doc
+        self._streams = {}
+        self._buffers = {}
+        self._last_flush = time.monotonic()
+        fields = dict(doc)
+        fields.setdefault("scan_id", 0)
+        stem = self.directory / self.file_prefix.format(**fields)
+        self.paths.append(stem.with_suffix(SINKS[self.file_format].suffix))
+        # Opening, and with it any directory creation, happens on the writer thread as well
+        self._sink = _PendingSink()
+        self._submit(self._sink.resolve, self._open, stem)
+
+    def descriptor(self, doc):
+        self._streams[doc["uid"]] = doc["name"]
+
+    def event(self, doc):
+        stream = self._streams.get(doc["descriptor"])
+        if stream is None or self._sink is None:
+            return
+        buffer = self._buffers.setdefault(stream, _ColumnBuffer(self.chunk_size))
+        row = dict(doc["data"])
+        row["time"] = doc["time"]
+        row["seq_num"] = doc["seq_num"]
+        buffer.append(row)
+        if buffer.full:
+            self._flush(stream)
+        self._maybe_flush()
+
+    def event_page(self, doc):
+        stream = self._streams.get(doc["descriptor"])
+        if stream is None or self._sink is None:
+            return
+        # Pages are already columnar, so they go to the writer as they are, after anything buffered before them
+        self._flush(stream)
+        columns = {key: np.asarray(values) for key, values in doc["data"].items()}
+        columns["time"] = np.asarray(doc["time"])
+        columns["seq_num"] = np.asarray(doc["seq_num"])
+        self._submit(self._sink.write, stream, columns)
+        self._maybe_flush()
+
+    def _flush(self, stream):
+        columns = self._buffers[stream].take() if stream in self._buffers else None
+        if columns is not None:
+            self._submit(self._sink.write, stream, columns)
+
+    def _maybe_flush(self):
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            for stream in self._buffers:
+                self._flush(stream)
+            self._last_flush = time.monotonic()
+
+    def stop(self, doc):
+        if self._sink is None:
+            return
+        for stream in self._buffers:
+            self._flush(stream)
+        self._submit(self._sink.close, self._start, doc)
+        self._sink = None
+        self._buffers = {}
+
+
+def load_run(path):
+    """
+    Read back a run written by `ColumnarWriter` as ``{stream: {key: array}}``, plus its start and stop documents.
+
+    Parameters
+    ----------
+    path: str or Path
+        ``.npz`` or ``.h5`` file
+
+    Returns
+    -------
+    streams: dict
+    start: dict
+    stop: dict
+    """
+    path = Path(path)
+    streams = {}
+    if path.suffix == ".h5":
+        import h5py
+
+        with h5py.File(path, "r") as f:
+            for stream, group in f.items():
+                streams[stream] = {key: dataset[()] for key, dataset in group.items()}
+            return streams, json.loads(f.attrs["start"]), json.loads(f.attrs["stop"])
+    with np.load(path) as f:
+        for name in f.files:
+            if "/" in name:
+                stream, key = name.split("/", 1)
+                streams.setdefault(stream, {})[key] = f[name]
+        return streams, json.loads(f["start"][()]), json.loads(f["stop"][()])